@@ -0,0 +1,45 @@
+"""
+Measures the cardinality report of a registry with many series,
+compared to rendering the same registry for a scrape,
+and to only collecting it, which both of them start with.
+
+Usage: python benchmarks/cardinality.py [series]
+"""
+
+import sys
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+
+from prometheus_flask_exporter.cardinality import CardinalityExplorer
+
+
+def main(series):
+    registry = CollectorRegistry()
+    counter = Counter('requests', 'Requests', ('method', 'path', 'status'), registry=registry)
+    histogram = Histogram('latency', 'Latency', ('method', 'path'), registry=registry)
+
+    for idx in range(series):
+        counter.labels('GET', '/item/%d' % (idx % (series // 10 or 1)), str(200 + idx % 10)).inc()
+        histogram.labels('GET', '/item/%d' % idx).observe(0.1)
+
+    started = time.time()
+    size = len(generate_latest(registry))
+    print('scrape:      %7.1f ms (%.1f MB)' % ((time.time() - started) * 1e3, size / 1e6))
+
+    started = time.time()
+    list(registry.collect())
+    print('collect:     %7.1f ms' % ((time.time() - started) * 1e3))
+
+    explorer = CardinalityExplorer()
+
+    for _ in range(2):
+        started = time.time()
+        report = explorer.explore(registry)
+        print('cardinality: %7.1f ms for %d series' % (
+            (time.time() - started) * 1e3, report['series']
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
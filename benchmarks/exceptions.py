@@ -0,0 +1,71 @@
+"""
+Measures the latency of requests to views raising an exception,
+with 1 to 4 stacked metrics decorators, with and without an error handler.
+
+Usage: python benchmarks/exceptions.py [requests]
+"""
+
+import sys
+import timeit
+
+from flask import Flask
+from prometheus_client import CollectorRegistry
+
+from prometheus_flask_exporter import PrometheusMetrics
+
+
+class HandledError(Exception):
+    pass
+
+
+class UnhandledError(Exception):
+    pass
+
+
+def create_app(decorators):
+    app = Flask(__name__)
+    app.logger.disabled = True  # don't log each unhandled exception
+
+    metrics = PrometheusMetrics(app, registry=CollectorRegistry(), export_defaults=False)
+
+    @app.errorhandler(HandledError)
+    def handle_error(e):
+        return 'Handled', 400
+
+    for path, error in (('/handled', HandledError), ('/unhandled', UnhandledError)):
+        def view(error=error):
+            raise error('failed')
+
+        for idx in range(decorators):
+            view = metrics.counter(
+                'errors_%s_%d' % (path[1:], idx), 'Errors',
+                labels={'status': lambda r: r.status_code}
+            )(view)
+
+        app.add_url_rule(path, path[1:], view)
+
+    return app
+
+
+def measure(app, path, requests):
+    client = app.test_client()
+
+    def run():
+        for _ in range(requests):
+            client.get(path)
+
+    run()  # warm up
+    return min(timeit.repeat(run, number=1, repeat=3)) / requests * 1e6
+
+
+def main(requests):
+    for decorators in range(1, 5):
+        app = create_app(decorators)
+
+        print('%d decorator(s): handled %8.1f us, unhandled %8.1f us per request' % (
+            decorators, measure(app, '/handled', requests), measure(app, '/unhandled', requests)
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
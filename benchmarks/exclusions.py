@@ -0,0 +1,73 @@
+"""
+Compares the compiled path exclusion matcher with checking
+the rules one by one, using 1000 exclusion rules.
+
+Usage: python benchmarks/exclusions.py [rules]
+"""
+
+import fnmatch
+import random
+import re
+import sys
+import timeit
+
+from prometheus_flask_exporter import _compile_path_matcher
+
+
+def generate_rules(count):
+    random.seed(42)
+    rules = []
+
+    for idx in range(count):
+        kind = idx % 10
+        if kind < 8:
+            rules.append('/service-%d/internal/%d' % (random.randint(0, 50), idx))
+        elif kind == 8:
+            rules.append('/static-%d/*.css' % idx)
+        else:
+            rules.append(re.compile(r'/debug-%d/\d+$' % idx))
+
+    return rules
+
+
+def naive_matcher(rules):
+    def matches(path):
+        for rule in rules:
+            if hasattr(rule, 'pattern'):
+                if rule.match(path):
+                    return True
+            elif any(char in rule for char in '*?['):
+                if fnmatch.fnmatch(path, rule):
+                    return True
+            elif path.startswith(rule):
+                return True
+
+        return False
+
+    return matches
+
+
+def main(count):
+    rules = generate_rules(count)
+    paths = [
+        '/api/v1/items/%d' % idx for idx in range(50)
+    ] + [
+        rule + '/x' for rule in rules if isinstance(rule, str) and '*' not in rule
+    ][:50]
+
+    start = timeit.default_timer()
+    compiled = _compile_path_matcher(rules)
+    print('compile %d rules: %.2f ms' % (count, (timeit.default_timer() - start) * 1000))
+
+    for name, matcher in (('compiled', compiled), ('naive', naive_matcher(rules))):
+        def run():
+            for path in paths:
+                matcher(path)
+
+        rounds = 200 if name == 'compiled' else 5
+        elapsed = min(timeit.repeat(run, number=rounds, repeat=3))
+        print('%-8s %8.2f us per path' % (name, elapsed / rounds / len(paths) * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
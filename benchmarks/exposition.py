@@ -0,0 +1,79 @@
+"""
+Compares rendering a registry with many series with `generate_latest`
+and with the `StreamingRenderer`, by the peak memory allocated while
+rendering (measured with `tracemalloc`), and by the rendering time,
+for the first scrape and for the next ones using the cached labels.
+
+Usage: python benchmarks/exposition.py [series]
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+
+from prometheus_flask_exporter.exposition import StreamingRenderer
+
+
+def create_registry(series):
+    registry = CollectorRegistry()
+    counter = Counter('requests', 'Requests', ('method', 'path', 'status'), registry=registry)
+    histogram = Histogram('latency', 'Latency', ('method', 'path'), registry=registry)
+
+    for idx in range(series // 20):
+        # about 20 series for each path, with the buckets and the _created samples
+        counter.labels('GET', '/item/%d' % idx, '200').inc()
+        histogram.labels('GET', '/item/%d' % idx).observe(0.1)
+
+    return registry
+
+
+def consume(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)  # as if written to the socket
+    return size
+
+
+def measure(render):
+    tracemalloc.start()
+    size = render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    elapsed = min(timeit.repeat(render, number=1, repeat=3))
+
+    return size, peak, elapsed
+
+
+def main(series):
+    registry = create_registry(series)
+
+    for name, render in (
+            ('generate_latest', lambda: len(generate_latest(registry))),
+            ('streaming', lambda: consume(StreamingRenderer(label_cache=False).render(registry)))
+    ):
+        size, peak, elapsed = measure(render)
+
+        print('%-26s %6.1f MB output, %6.1f MB peak, %7.1f ms' % (
+            name + ':', size / 1e6, peak / 1e6, elapsed * 1e3
+        ))
+
+    # the cached labels stay allocated between the scrapes
+    renderer = StreamingRenderer()
+
+    tracemalloc.start()
+    consume(renderer.render(registry))
+    cached, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size, peak, elapsed = measure(lambda: consume(renderer.render(registry)))
+
+    print('%-26s %6.1f MB output, %6.1f MB peak, %7.1f ms (%.1f MB cached)' % (
+        'streaming with label cache:', size / 1e6, peak / 1e6, elapsed * 1e3, cached / 1e6
+    ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,60 @@
+"""
+Compares the observe cost and the memory use of each child
+of `FastHistogram` with the original `prometheus_client` Histogram,
+using fine-grained latency buckets.
+
+Usage: python benchmarks/histogram.py [buckets] [children]
+"""
+
+import random
+import sys
+import timeit
+import tracemalloc
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from prometheus_flask_exporter.histogram import FastHistogram
+
+
+def main(bucket_count, children):
+    buckets = tuple(0.0005 * 1.25 ** idx for idx in range(bucket_count))
+    print('%d buckets, up to %.1f seconds' % (len(buckets), buckets[-1]))
+
+    random.seed(42)
+    values = [random.lognormvariate(-3, 1.5) for _ in range(100000)]
+
+    for histogram_type in (Histogram, FastHistogram):
+        child = histogram_type(
+            'latency', 'Latency', ('path',), buckets=buckets, registry=CollectorRegistry()
+        ).labels('/')
+
+        def run():
+            for value in values:
+                child.observe(value)
+
+        elapsed = min(timeit.repeat(run, number=1, repeat=5))
+        print('%-13s observe: %6.3f us' % (histogram_type.__name__, elapsed / len(values) * 1e6))
+
+    for histogram_type in (Histogram, FastHistogram):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        histogram = histogram_type(
+            'latency', 'Latency', ('path',), buckets=buckets, registry=CollectorRegistry()
+        )
+        for idx in range(children):
+            histogram.labels('/%d' % idx).observe(0.1)
+
+        used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+
+        print('%-13s memory: %6.0f bytes per child (%d children)' % (
+            histogram_type.__name__, float(used) / children, children
+        ))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 40,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    )
@@ -0,0 +1,69 @@
+"""
+Compares an application with 2000 views, each decorated with its own
+histogram, to the same views instrumented with a single policy,
+by the startup time, the number of metric families, the time of
+the requests and the scrape time.
+
+Usage: python benchmarks/instrument.py [views] [requests]
+"""
+
+import sys
+import time
+import timeit
+
+from flask import Flask
+from prometheus_client import CollectorRegistry, generate_latest
+
+from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.instrument import InstrumentationPolicy
+
+
+def create_app(views, instrument):
+    app = Flask(__name__)
+    metrics = PrometheusMetrics(app, registry=CollectorRegistry(), export_defaults=False)
+
+    for idx in range(views):
+        view = lambda: 'OK'  # noqa: E731
+
+        if not instrument:
+            view = metrics.histogram(
+                'view_%d_latency' % idx, 'Latency of view %d' % idx,
+                labels={'status': lambda r: r.status_code}
+            )(view)
+
+        app.add_url_rule('/view/%d' % idx, 'view_%d' % idx, view)
+
+    if instrument:
+        metrics.instrument(app, InstrumentationPolicy(
+            labels={'status': lambda r: r.status_code}
+        ))
+
+    return app, metrics
+
+
+def main(views, requests):
+    for instrument in (False, True):
+        startup = min(timeit.repeat(lambda: create_app(views, instrument), number=1, repeat=3))
+
+        app, metrics = create_app(views, instrument)
+        client = app.test_client()
+
+        started = time.time()
+        for idx in range(requests):
+            client.get('/view/%d' % (idx % views))
+        elapsed = time.time() - started
+
+        families = len(list(metrics.registry.collect()))
+        scrape = min(timeit.repeat(lambda: generate_latest(metrics.registry), number=3, repeat=3)) / 3
+
+        print('%-10s startup: %7.1f ms, %4d families, %5.0f us per request, scrape: %7.1f ms' % (
+            'instrument' if instrument else 'decorators', startup * 1e3, families,
+            elapsed / requests * 1e6, scrape * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    )
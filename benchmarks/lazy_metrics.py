@@ -0,0 +1,55 @@
+"""
+Compares the startup and scrape times of an application with
+2000 decorated views, when the metrics of the decorators are created
+when decorating the views, or lazily on their first invocation.
+
+Usage: python benchmarks/lazy_metrics.py [views] [used_views]
+"""
+
+import sys
+import timeit
+
+from flask import Flask
+from prometheus_client import CollectorRegistry, generate_latest
+
+from prometheus_flask_exporter import PrometheusMetrics
+
+
+def create_app(views, lazy_metrics):
+    app = Flask(__name__)
+    metrics = PrometheusMetrics(
+        app, registry=CollectorRegistry(), export_defaults=False, lazy_metrics=lazy_metrics
+    )
+
+    for idx in range(views):
+        view = metrics.histogram(
+            'view_%d_latency' % idx, 'Latency of view %d' % idx,
+            labels={'status': lambda r: r.status_code}
+        )(lambda: 'OK')
+
+        app.add_url_rule('/view/%d' % idx, 'view_%d' % idx, view)
+
+    return app, metrics
+
+
+def main(views, used_views):
+    for lazy_metrics in (False, True):
+        startup = min(timeit.repeat(lambda: create_app(views, lazy_metrics), number=1, repeat=3))
+
+        app, metrics = create_app(views, lazy_metrics)
+        client = app.test_client()
+        for idx in range(used_views):
+            client.get('/view/%d' % idx)
+
+        scrape = min(timeit.repeat(lambda: generate_latest(metrics.registry), number=5, repeat=3)) / 5
+
+        print('lazy_metrics=%-5s startup: %7.1f ms, scrape with %d of %d views used: %7.2f ms' % (
+            lazy_metrics, startup * 1e3, used_views, views, scrape * 1e3
+        ))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    )
@@ -0,0 +1,67 @@
+"""
+Measures saving and restoring the values of the default metrics
+with 100k series, and the size of the state file.
+Restoring includes creating the children of the default metrics
+for each series, decoding the file is measured separately.
+
+Usage: python benchmarks/persistence.py [series]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from flask import Flask
+from prometheus_client import CollectorRegistry
+
+from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.persistence import PersistentState, decode
+
+
+def create(filename, **kwargs):
+    app = Flask(__name__)
+    state = PersistentState(filename, interval=None)
+
+    started = time.time()
+    PrometheusMetrics(app, registry=CollectorRegistry(), persistent_state=state, **kwargs)
+    elapsed = time.time() - started
+
+    state.stop()
+    return state, elapsed
+
+
+def main(series):
+    filename = os.path.join(tempfile.mkdtemp(), 'metrics.state')
+    state, _ = create(filename)
+
+    table = state._series_table
+    for idx in range(series):
+        entry = table.get('GET', '/item/%d' % idx, 200)
+        entry.counter.inc()
+        entry.histogram.observe(0.01)
+
+    started = time.time()
+    state.save()
+    print('save:    %7.1f ms for %d series, %.1f MB' % (
+        (time.time() - started) * 1e3, series, os.path.getsize(filename) / 1e6
+    ))
+
+    with open(filename, 'rb') as source:
+        data = source.read()
+
+    started = time.time()
+    decode(data)
+    print('decode:  %7.1f ms for %d series' % ((time.time() - started) * 1e3, series))
+
+    _, elapsed = create(filename)
+    print('restore: %7.1f ms for %d series' % (elapsed * 1e3, series))
+
+    _, elapsed = create(filename, fast_histograms=True)
+    print('restore: %7.1f ms for %d series with fast_histograms=True' % (elapsed * 1e3, series))
+
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
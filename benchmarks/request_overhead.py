@@ -0,0 +1,88 @@
+"""
+Measures the per-request overhead of the default metrics
+by calling the Flask test client with and without them.
+
+Usage: python benchmarks/request_overhead.py [requests] [routes]
+"""
+
+import sys
+import timeit
+
+from flask import Flask, request
+from prometheus_client import CollectorRegistry
+
+from prometheus_flask_exporter import PrometheusMetrics, _now_ns
+from prometheus_flask_exporter.governor import OverloadGovernor, FULL, SAMPLED, COUNTERS_ONLY
+
+
+def create_app(routes, **kwargs):
+    app = Flask(__name__)
+
+    if kwargs:
+        PrometheusMetrics(app, registry=CollectorRegistry(), **kwargs)
+
+    for idx in range(routes):
+        app.add_url_rule('/route/%d' % idx, 'route_%d' % idx, lambda: 'OK')
+
+    return app
+
+
+def measure(app, requests, routes):
+    client = app.test_client()
+    paths = ['/route/%d' % (idx % routes) for idx in range(requests)]
+
+    def run():
+        for path in paths:
+            client.get(path)
+
+    run()  # warm up
+    return min(timeit.repeat(run, number=1, repeat=3)) / requests * 1e6
+
+
+def measure_timing_path(rounds=200000):
+    app = Flask(__name__)
+
+    def float_timer():
+        request.prom_start_time = timeit.default_timer()
+        return max(timeit.default_timer() - request.prom_start_time, 0)
+
+    def integer_timer():
+        request.environ['start_time'] = _now_ns()
+        return (_now_ns() - request.environ['start_time']) / 1e9
+
+    with app.test_request_context('/'):
+        for name, func in (('float timer on request attribute', float_timer),
+                           ('integer timer in WSGI environ', integer_timer)):
+            elapsed = min(timeit.repeat(func, number=rounds, repeat=3))
+            print('%-40s %8.3f us per request' % (name, elapsed / rounds * 1e6))
+
+
+def main(requests, routes):
+    measure_timing_path()
+
+    baseline = measure(create_app(routes), requests, routes)
+    print('%-40s %8.1f us per request' % ('without metrics', baseline))
+
+    for name, kwargs in (
+            ('export_defaults=True', dict(export_defaults=True)),
+            ('export_defaults=False', dict(export_defaults=False)),
+    ):
+        elapsed = measure(create_app(routes, **kwargs), requests, routes)
+        print('%-40s %8.1f us per request (+%.1f us)' % (name, elapsed, elapsed - baseline))
+
+    for name, level in (('governor at full level', FULL),
+                        ('governor at sampled level', SAMPLED),
+                        ('governor at counters only level', COUNTERS_ONLY)):
+        # the window is never over, so the level stays the same
+        governor = OverloadGovernor(window=3600)
+        governor.level = level
+
+        elapsed = measure(create_app(routes, governor=governor), requests, routes)
+        print('%-40s %8.1f us per request (+%.1f us)' % (name, elapsed, elapsed - baseline))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    )
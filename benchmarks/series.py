@@ -0,0 +1,53 @@
+"""
+Measures the time per request and the memory used per series of the
+default metrics, for up to 100k distinct paths with `group_by='path'`.
+
+Usage: python benchmarks/series.py [series]
+"""
+
+import sys
+import time
+
+from flask import Flask
+from prometheus_client import CollectorRegistry
+
+from prometheus_flask_exporter import PrometheusMetrics
+
+
+def rss_bytes():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+
+def main(series):
+    app = Flask(__name__)
+    PrometheusMetrics(app, registry=CollectorRegistry())
+
+    @app.route('/item/<int:item>')
+    def item(item):
+        return 'OK'
+
+    checkpoints = sorted(set([1000, 10000, series]))
+    created, rss_before = 0, rss_bytes()
+
+    for checkpoint in checkpoints:
+        started = time.time()
+
+        for idx in range(created, checkpoint):
+            with app.test_request_context('/item/%d' % idx):
+                app.preprocess_request()
+                app.process_response(app.make_response('OK'))
+
+        elapsed = time.time() - started
+        requests = checkpoint - created
+        created = checkpoint
+
+        print('%7d series: %6.1f us per request, %6.0f bytes of RSS per series' % (
+            checkpoint, elapsed / requests * 1e6, (rss_bytes() - rss_before) / float(checkpoint)
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
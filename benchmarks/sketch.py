@@ -0,0 +1,62 @@
+"""
+Compares the insert cost and memory use of the `Sketch` metric
+with a `prometheus_client` Histogram with 30 buckets.
+
+Usage: python benchmarks/sketch.py [observations] [series]
+"""
+
+import random
+import sys
+import timeit
+import tracemalloc
+
+from prometheus_client import CollectorRegistry, Histogram
+
+from prometheus_flask_exporter.sketch import Sketch
+
+BUCKETS = tuple(0.001 * 1.4 ** idx for idx in range(30))
+
+
+def create(kind, registry):
+    if kind == 'histogram':
+        return Histogram('latency', 'Latency', ('series',), registry=registry, buckets=BUCKETS)
+    else:
+        return Sketch('latency', 'Latency', ('series',), registry=registry)
+
+
+def main(observations, series):
+    random.seed(42)
+    values = [random.lognormvariate(-4, 1) for _ in range(observations)]
+
+    for kind in ('histogram', 'sketch'):
+        metric = create(kind, CollectorRegistry())
+        child = metric.labels('x')
+
+        def run():
+            for value in values:
+                child.observe(value)
+
+        elapsed = min(timeit.repeat(run, number=1, repeat=5))
+        print('%-9s observe: %6.3f us' % (kind, elapsed / observations * 1e6))
+
+    for kind in ('histogram', 'sketch'):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        metric = create(kind, CollectorRegistry())
+        for idx in range(series):
+            child = metric.labels(str(idx))
+            for value in values[:200]:
+                child.observe(value)
+
+        used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+
+        print('%-9s memory: %6.0f bytes per series (%d series)' % (kind, float(used) / series, series))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    )
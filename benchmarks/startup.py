@@ -0,0 +1,79 @@
+"""
+Measures the import time of the exporter with `python -X importtime`
+and the time to set up an application plus serve its first request,
+with the default metrics created eagerly or lazily.
+
+Usage: python benchmarks/startup.py [rounds]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = '''
+import timeit
+start = timeit.default_timer()
+
+from flask import Flask
+from prometheus_flask_exporter import PrometheusMetrics
+
+app = Flask(__name__)
+metrics = PrometheusMetrics(app, lazy_defaults=%s)
+
+@app.route('/')
+def index():
+    return 'OK'
+
+setup_done = timeit.default_timer()
+app.test_client().get('/')
+print('%%f %%f' %% (setup_done - start, timeit.default_timer() - setup_done))
+'''
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.Popen(
+        (sys.executable,) + args, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    out, err = process.communicate()
+    return out.decode('utf-8'), err.decode('utf-8')
+
+
+def import_time_us(module):
+    _, err = run_python('-X', 'importtime', '-c', 'import %s' % module)
+
+    for line in err.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(rounds):
+    for module in ('flask', 'prometheus_client', 'prometheus_flask_exporter'):
+        timings = [import_time_us(module) for _ in range(rounds)]
+        print('import %-28s %8.2f ms (cumulative, median)' % (module, median(timings) / 1000.0))
+
+    for lazy in (False, True):
+        setup, first = [], []
+
+        for _ in range(rounds):
+            out, _ = run_python('-c', FIRST_REQUEST % lazy)
+            values = out.split()
+            setup.append(float(values[0]))
+            first.append(float(values[1]))
+
+        print('lazy_defaults=%-5s setup %8.2f ms, first request %6.2f ms (median)' % (
+            lazy, median(setup) * 1000, median(first) * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
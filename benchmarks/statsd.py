@@ -0,0 +1,108 @@
+"""
+Measures the throughput of requests sending the default metrics
+to a local UDP listener with the `StatsdExporter`, compared to the
+requests without it, and the number of datagrams the metrics
+were packed into.
+
+Usage: python benchmarks/statsd.py [requests] [paths]
+"""
+
+import sys
+import time
+import socket
+import threading
+
+from flask import Flask
+from prometheus_client import CollectorRegistry
+
+from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.statsd import StatsdExporter
+
+
+def listen():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+    received = {'packets': 0, 'lines': 0}
+
+    def run():
+        while True:
+            packet = listener.recv(65536)
+            if packet == b'stop':
+                break
+
+            received['packets'] += 1
+            received['lines'] += packet.count(b'\n') + 1
+
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    return listener, thread, received
+
+
+def run(requests, paths, statsd=None):
+    app = Flask(__name__)
+    app.logger.disabled = True
+
+    PrometheusMetrics(app, registry=CollectorRegistry(), statsd=statsd)
+
+    @app.route('/item/<idx>')
+    def item(idx):
+        return 'OK'
+
+    client = app.test_client()
+
+    started = time.time()
+    for idx in range(requests):
+        client.get('/item/%d' % (idx % paths))
+
+    return time.time() - started
+
+
+def main(requests, paths):
+    run(requests // 10, paths)  # warm up
+
+    baseline = run(requests, paths)
+    print('without statsd: %7.0f requests/s' % (requests / baseline))
+
+    listener, thread, received = listen()
+    statsd = StatsdExporter(*listener.getsockname(), flush_interval=0.5)
+
+    elapsed = run(requests, paths, statsd)
+    statsd.stop()
+
+    print('with statsd:    %7.0f requests/s (%.1f us overhead per request)' % (
+        requests / elapsed, (elapsed - baseline) / requests * 1e6
+    ))
+
+    started = time.time()
+    for idx in range(requests):
+        statsd.timing('latency', 0.01, (('path', '/item/%d' % (idx % paths)),))
+        statsd.increment('requests', (('path', '/item/%d' % (idx % paths)),))
+    recorded = time.time() - started
+
+    # the timings of each path are sampled down to `max_timings`
+    lines = paths + sum(len(values) for _, values in statsd._timings.values())
+
+    started = time.time()
+    statsd.flush()
+    flushed = time.time() - started
+
+    print('recording:      %7.0f metrics/s' % (2 * requests / recorded))
+    print('flushing:       %7.0f lines/s (%d lines)' % (lines / flushed, lines))
+
+    time.sleep(0.5)
+    listener.sendto(b'stop', listener.getsockname())
+    thread.join()
+
+    print('received:       %d lines in %d datagrams (%.1f lines per datagram)' % (
+        received['lines'], received['packets'], received['lines'] / max(received['packets'], 1)
+    ))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    )
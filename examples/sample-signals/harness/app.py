@@ -0,0 +1,68 @@
+"""
+The application driven by the load harness.
+
+It is configured with environment variables:
+
+- `HARNESS_ROUTES`: the number of routes to register (default: 20)
+- `HARNESS_EXPORT_DEFAULTS`: `1` to export the default metrics, `0` otherwise
+- `HARNESS_GROUP_BY`: the `group_by` setting of the default metrics
+- `HARNESS_DELAY`: the number of seconds each request sleeps for (default: 0)
+- `HARNESS_SCRAPE_SNAPSHOT`: the `snapshot_interval` of the multiprocess
+  metrics endpoint, in seconds (disabled by default)
+
+With the `prometheus_multiproc_dir` environment variable set, it uses the
+multiprocess metrics, with the endpoint served by the application itself,
+which works for any pre-forking server, like Gunicorn or uWSGI.
+"""
+
+import os
+import time
+
+from flask import Flask
+
+app = Flask(__name__)
+
+routes = int(os.environ.get('HARNESS_ROUTES', '20'))
+export_defaults = os.environ.get('HARNESS_EXPORT_DEFAULTS', '1') == '1'
+group_by = os.environ.get('HARNESS_GROUP_BY', 'path')
+delay = float(os.environ.get('HARNESS_DELAY', '0'))
+snapshot_interval = float(os.environ.get('HARNESS_SCRAPE_SNAPSHOT', '0')) or None
+
+if os.environ.get('prometheus_multiproc_dir'):
+    from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
+
+    metrics = GunicornInternalPrometheusMetrics(
+        app, export_defaults=export_defaults, group_by=group_by,
+        snapshot_interval=snapshot_interval
+    )
+
+else:
+    from prometheus_flask_exporter import PrometheusMetrics
+
+    metrics = PrometheusMetrics(app, export_defaults=export_defaults, group_by=group_by)
+
+
+@app.route('/ready')
+@metrics.do_not_track()
+def ready():
+    return 'OK'
+
+
+def create_view(index):
+    def view(item):
+        if delay:
+            time.sleep(delay)
+
+        return 'route %d, item %d' % (index, item)
+
+    return view
+
+
+for route in range(routes):
+    app.add_url_rule(
+        '/route/%d/<int:item>' % route, 'route_%d' % route, create_view(route)
+    )
+
+
+if __name__ == '__main__':
+    app.run('127.0.0.1', int(os.environ.get('HARNESS_PORT', '5000')), threaded=True)
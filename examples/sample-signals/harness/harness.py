@@ -0,0 +1,393 @@
+"""
+An offline load generation and scaling harness for the exporter.
+
+It starts the harness application under different servers, with and without
+the default metrics, sends requests from concurrent clients for a while,
+and reports the throughput and latencies, the scrape latencies
+while the workers are busy and after the load, plus the memory growth
+of the server processes, as JSON.
+
+Usage:
+
+    python harness.py --servers werkzeug,gunicorn-sync,gunicorn-gthread,uwsgi \\
+        --routes 20 --items 50 --concurrency 8 --duration 10 --output report.json
+
+Servers that are not installed are skipped. The memory usage is only
+measured on Linux, where the `/proc` filesystem is available.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # Python 2
+    from httplib import HTTPConnection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, '..', '..', '..'))
+
+
+def which(command):
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        candidate = os.path.join(directory, command)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def server_command(server, port, workers, threads):
+    address = '127.0.0.1:%d' % port
+
+    if server == 'werkzeug':
+        return [sys.executable, os.path.join(HERE, 'app.py')]
+
+    if server in ('gunicorn-sync', 'gunicorn-gthread'):
+        if not which('gunicorn'):
+            return None
+
+        command = ['gunicorn', '--chdir', HERE, '--bind', address, '--workers', str(workers)]
+        if server == 'gunicorn-gthread':
+            command += ['--worker-class', 'gthread', '--threads', str(threads)]
+
+        return command + ['app:app']
+
+    if server == 'uwsgi':
+        if not which('uwsgi'):
+            return None
+
+        return [
+            'uwsgi', '--http', address, '--chdir', HERE, '--module', 'app:app',
+            '--master', '--processes', str(workers), '--threads', str(threads),
+            '--die-on-term', '--disable-logging'
+        ]
+
+    raise ValueError('Unknown server: %s' % server)
+
+
+class Server(object):
+    def __init__(self, server, export_defaults, options):
+        self.server = server
+        self.port = free_port()
+        self.multiproc_dir = None
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+        env['HARNESS_PORT'] = str(self.port)
+        env['HARNESS_ROUTES'] = str(options.routes)
+        env['HARNESS_EXPORT_DEFAULTS'] = '1' if export_defaults else '0'
+        env['HARNESS_GROUP_BY'] = options.group_by
+        env['HARNESS_DELAY'] = str(options.delay)
+        env['HARNESS_SCRAPE_SNAPSHOT'] = str(options.scrape_snapshot)
+
+        if server != 'werkzeug':
+            self.multiproc_dir = tempfile.mkdtemp(prefix='harness-metrics-')
+            env['prometheus_multiproc_dir'] = self.multiproc_dir
+
+        self.command = server_command(server, self.port, options.workers, options.threads)
+        self.env = env
+        self.process = None
+
+    def start(self, timeout=30):
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(
+                self.command, env=self.env, stdout=devnull, stderr=devnull
+            )
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                status, _, _ = request(self.port, '/ready')
+                if status == 200:
+                    return
+            except (IOError, OSError):
+                pass
+
+            time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError('The %s server did not start in time' % self.server)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+            try:
+                self.process.wait(timeout=10)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+
+        if self.multiproc_dir:
+            shutil.rmtree(self.multiproc_dir, ignore_errors=True)
+
+    def rss_bytes(self):
+        """
+        The resident memory of the server process and all its children,
+        or `None` where `/proc` is not available.
+        """
+
+        if not os.path.isdir('/proc/%d' % self.process.pid):
+            return None
+
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+
+            try:
+                with open('/proc/%s/stat' % entry) as stat:
+                    # the command name may contain spaces, the fields after it don't
+                    fields = stat.read().rsplit(')', 1)[1].split()
+                parents.setdefault(int(fields[1]), []).append(int(entry))
+            except (IOError, OSError, IndexError):
+                continue
+
+        total, pending = 0, [self.process.pid]
+        while pending:
+            pid = pending.pop()
+            pending.extend(parents.get(pid, []))
+
+            try:
+                with open('/proc/%d/status' % pid) as status:
+                    for line in status:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+            except (IOError, OSError):
+                continue
+
+        return total
+
+
+def request(port, path, connection=None):
+    own_connection = connection is None
+    if own_connection:
+        connection = HTTPConnection('127.0.0.1', port, timeout=10)
+
+    try:
+        start = time.time()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read()
+        return response.status, len(body), time.time() - start
+
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def percentile(values, q):
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def generate_load(port, options):
+    """
+    Send requests from concurrent clients for the configured duration,
+    spreading them over `routes * items` distinct paths,
+    while scraping the metrics endpoint once a second.
+    """
+
+    deadline = time.time() + options.duration
+    latencies, errors = [], [0]
+    scrapes, scrape_failures = [], [0]
+    lock = threading.Lock()
+
+    def scraper():
+        while time.time() < deadline:
+            started = time.time()
+
+            try:
+                status, _, elapsed = request(port, '/metrics')
+                if status == 200:
+                    scrapes.append(elapsed)
+                else:
+                    scrape_failures[0] += 1
+
+            except (IOError, OSError):
+                scrape_failures[0] += 1
+
+            time.sleep(max(1.0 - (time.time() - started), 0))
+
+    def client(seed):
+        rnd = random.Random(seed)
+        connection = HTTPConnection('127.0.0.1', port, timeout=10)
+        own_latencies, own_errors = [], 0
+
+        while time.time() < deadline:
+            path = '/route/%d/%d' % (rnd.randrange(options.routes), rnd.randrange(options.items))
+
+            try:
+                status, _, elapsed = request(port, path, connection)
+                own_latencies.append(elapsed)
+                if status != 200:
+                    own_errors += 1
+
+            except (IOError, OSError):
+                own_errors += 1
+                connection.close()
+                connection = HTTPConnection('127.0.0.1', port, timeout=10)
+
+        connection.close()
+
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    threads = [
+        threading.Thread(target=client, args=(idx,)) for idx in range(options.concurrency)
+    ]
+    threads.append(threading.Thread(target=scraper))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': len(latencies) / float(options.duration),
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'scrapes_under_load': len(scrapes),
+        'scrape_failures_under_load': scrape_failures[0],
+        'scrape_under_load_p50_ms': percentile(scrapes, 0.5) * 1000 if scrapes else None,
+        'scrape_under_load_max_ms': max(scrapes) * 1000 if scrapes else None
+    }
+
+
+def measure_scrapes(port, count):
+    latencies, sizes = [], []
+
+    for _ in range(count):
+        status, size, elapsed = request(port, '/metrics')
+        if status == 200:
+            latencies.append(elapsed)
+            sizes.append(size)
+
+    return {
+        'scrapes': len(latencies),
+        'scrape_p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'scrape_max_ms': max(latencies) * 1000 if latencies else None,
+        'scrape_bytes': max(sizes) if sizes else None
+    }
+
+
+def run(server_name, export_defaults, options):
+    server = Server(server_name, export_defaults, options)
+    if server.command is None:
+        return None
+
+    server.start()
+
+    try:
+        # warm up, so the memory growth is not about loading the code
+        for idx in range(options.routes):
+            request(server.port, '/route/%d/0' % idx)
+
+        rss_before = server.rss_bytes()
+
+        result = {'server': server_name, 'export_defaults': export_defaults}
+        result.update(generate_load(server.port, options))
+        result.update(measure_scrapes(server.port, options.scrapes))
+
+        rss_after = server.rss_bytes()
+        result['rss_before_bytes'] = rss_before
+        result['rss_after_bytes'] = rss_after
+        result['rss_growth_bytes'] = (
+            rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        )
+
+        return result
+
+    finally:
+        server.stop()
+
+
+def overhead(instrumented, baseline):
+    def relative(key):
+        if instrumented.get(key) and baseline.get(key):
+            return instrumented[key] / baseline[key] - 1
+
+    return {
+        'throughput_change': relative('requests_per_second'),
+        'latency_p50_change': relative('latency_p50_ms'),
+        'latency_p99_change': relative('latency_p99_ms')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--servers', default='werkzeug,gunicorn-sync,gunicorn-gthread,uwsgi')
+    parser.add_argument('--routes', type=int, default=20, help='number of routes')
+    parser.add_argument('--items', type=int, default=50,
+                        help='number of distinct paths per route (label cardinality)')
+    parser.add_argument('--group-by', default='path', help='group_by of the default metrics')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per run')
+    parser.add_argument('--delay', type=float, default=0, help='seconds each request sleeps')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--scrapes', type=int, default=20,
+                        help='number of scrapes to time after the load')
+    parser.add_argument('--scrape-snapshot', type=float, default=0,
+                        help='serve the multiprocess metrics from a snapshot '
+                             'refreshed every this many seconds (disabled with 0)')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    options = parser.parse_args()
+
+    report = {
+        'options': vars(options),
+        'python': sys.version.split()[0],
+        'runs': [], 'overhead': {}, 'skipped': []
+    }
+
+    for server_name in options.servers.split(','):
+        results = {}
+
+        for export_defaults in (False, True):
+            result = run(server_name, export_defaults, options)
+            if result is None:
+                break
+
+            results[export_defaults] = result
+            report['runs'].append(result)
+
+        if not results:
+            report['skipped'].append(server_name)
+            continue
+
+        report['overhead'][server_name] = overhead(results[True], results[False])
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+
+    if options.output:
+        with open(options.output, 'w') as target:
+            target.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,56 @@
 import os
+import re
+import json
+import time
+import fnmatch
 import inspect
 import warnings
 import functools
 import threading
-from timeit import default_timer
 
-from flask import request, make_response, current_app
-from flask import Flask, Response
-from werkzeug.serving import is_running_from_reloader
-from prometheus_client import Counter, Histogram, Gauge, Summary
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from flask import request, make_response, current_app, has_request_context
+from flask import Flask, Response, Blueprint
+
+# `prometheus_client` and the Werkzeug reloader helpers are imported
+# where they are used, so that importing this module stays cheap
+
+try:
+    from time import perf_counter_ns as _now_ns
+except ImportError:  # Python < 3.7
+    from timeit import default_timer as _default_timer
+
+    def _now_ns():
+        return int(_default_timer() * 1e9)
+
+_START_TIME_KEY = 'prometheus_flask_exporter.start_time'
+"""
+The key of the request start time in nanoseconds in the WSGI environment
+"""
+
+_IN_PROGRESS_KEY = 'prometheus_flask_exporter.in_progress'
+"""
+The key of the in progress Gauge of the request in the WSGI environment
+"""
+
+_UNHANDLED_EXCEPTION_KEY = 'prometheus_flask_exporter.unhandled_exception'
+"""
+The key of the exception in the WSGI environment that Flask found no error handler for
+"""
+
+_QUEUE_TIME_KEY = 'prometheus_flask_exporter.queue_time'
+"""
+The key of the time the request spent waiting in the queue in the WSGI environment
+"""
+
+_OPERATIONS_KEY = 'prometheus_flask_exporter.operations'
+"""
+The key of the total durations of the timed operations of the request in the WSGI environment
+"""
+
+_OVERHEAD_KEY = 'prometheus_flask_exporter.overhead'
+"""
+The key of the time spent in the `before_request` hook in nanoseconds in the WSGI environment
+"""
 
 NO_PREFIX = '#no_prefix'
 """
@@ -18,6 +59,13 @@ It purposely uses invalid characters defined for metrics names as specified in P
 documentation (see: https://prometheus.io/docs/concepts/data_model/#metric-names-and-labels)
 """
 
+STANDARD_METHODS = (
+    'GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'CONNECT', 'OPTIONS', 'TRACE', 'PATCH'
+)
+"""
+The HTTP methods kept as they are with `normalize_methods=True`
+"""
+
 
 class PrometheusMetrics(object):
     """
@@ -74,7 +122,16 @@ class PrometheusMetrics(object):
     def __init__(self, app, path='/metrics',
                  export_defaults=True, defaults_prefix='flask',
                  group_by='path', buckets=None,
-                 registry=None, **kwargs):
+                 registry=None, lazy_defaults=False,
+                 excluded_paths=None, track_in_progress=False,
+                 slow_requests=0, slow_requests_path='/metrics/slowest',
+                 duration_quantiles=None, fast_histograms=False,
+                 bucket_calibration=None, bucket_calibration_path='/metrics/buckets',
+                 lazy_metrics=False, path_normalizer=None,
+                 queue_time_header=None, persistent_state=None, statsd=None,
+                 cardinality_path=None, status_classes=False, exact_statuses=None,
+                 normalize_methods=False, warm_up_statuses=None, stream_metrics=False,
+                 governor=None, **kwargs):
         """
         Create a new Prometheus metrics export configuration.
 
@@ -92,6 +149,59 @@ class PrometheusMetrics(object):
         :param buckets: the time buckets for request latencies
             (will use the default when `None`)
         :param registry: the Prometheus Registry to use
+        :param lazy_defaults: create the default metrics on the first
+            request or the first scrape of the metrics endpoint,
+            rather than when they are exported
+        :param excluded_paths: request paths to skip the default metrics for,
+            as path prefixes, glob patterns or compiled regular expressions
+        :param track_in_progress: also export a Gauge with the number
+            of HTTP requests in progress
+        :param slow_requests: the number of the slowest requests
+            to keep track of (disabled when `0`)
+        :param slow_requests_path: the path to serve the slowest requests on
+            as JSON (defaults to `/metrics/slowest`, not registered when `None`)
+        :param duration_quantiles: also export the given quantiles of the
+            HTTP request latencies, estimated with a `Sketch` (optional)
+        :param fast_histograms: use the `FastHistogram` implementation for the
+            default request latencies and the `histogram` decorator
+        :param bucket_calibration: a `BucketCalibration` to record the request
+            latencies with and recommend latency buckets from (optional)
+        :param bucket_calibration_path: the path to serve the recommended
+            buckets on as JSON (defaults to `/metrics/buckets`,
+            not registered when `None`)
+        :param lazy_metrics: create the metrics of the decorators on the
+            first invocation of the decorated method, rather than when
+            decorating it, see `declare_metrics`
+        :param path_normalizer: a `PathNormalizer`, or the list of its rules,
+            to rewrite the request paths with for the default metrics,
+            when they are grouped by `path` (optional)
+        :param queue_time_header: the name of the header, or a list of them,
+            set by the load balancer or proxy to the time it received the request,
+            like `X-Request-Start`, to export the time requests spent waiting
+            before the application got to them (optional)
+        :param persistent_state: a `PersistentState` to save the values
+            of the default request Counter and latency Histogram with,
+            and restore them from on startup (optional)
+        :param statsd: a `StatsdExporter` to also send the default metrics
+            and the metrics of the decorators to a StatsD aggregator with (optional)
+        :param cardinality_path: the path to serve the number of series
+            of each metric and their most frequent label values on
+            as JSON (optional, see `register_cardinality_endpoint`)
+        :param status_classes: label the default metrics with the class
+            of the response status, like `2xx` or `4xx`, rather than the code
+        :param exact_statuses: the status codes to keep as they are
+            with `status_classes=True`, like `(404, 429)` (optional)
+        :param normalize_methods: label the default metrics with `other`
+            for the requests with non-standard HTTP methods
+        :param warm_up_statuses: the status codes to create the series
+            of the default metrics with for each URL rule upfront,
+            like `(200,)`, when grouped by `endpoint`, `url_rule`,
+            or `path` for the rules without variables (optional, see `warm_up`)
+        :param stream_metrics: render the metrics endpoint one metric family
+            at a time with a `StreamingRenderer`, in a streamed response,
+            rather than all at once
+        :param governor: an `OverloadGovernor` to record less of the default
+            metrics with while the application is overloaded (optional)
         """
 
         self.app = app
@@ -100,15 +210,52 @@ class PrometheusMetrics(object):
         self._defaults_prefix = defaults_prefix or 'flask'
         self.buckets = buckets
         self.version = __version__
+        self.registry = registry
+        self.lazy_defaults = lazy_defaults
+        self._deferred_metrics = []
+        self.excluded_paths = excluded_paths
+        self.track_in_progress = track_in_progress
+        self.slow_requests_path = slow_requests_path
+        self.duration_quantiles = duration_quantiles
+        self.fast_histograms = fast_histograms
+        self.bucket_calibration = bucket_calibration
+        self.bucket_calibration_path = bucket_calibration_path
+        self.lazy_metrics = lazy_metrics
+        self._lazy_metrics = []
+
+        if path_normalizer is not None and not callable(path_normalizer):
+            from .normalizer import PathNormalizer
+            path_normalizer = PathNormalizer(path_normalizer)
+
+        self.path_normalizer = path_normalizer
+        self.queue_time_header = queue_time_header
+        self.persistent_state = persistent_state
+        self.statsd = statsd
+        self.cardinality_path = cardinality_path
+        self.status_classes = status_classes
+        self.exact_statuses = exact_statuses
+        self.normalize_methods = normalize_methods
+        self.warm_up_statuses = warm_up_statuses
+        self.governor = governor
+        self._warm_ups = []
+        self._policy_metrics = {}
+
+        if stream_metrics:
+            from .exposition import StreamingRenderer
+            self.renderer = StreamingRenderer()
+        else:
+            self.renderer = None
+        self._operations = _Deferred(self._create_operations_histogram)
+
+        if bucket_calibration and bucket_calibration.apply and buckets is None:
+            # use the buckets recommended by a previous calibration
+            self.buckets = bucket_calibration.saved_buckets()
 
-        if registry:
-            self.registry = registry
+        if slow_requests:
+            from .slow_requests import SlowRequestsTracker
+            self.slow_requests = SlowRequestsTracker(slow_requests)
         else:
-            # load the default registry from the underlying
-            # Prometheus library here for easier unit testing
-            # see https://github.com/rycus86/prometheus_flask_exporter/pull/20
-            from prometheus_client import REGISTRY as DEFAULT_REGISTRY
-            self.registry = DEFAULT_REGISTRY
+            self.slow_requests = None
 
         if kwargs.get('group_by_endpoint') is True:
             warnings.warn(
@@ -128,6 +275,25 @@ class PrometheusMetrics(object):
         if app is not None:
             self.init_app(app)
 
+    @property
+    def registry(self):
+        """
+        The Prometheus Registry the metrics are registered with.
+        """
+
+        if self._registry is None:
+            # load the default registry from the underlying
+            # Prometheus library here for easier unit testing
+            # see https://github.com/rycus86/prometheus_flask_exporter/pull/20
+            from prometheus_client import REGISTRY as DEFAULT_REGISTRY
+            self._registry = DEFAULT_REGISTRY
+
+        return self._registry
+
+    @registry.setter
+    def registry(self, registry):
+        self._registry = registry
+
     def init_app(self, app):
         """
         This callback can be used to initialize an application for the
@@ -145,10 +311,36 @@ class PrometheusMetrics(object):
         if self.path:
             self.register_endpoint(self.path, app)
 
+        if self.slow_requests and self.slow_requests_path:
+            self.register_slow_requests_endpoint(self.slow_requests_path, app)
+
+        if self.cardinality_path:
+            self.register_cardinality_endpoint(self.cardinality_path, app)
+
+        if self.bucket_calibration:
+            self._register_bucket_calibration_command(app)
+
+            if self.bucket_calibration_path:
+                self.register_bucket_calibration_endpoint(self.bucket_calibration_path, app)
+
+        # observe the durations of the operations timed with `timer(..)`
+        app.teardown_request(self._observe_operations)
+
         if self._export_defaults:
             self.export_defaults(
                 self.buckets, self.group_by,
-                self._defaults_prefix, app
+                self._defaults_prefix, app,
+                excluded_paths=self.excluded_paths,
+                track_in_progress=self.track_in_progress,
+                duration_quantiles=self.duration_quantiles,
+                path_normalizer=self.path_normalizer,
+                queue_time_header=self.queue_time_header,
+                statsd=self.statsd,
+                status_classes=self.status_classes,
+                exact_statuses=self.exact_statuses,
+                normalize_methods=self.normalize_methods,
+                warm_up_statuses=self.warm_up_statuses,
+                governor=self.governor
             )
 
     def register_endpoint(self, path, app=None):
@@ -160,6 +352,8 @@ class PrometheusMetrics(object):
             (by default it is the application registered with this class)
         """
 
+        from werkzeug.serving import is_running_from_reloader
+
         if is_running_from_reloader() and not os.environ.get('DEBUG_METRICS'):
             return
 
@@ -169,23 +363,146 @@ class PrometheusMetrics(object):
         @app.route(path)
         @self.do_not_track()
         def prometheus_metrics():
-            # import these here so they don't clash with our own multiprocess module
-            from prometheus_client import multiprocess, CollectorRegistry
+            from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
-            if 'prometheus_multiproc_dir' in os.environ:
-                registry = CollectorRegistry()
-            else:
-                registry = self.registry
+            registry = self._exposed_registry()
 
-            if 'name[]' in request.args:
-                registry = registry.restricted_registry(request.args.getlist('name[]'))
-
-            if 'prometheus_multiproc_dir' in os.environ:
-                multiprocess.MultiProcessCollector(registry)
+            if self.renderer:
+                # collected and rendered while the response is sent
+                return Response(self.renderer.render(registry), 200, mimetype=CONTENT_TYPE_LATEST)
 
             headers = {'Content-Type': CONTENT_TYPE_LATEST}
             return generate_latest(registry), 200, headers
 
+    def _exposed_registry(self):
+        # import these here so they don't clash with our own multiprocess module
+        from prometheus_client import multiprocess, CollectorRegistry
+        from .sketch import SketchMultiProcessCollector
+
+        self.create_deferred_metrics()
+        self.warm_up()
+
+        if 'prometheus_multiproc_dir' in os.environ:
+            registry = CollectorRegistry()
+        else:
+            registry = self.registry
+
+        if 'name[]' in request.args:
+            registry = registry.restricted_registry(request.args.getlist('name[]'))
+
+        if 'prometheus_multiproc_dir' in os.environ:
+            multiprocess.MultiProcessCollector(registry)
+            SketchMultiProcessCollector(registry)
+
+        return registry
+
+    def register_cardinality_endpoint(self, path, app=None, top_k=10):
+        """
+        Register the endpoint reporting the number of series of each metric
+        family, the most frequent values of their labels, and the growth
+        of the series counts since the previous call, as JSON
+        on the Flask application.
+        The number of values to list can be changed with the `k` query parameter,
+        and the metrics can be filtered with `name[]`, like on the metrics endpoint.
+
+        :param path: the path of the endpoint
+        :param app: the Flask application to register the endpoint on
+            (by default it is the application registered with this class)
+        :param top_k: the number of the most frequent values to list for each label
+        """
+
+        from .cardinality import CardinalityExplorer
+
+        if app is None:
+            app = self.app or current_app
+
+        explorer = CardinalityExplorer(top_k)
+
+        @app.route(path)
+        @self.do_not_track()
+        def prometheus_cardinality():
+            report = explorer.explore(
+                self._exposed_registry(), request.args.get('k', type=int)
+            )
+
+            headers = {'Content-Type': 'application/json'}
+            return json.dumps(report), 200, headers
+
+    def register_slow_requests_endpoint(self, path, app=None):
+        """
+        Register the endpoint listing the slowest requests
+        as JSON on the Flask application.
+        This needs the `slow_requests` parameter to be set.
+
+        :param path: the path of the endpoint
+        :param app: the Flask application to register the endpoint on
+            (by default it is the application registered with this class)
+        """
+
+        if not self.slow_requests:
+            raise ValueError('Tracking the slowest requests is not enabled')
+
+        if app is None:
+            app = self.app or current_app
+
+        @app.route(path)
+        @self.do_not_track()
+        def prometheus_slow_requests():
+            headers = {'Content-Type': 'application/json'}
+            return json.dumps(self.slow_requests.requests()), 200, headers
+
+    def register_bucket_calibration_endpoint(self, path, app=None):
+        """
+        Register the endpoint serving the latency buckets recommended
+        by the bucket calibration as JSON on the Flask application.
+        This needs the `bucket_calibration` parameter to be set.
+
+        :param path: the path of the endpoint
+        :param app: the Flask application to register the endpoint on
+            (by default it is the application registered with this class)
+        """
+
+        if not self.bucket_calibration:
+            raise ValueError('Bucket calibration is not enabled')
+
+        if app is None:
+            app = self.app or current_app
+
+        @app.route(path)
+        @self.do_not_track()
+        def prometheus_bucket_calibration():
+            from prometheus_client import Histogram
+
+            recommendations = self.bucket_calibration.recommendations(
+                current_buckets=self.buckets or Histogram.DEFAULT_BUCKETS
+            )
+
+            headers = {'Content-Type': 'application/json'}
+            return json.dumps(recommendations), 200, headers
+
+    def _register_bucket_calibration_command(self, app):
+        calibration = self.bucket_calibration
+
+        @app.cli.command('metrics-buckets')
+        def metrics_buckets():
+            """Print the latency buckets recommended by the last calibration."""
+
+            import click
+
+            from .calibration import load_recommendations
+
+            recommendations = load_recommendations(calibration.filename)
+
+            if recommendations is None:
+                click.echo('No recommendations saved to %s yet' % calibration.filename)
+                return
+
+            for group, details in sorted(recommendations['groups'].items()):
+                click.echo('%s (%d requests): %s' % (
+                    group, details['count'],
+                    ', '.join(str(bound) for bound in details['buckets'])
+                ))
+
     def start_http_server(self, port, host='0.0.0.0', endpoint='/metrics'):
         """
         Start an HTTP server for exposing the metrics.
@@ -198,6 +515,8 @@ class PrometheusMetrics(object):
             (default: `/metrics`)
         """
 
+        from werkzeug.serving import is_running_from_reloader
+
         if is_running_from_reloader():
             return
 
@@ -211,12 +530,54 @@ class PrometheusMetrics(object):
         thread.setDaemon(True)
         thread.start()
 
+    def create_deferred_metrics(self):
+        """
+        Create the default metrics that were deferred with `lazy_defaults=True`
+        and have not been created yet.
+        This is called automatically before serving the metrics endpoint.
+        """
+
+        for deferred in self._deferred_metrics:
+            deferred.get()
+
+    def warm_up(self):
+        """
+        Create the series of the default metrics for the URL rules
+        of the application that have not been seen yet, with the
+        `warm_up_statuses` and the common HTTP methods of each rule,
+        so they are exported with zero values before the first request to them.
+        This is called automatically on the first request of each process,
+        and before serving the metrics endpoint, to pick up the rules
+        and blueprints registered after setting up the metrics too.
+        """
+
+        for warm_up in self._warm_ups:
+            warm_up()
+
+    def declare_metrics(self):
+        """
+        Create the metrics of the decorators that were deferred
+        with `lazy_metrics=True` and have not been created yet,
+        so they are exported before their methods are first invoked.
+        """
+
+        for deferred in self._lazy_metrics:
+            deferred.get()
+
     def export_defaults(self, buckets=None, group_by='path',
-                        prefix='flask', app=None, **kwargs):
+                        prefix='flask', app=None, excluded_paths=None,
+                        track_in_progress=False, duration_quantiles=None,
+                        path_normalizer=None, queue_time_header=None, statsd=None,
+                        status_classes=False, exact_statuses=None, normalize_methods=False,
+                        warm_up_statuses=None, governor=None, **kwargs):
         """
         Export the default metrics:
             - HTTP request latencies
             - Number of HTTP requests
+            - Number of HTTP requests in progress (optional)
+            - HTTP request latency quantiles (optional)
+            - HTTP request queue times (optional)
+            - The level of the overload governor (optional)
 
         :param buckets: the time buckets for request latencies
             (will use the default when `None`)
@@ -226,6 +587,31 @@ class PrometheusMetrics(object):
         :param prefix: prefix to start the default metrics names with
             or `NO_PREFIX` (to skip prefix)
         :param app: the Flask application
+        :param excluded_paths: request paths to skip the default metrics for,
+            as path prefixes, glob patterns or compiled regular expressions
+        :param track_in_progress: also export a Gauge with the number
+            of HTTP requests in progress
+        :param duration_quantiles: also export the given quantiles of the
+            HTTP request latencies, estimated with a `Sketch` (optional)
+        :param path_normalizer: a callable, like a `PathNormalizer`, to rewrite
+            the request paths with, when grouped by `path` (optional)
+        :param queue_time_header: the name of the header, or a list of them,
+            with the time the request was received by the load balancer
+            or proxy, in seconds, milliseconds or microseconds since the epoch,
+            optionally prefixed with `t=` (optional)
+        :param statsd: a `StatsdExporter` to also send the request counts,
+            latencies and queue times to (optional)
+        :param status_classes: use the class of the response status,
+            like `2xx`, for the `status` label, rather than the code
+        :param exact_statuses: the status codes to keep as they are
+            with `status_classes=True` (optional)
+        :param normalize_methods: use `other` for the `method` label
+            of the requests with non-standard HTTP methods
+        :param warm_up_statuses: the status codes to create the series
+            with for each URL rule upfront (optional, see `warm_up`)
+        :param governor: an `OverloadGovernor` to only count the requests,
+            and observe the latencies of a sample of them or none,
+            while the request hooks take too much time (optional)
         """
 
         if app is None:
@@ -254,11 +640,7 @@ class PrometheusMetrics(object):
         else:
             duration_group = 'path'
 
-        if callable(duration_group):
-            duration_group_name = duration_group.__name__
-
-        else:
-            duration_group_name = duration_group
+        duration_group_name = _group_label(duration_group)
 
         if prefix == NO_PREFIX:
             prefix = ""
@@ -266,93 +648,282 @@ class PrometheusMetrics(object):
             prefix = prefix + "_"
 
         hostname = os.getenv('HOSTNAME', 'bayesian-api')
-        # Add gauge metrics for our average calculations
-        # Gauge by default considers pid for labeling for multiprocess_mode in (all, liveall).
-        gauge = Gauge(
-            '%shttp_request_average' % prefix,
-            'Average Response Time of HTTP requests',
-            ('method', duration_group_name, 'hostname', 'status'),
-            registry=self.registry, multiprocess_mode='liveall'
-        )
-        
-        # We need to extend pid labeling to our Histogram as well
-        histogram = Histogram(
-            '%shttp_request_duration_seconds' % prefix,
-            'Flask HTTP request duration in seconds',
-            ('method', duration_group_name, 'pid', 'hostname', 'status'),
-            registry=self.registry,
-            **buckets_as_kwargs
-        )
 
-        # Add group by endpoint or path for our Counter metrics
-        counter = Counter(
-            '%shttp_request_total' % prefix,
-            'Total number of HTTP requests',
-            ('method', duration_group_name, 'hostname', 'status'),
-            registry=self.registry
-        )
+        if isinstance(queue_time_header, (list, tuple)):
+            queue_time_headers = queue_time_header
+        elif queue_time_header:
+            queue_time_headers = (queue_time_header,)
+        else:
+            queue_time_headers = ()
+
+        def create_metrics():
+            from prometheus_client import Counter, Gauge, Histogram
+
+            # Add gauge metrics for our average calculations
+            # Gauge by default considers pid for labeling for multiprocess_mode in (all, liveall).
+            gauge = Gauge(
+                '%shttp_request_average' % prefix,
+                'Average Response Time of HTTP requests',
+                ('method', duration_group_name, 'hostname', 'status'),
+                registry=self.registry, multiprocess_mode='liveall'
+            )
 
-        self.info(
-            '%sexporter_info' % prefix,
-            'Information about the Prometheus Flask exporter',
-            version=self.version
-        )
+            # We need to extend pid labeling to our Histogram as well
+            histogram = self._histogram_type()(
+                '%shttp_request_duration_seconds' % prefix,
+                'Flask HTTP request duration in seconds',
+                ('method', duration_group_name, 'pid', 'hostname', 'status'),
+                registry=self.registry,
+                **buckets_as_kwargs
+            )
+
+            # Add group by endpoint or path for our Counter metrics
+            counter = Counter(
+                '%shttp_request_total' % prefix,
+                'Total number of HTTP requests',
+                ('method', duration_group_name, 'hostname', 'status'),
+                registry=self.registry
+            )
+
+            if track_in_progress:
+                in_progress = Gauge(
+                    '%shttp_requests_in_progress' % prefix,
+                    'Number of HTTP requests in progress',
+                    ('method', duration_group_name),
+                    registry=self.registry, multiprocess_mode='liveall'
+                )
+
+            else:
+                in_progress = None
+
+            if duration_quantiles:
+                from .sketch import Sketch
+
+                quantiles = Sketch(
+                    '%shttp_request_duration_quantiles_seconds' % prefix,
+                    'Flask HTTP request duration quantiles in seconds',
+                    ('method', duration_group_name, 'hostname', 'status'),
+                    registry=self.registry, quantiles=duration_quantiles
+                )
+
+            else:
+                quantiles = None
+
+            if queue_time_headers:
+                queue_time = Histogram(
+                    '%shttp_request_queue_seconds' % prefix,
+                    'Time HTTP requests waited before the application got to them in seconds',
+                    ('method', duration_group_name),
+                    registry=self.registry
+                )
+
+            else:
+                queue_time = None
+
+            if governor:
+                governor.attach(Gauge(
+                    '%sexporter_governor_level' % prefix,
+                    'The level of the default metrics: '
+                    '0 for all, 1 for counters and sampled latencies, 2 for counters only',
+                    registry=self.registry, multiprocess_mode='liveall'
+                ))
+
+            self.info(
+                '%sexporter_info' % prefix,
+                'Information about the Prometheus Flask exporter',
+                version=self.version
+            )
+
+            from .series import SeriesTable
+            series = SeriesTable(histogram, counter, gauge, quantiles, hostname)
+
+            if self.persistent_state:
+                # continue from the values saved before the last restart
+                self.persistent_state.attach(series)
+
+            return series, in_progress, queue_time
+
+        default_metrics = _Deferred(create_metrics)
+
+        if self.lazy_defaults:
+            self._deferred_metrics.append(default_metrics)
+        else:
+            default_metrics.get()
+
+        is_excluded = _compile_path_matcher(excluded_paths)
+        get_group = _group_getter(duration_group, path_normalizer)
+        get_status = _status_getter(status_classes, exact_statuses)
+        get_method = _method_getter(normalize_methods)
+        slow_requests = self.slow_requests
+        calibration = self.bucket_calibration
+
+        # the URL rules warmed up in this process
+        warmed_up = {'pid': None, 'rules': set()}
+
+        def warm_up():
+            if warmed_up['pid'] != os.getpid():
+                # the series created before forking belong to the parent process
+                warmed_up['pid'], warmed_up['rules'] = os.getpid(), set()
+
+            # the rules are not hashable, and they are never removed from the map
+            rules = [
+                rule for rule in app.url_map.iter_rules()
+                if id(rule) not in warmed_up['rules']
+            ]
+            if not rules:
+                return
+
+            series_table = default_metrics.get()[0]
+
+            for rule in rules:
+                warmed_up['rules'].add(id(rule))
+
+                group = _rule_group(rule, duration_group, path_normalizer)
+                view_func = app.view_functions.get(rule.endpoint)
+
+                if group is None or getattr(view_func, 'prom_do_not_track', False):
+                    continue
+                if is_excluded and is_excluded(rule.rule):
+                    continue
+
+                for method in _WARM_UP_METHODS:
+                    if method in rule.methods:
+                        for status in warm_up_statuses:
+                            series_table.get(get_method(method), group, get_status(status))
+
+        if warm_up_statuses:
+            self._warm_ups.append(warm_up)
+
+            if not self.lazy_defaults:
+                warm_up()
 
         def before_request():
-            request.prom_start_time = default_timer()
+            hook_start = _now_ns()
+
+            if warm_up_statuses and warmed_up['pid'] != os.getpid():
+                warm_up()
+
+            if is_excluded and is_excluded(request.path):
+                request.prom_do_not_track = True
+                return
+
+            # the `do_not_track` views, like the metrics endpoint,
+            # only mark the request when they are already running
+            view_func = app.view_functions.get(request.endpoint)
+            if getattr(view_func, 'prom_do_not_track', False):
+                request.prom_do_not_track = True
+                return
+
+            # the latencies are only observed for a sample of the requests,
+            # or for none of them, while the governor lowers the level
+            if governor is None or governor.sample():
+                request.environ[_START_TIME_KEY] = hook_start
+
+                for header in queue_time_headers:
+                    value = request.headers.get(header)
+
+                    if value:
+                        queue_time = _queue_time(value, time.time())
+                        if queue_time is not None:
+                            request.environ[_QUEUE_TIME_KEY] = queue_time
+                            break
+
+            # kept at every level, for scaling on it while overloaded
+            if track_in_progress:
+                in_progress = default_metrics.get()[1].labels(
+                    get_method(request.method), get_group()
+                )
+                in_progress.inc()
+
+                # decremented on teardown, that runs even if the request fails
+                request.environ[_IN_PROGRESS_KEY] = in_progress
+
+            if governor:
+                request.environ[_OVERHEAD_KEY] = _now_ns() - hook_start
+
+        def teardown_request(exception=None):
+            in_progress = request.environ.get(_IN_PROGRESS_KEY)
+
+            if in_progress is not None:
+                in_progress.dec()
 
         def after_request(response):
             if hasattr(request, 'prom_do_not_track'):
                 return response
 
-            if hasattr(request, 'prom_start_time'):
-                total_time = max(default_timer() - request.prom_start_time, 0)
+            if governor:
+                hook_start = _now_ns()
 
-                if callable(duration_group):
-                    group = duration_group(request)
-                else:
-                    group = getattr(request, duration_group)
-
-                histogram.labels(
-                    request.method, group, os.getpid(), hostname, response.status_code
-                ).observe(total_time)
-
-            counter.labels(request.method, group, hostname, response.status_code).inc()
-            
-            # Get moving average data per (endpoint, method_tye, status_code, pid)
-            total_count = 1
-            total_time = 0
-            for sample in histogram._samples():
-                """Data Format
-                By Path
-                ('_sum', {'method': 'GET', 'path': '/api/v1/ping', 'status': '200'}, 0.00014503102283924818)
-                By Endpoint
-                ('_count', {'method': 'GET', 'endpoint': 'api_v1.ping', 'status': '200'}, 1.0)
-                """
-                if '_sum' in sample:
-                    if request.method == sample[1]['method'] and \
-                                    group == sample[1][duration_group_name] and \
-                                    str(os.getpid()) == sample[1]['pid'] and \
-                                    str(hostname) == sample[1]['hostname']:
-                        total_time = sample[2]
-                if '_count' in sample:
-                    if request.method == sample[1]['method'] and \
-                                    str(os.getpid()) == sample[1]['pid'] and \
-                                    str(hostname) == sample[1]['hostname'] and \
-                                    group == sample[1][duration_group_name]:
-                        total_count = sample[2]
-                        
-            if total_time > 0 and total_count > 0:
-                average_time = float(total_time / total_count)
-                # Gauge by default aggregates based on PID if multiprocess_mode in (all, liveall)
-                gauge.labels(request.method, group, hostname,
-                             response.status_code).set(average_time)
+            series_table, _, queue_time = default_metrics.get()
+            environ = request.environ
+
+            method = get_method(request.method)
+            status = get_status(response.status_code)
+            group = get_group()
+            series = series_table.get(method, group, status)
+            start_time = environ.get(_START_TIME_KEY)
+
+            if statsd:
+                statsd_labels = (
+                    ('method', method),
+                    (duration_group_name, group if type(group) is str else str(group)),
+                    ('status', status)
+                )
+
+            if queue_time and _QUEUE_TIME_KEY in environ:
+                queue_time.labels(method, group).observe(
+                    environ[_QUEUE_TIME_KEY]
+                )
+
+                if statsd:
+                    statsd.timing(
+                        '%shttp_request_queue' % prefix,
+                        environ[_QUEUE_TIME_KEY], statsd_labels[:2]
+                    )
+
+            if start_time is not None:
+                # the clock is monotonic, convert to seconds only for observing
+                total_time = (_now_ns() - start_time) / 1e9
+
+                series.histogram.observe(total_time)
+
+                if series.quantiles:
+                    series.quantiles.observe(total_time)
+
+                # the running average of the series, per process
+                series.gauge.set(series_table.observe(series, total_time))
+
+                if statsd:
+                    statsd.timing('%shttp_request_duration' % prefix, total_time, statsd_labels)
+
+                if calibration and calibration.recording:
+                    calibration.observe(group, total_time)
+
+                if slow_requests:
+                    slow_requests.record(
+                        total_time, request.path, request.endpoint,
+                        request.method, response.status_code
+                    )
+
+            series.counter.inc()
+
+            if statsd:
+                statsd.increment('%shttp_request_total' % prefix, statsd_labels)
+
+            if governor:
+                now = _now_ns()
+                governor.record(
+                    environ.get(_OVERHEAD_KEY, 0) + now - hook_start, now
+                )
 
             return response
 
         app.before_request(before_request)
         app.after_request(after_request)
 
+        if track_in_progress:
+            app.teardown_request(teardown_request)
+
     def histogram(self, name, description, labels=None, **kwargs):
         """
         Use a Histogram to track the execution time and invocation count
@@ -365,12 +936,22 @@ class PrometheusMetrics(object):
         """
 
         return self._track(
-            Histogram,
+            self._histogram_type(),
             lambda metric, time: metric.observe(time),
             kwargs, name, description, labels,
-            registry=self.registry
+            registry=self.registry, deferred=self._deferred_decorator_metrics(),
+            emit=self._statsd_call('timing', name)
         )
 
+    def _histogram_type(self):
+        if self.fast_histograms:
+            from .histogram import FastHistogram
+            return FastHistogram
+
+        else:
+            from prometheus_client import Histogram
+            return Histogram
+
     def summary(self, name, description, labels=None, **kwargs):
         """
         Use a Summary to track the execution time and invocation count
@@ -382,11 +963,14 @@ class PrometheusMetrics(object):
         :param kwargs: additional keyword arguments for creating the Summary
         """
 
+        from prometheus_client import Summary
+
         return self._track(
             Summary,
             lambda metric, time: metric.observe(time),
             kwargs, name, description, labels,
-            registry=self.registry
+            registry=self.registry, deferred=self._deferred_decorator_metrics(),
+            emit=self._statsd_call('timing', name)
         )
 
     def gauge(self, name, description, labels=None, **kwargs):
@@ -400,14 +984,40 @@ class PrometheusMetrics(object):
         :param kwargs: additional keyword arguments for creating the Gauge
         """
 
+        from prometheus_client import Gauge
+
         return self._track(
             Gauge,
             lambda metric, time: metric.dec(),
             kwargs, name, description, labels,
-            registry=self.registry,
+            registry=self.registry, deferred=self._deferred_decorator_metrics(),
+            emit=self._statsd_call('gauge', name),
             before=lambda metric: metric.inc()
         )
 
+    def sketch(self, name, description, labels=None, **kwargs):
+        """
+        Use a `Sketch` to track the execution time and invocation count
+        of the method, and export quantiles of the execution time
+        with a bounded relative error.
+
+        :param name: the name of the metric
+        :param description: the description of the metric
+        :param labels: a dictionary of `{labelname: callable_or_value}` for labels
+        :param kwargs: additional keyword arguments for creating the Sketch,
+            like `quantiles`, `relative_accuracy` and `max_bins`
+        """
+
+        from .sketch import Sketch
+
+        return self._track(
+            Sketch,
+            lambda metric, time: metric.observe(time),
+            kwargs, name, description, labels,
+            registry=self.registry, deferred=self._deferred_decorator_metrics(),
+            emit=self._statsd_call('timing', name)
+        )
+
     def counter(self, name, description, labels=None, **kwargs):
         """
         Use a Counter to track the total number of invocations of the method.
@@ -418,16 +1028,331 @@ class PrometheusMetrics(object):
         :param kwargs: additional keyword arguments for creating the Counter
         """
 
+        from prometheus_client import Counter
+
         return self._track(
             Counter,
             lambda metric, time: metric.inc(),
             kwargs, name, description, labels,
-            registry=self.registry
+            registry=self.registry, deferred=self._deferred_decorator_metrics(),
+            emit=self._statsd_call('increment', name)
         )
 
+    def timer(self, operation):
+        """
+        Time a part of handling the requests, like database or downstream calls,
+        as a context manager or as a decorator.
+        The durations are added up for each request, and they are only observed
+        when the request is finished, in the
+        `<prefix>_http_request_operation_duration_seconds` Histogram,
+        labelled with the operation and the group of the request.
+        Outside of requests, the durations are not recorded.
+
+        Sample usage:
+
+            db_timer = metrics.timer('db')
+
+            @db_timer
+            def load_user(user_id):
+                ...
+
+            with metrics.timer('downstream'):
+                requests.get(url)
+
+        :param operation: the name of the operation, used as the `operation` label
+        :return: the timer, that can be used as a context manager or as a decorator
+        """
+
+        return _OperationTimer(operation)
+
+    def _create_operations_histogram(self):
+        if self._defaults_prefix == NO_PREFIX:
+            prefix = ''
+        else:
+            prefix = self._defaults_prefix + '_'
+
+        buckets_as_kwargs = {}
+        if self.buckets is not None:
+            buckets_as_kwargs['buckets'] = self.buckets
+
+        return self._histogram_type()(
+            '%shttp_request_operation_duration_seconds' % prefix,
+            'Total duration of the timed operations of HTTP requests in seconds',
+            ('operation', _group_label(self.group_by)),
+            registry=self.registry, **buckets_as_kwargs
+        ), _group_getter(self.group_by, self.path_normalizer)
+
+    def _observe_operations(self, exception=None):
+        durations = request.environ.pop(_OPERATIONS_KEY, None)
+
+        if not durations:
+            return
+
+        histogram, get_group = self._operations.get()
+        group = get_group()
+
+        for operation, duration in durations.items():
+            histogram.labels(operation, group).observe(duration / 1e9)
+
+    def instrument(self, app_or_blueprint, policy):
+        """
+        Track all the views of an application or blueprint with the metrics
+        chosen by an `InstrumentationPolicy`, rather than decorating each view.
+        The views are wrapped in place, and all the views instrumented with
+        the same policy share a single metric family for each type of metric,
+        labelled with their `endpoint`.
+
+        The views of an application need to be defined before calling this,
+        and the ones of a blueprint before registering the blueprint,
+        then they are wrapped when it is registered on an application.
+        The views of the metrics endpoints and the ones marked
+        with `do_not_track` are skipped.
+
+        Sample usage:
+
+            policy = InstrumentationPolicy(metrics=('histogram', 'counter'), exclude=['health'])
+            metrics.instrument(api_blueprint, policy)
+            app.register_blueprint(api_blueprint)
+
+        :param app_or_blueprint: the Flask application or blueprint
+        :param policy: the `InstrumentationPolicy` to choose the metrics with
+        """
+
+        if policy not in self._policy_metrics:
+            self._policy_metrics[policy] = self._create_policy_metrics(policy)
+
+        if isinstance(app_or_blueprint, Blueprint):
+            blueprint = app_or_blueprint
+
+            def register(state):
+                # the endpoints of the views of the blueprint, as registered
+                name = getattr(state, 'name', None) or blueprint.name
+                prefix = '.'.join(
+                    part for part in (getattr(state, 'name_prefix', ''), name) if part
+                )
+
+                self._instrument_views(state.app, policy, prefix + '.')
+
+            blueprint.record(register)
+
+        else:
+            self._instrument_views(app_or_blueprint, policy)
+
+    def _create_policy_metrics(self, policy):
+        from prometheus_client import Summary, Counter, Gauge
+        from .sketch import Sketch
+
+        label_names = ('endpoint',) + tuple(policy.labels.keys())
+
+        buckets_as_kwargs = {}
+        if policy.buckets is not None:
+            buckets_as_kwargs['buckets'] = policy.buckets
+
+        names = dict(
+            (metric_type, name % policy.prefix)
+            for metric_type, name in _POLICY_METRIC_NAMES.items()
+        )
+
+        factories = {
+            'histogram': lambda: self._histogram_type()(
+                names['histogram'], 'Duration of the views in seconds',
+                label_names, registry=self.registry, **buckets_as_kwargs
+            ),
+            'summary': lambda: Summary(
+                names['summary'], 'Duration of the views in seconds',
+                label_names, registry=self.registry
+            ),
+            'sketch': lambda: Sketch(
+                names['sketch'], 'Duration quantiles of the views in seconds',
+                label_names, registry=self.registry
+            ),
+            'counter': lambda: Counter(
+                names['counter'], 'Number of invocations of the views',
+                label_names, registry=self.registry
+            ),
+            'gauge': lambda: Gauge(
+                names['gauge'], 'Number of invocations of the views in progress',
+                label_names, registry=self.registry, multiprocess_mode='livesum'
+            )
+        }
+
+        policy_metrics = {}
+
+        for metric_type in policy.used_metrics():
+            metric = policy_metrics[metric_type] = _Deferred(factories[metric_type])
+
+            if self.lazy_metrics:
+                self._lazy_metrics.append(metric)
+            else:
+                metric.get()
+
+        return policy_metrics
+
+    def _instrument_views(self, app, policy, prefix=None):
+        rules = {}
+        for rule in app.url_map.iter_rules():
+            rules.setdefault(rule.endpoint, []).append(rule.rule)
+
+        policy_metrics = self._policy_metrics[policy]
+        label_generator = tuple(
+            (key, _label_value(call)) for key, call in policy.labels.items()
+        )
+
+        for endpoint, view_func in list(app.view_functions.items()):
+            if prefix and not endpoint.startswith(prefix):
+                continue
+
+            if getattr(view_func, 'prom_do_not_track', False):
+                continue
+
+            if policy in getattr(view_func, 'prom_policies', ()):
+                continue  # instrumented already
+
+            metric_types = policy.metrics_for(endpoint, rules.get(endpoint, ()))
+
+            if metric_types:
+                app.view_functions[endpoint] = self._instrumented_view(
+                    view_func, endpoint, policy,
+                    [(metric_type, policy_metrics[metric_type]) for metric_type in metric_types],
+                    label_generator
+                )
+
+    def _instrumented_view(self, f, endpoint, policy, metrics, label_generator):
+        """
+        Wrap a view to track it with the metrics of a policy,
+        timing it once for all of them.
+
+        :param f: the view function
+        :param endpoint: the endpoint name of the view
+        :param policy: the `InstrumentationPolicy` of the metrics
+        :param metrics: the list of the `(metric_type, deferred_metric)` pairs
+        :param label_generator: the tuple of the `(labelname, function)` pairs
+            of the additional labels of the policy
+        """
+
+        observed = [metric for metric_type, metric in metrics if metric_type in _TIMING_TYPES]
+        counted = [metric for metric_type, metric in metrics if metric_type == 'counter']
+        in_progress = [metric for metric_type, metric in metrics if metric_type == 'gauge']
+
+        if self.statsd:
+            label_names = ('endpoint',) + tuple(key for key, _ in label_generator)
+
+            # in the same order as the children in `record`
+            emits = [
+                self._statsd_call(statsd_type, _POLICY_METRIC_NAMES[metric_type] % policy.prefix)
+                for statsd_type, group in (('timing', _TIMING_TYPES), ('increment', ('counter',)),
+                                           ('gauge', ('gauge',)))
+                for metric_type, _ in metrics if metric_type in group
+            ]
+
+        else:
+            emits = None
+
+        # without additional labels, the children are the same for each invocation
+        cached_children = {}
+
+        def children(group, values):
+            if label_generator:
+                return [metric.get().labels(*values) for metric in group]
+
+            found = cached_children.get(id(group))
+            if found is None:
+                found = cached_children[id(group)] = [
+                    metric.get().labels(endpoint) for metric in group
+                ]
+
+            return found
+
+        def label_values(response):
+            return (endpoint,) + tuple(call(response) for _, call in label_generator)
+
+        def record(response, total_time, gauges):
+            values = label_values(response)
+            observing, counting = children(observed, values), children(counted, values)
+
+            for child in observing:
+                child.observe(total_time)
+
+            for child in counting:
+                child.inc()
+
+            for child in gauges:
+                child.dec()
+
+            if emits:
+                labels = tuple(zip(label_names, values))
+
+                for emit, child in zip(emits, observing + counting + gauges):
+                    emit(child, total_time, labels)
+
+        @functools.wraps(f)
+        def func(*args, **kwargs):
+            if in_progress:
+                gauges = children(in_progress, label_values(None))
+
+                for child in gauges:
+                    child.inc()
+
+            else:
+                gauges = []
+
+            start_time = _now_ns()
+            try:
+                try:
+                    # execute the view function
+                    response = f(*args, **kwargs)
+                except Exception as ex:
+                    if request.environ.get(_UNHANDLED_EXCEPTION_KEY) is ex:
+                        # an inner decorator found no error handler for it already
+                        raise
+
+                    # let Flask decide to wrap or reraise the Exception
+                    response = current_app.handle_user_exception(ex)
+
+            except Exception as ex:
+                # if it was re-raised, treat it as an InternalServerError,
+                # then let it propagate to the Flask error handling as it is
+                request.environ[_UNHANDLED_EXCEPTION_KEY] = ex
+
+                record(
+                    make_response('Exception: %s' % ex, 500) if label_generator else None,
+                    (_now_ns() - start_time) / 1e9, gauges
+                )
+                raise
+
+            total_time = (_now_ns() - start_time) / 1e9
+
+            if label_generator and not isinstance(response, Response):
+                response = make_response(response)
+
+            record(response, total_time, gauges)
+
+            return response
+
+        func.prom_policies = getattr(f, 'prom_policies', ()) + (policy,)
+
+        return func
+
+    def _statsd_call(self, statsd_type, name):
+        statsd = self.statsd
+
+        if statsd is None:
+            return None
+
+        if statsd_type == 'timing':
+            return lambda metric, time, labels: statsd.timing(name, time, labels)
+        elif statsd_type == 'increment':
+            return lambda metric, time, labels: statsd.increment(name, labels)
+        else:
+            # the number of invocations still in progress
+            return lambda metric, time, labels: statsd.gauge(name, metric._value.get(), labels)
+
+    def _deferred_decorator_metrics(self):
+        return self._lazy_metrics if self.lazy_metrics else None
+
     @staticmethod
     def _track(metric_type, metric_call, metric_kwargs, name, description, labels,
-               registry, before=None):
+               registry, before=None, deferred=None, emit=None):
         """
         Internal method decorator logic.
 
@@ -440,70 +1365,82 @@ class PrometheusMetrics(object):
         :param before: an optional callable to invoke before executing the
             request handler method accepting the single `metric` argument
         :param registry: the Prometheus Registry to use
+        :param deferred: a list to add the metric to for creating it
+            on the first invocation, or `None` to create it right away
+        :param emit: an optional callable to also send the invocation to
+            another sink with, accepting the `(metric, time, labels)` arguments,
+            where `labels` is the tuple of the `(labelname, value)` pairs
         """
 
         if labels is not None and not isinstance(labels, dict):
             raise TypeError('labels needs to be a dictionary of {labelname: callable}')
 
         label_names = labels.keys() if labels else tuple()
-        parent_metric = metric_type(
+        parent_metric = _Deferred(lambda: metric_type(
             name, description, labelnames=label_names, registry=registry,
             **metric_kwargs
-        )
+        ))
 
-        def argspec(func):
-            if hasattr(inspect, 'getfullargspec'):
-                return inspect.getfullargspec(func)
-            else:
-                return inspect.getargspec(func)
-
-        def label_value(f):
-            if not callable(f):
-                return lambda x: f
-            if argspec(f).args:
-                return lambda x: f(x)
-            else:
-                return lambda x: f()
+        if deferred is None:
+            parent_metric.get()
+        else:
+            deferred.append(parent_metric)
 
         label_generator = tuple(
-            (key, label_value(call))
+            (key, _label_value(call))
             for key, call in labels.items()
         ) if labels else tuple()
 
         def get_metric(response):
             if label_names:
-                return parent_metric.labels(
-                    **{key: call(response) for key, call in label_generator}
-                )
+                values = tuple((key, call(response)) for key, call in label_generator)
+                return parent_metric.get().labels(**dict(values)), values
             else:
-                return parent_metric
+                return parent_metric.get(), ()
 
         def decorator(f):
             @functools.wraps(f)
             def func(*args, **kwargs):
                 if before:
-                    metric = get_metric(None)
+                    metric, label_values = get_metric(None)
                     before(metric)
 
                 else:
                     metric = None
 
-                exception = None
-
-                start_time = default_timer()
+                start_time = _now_ns()
                 try:
                     try:
                         # execute the handler function
                         response = f(*args, **kwargs)
                     except Exception as ex:
+                        if request.environ.get(_UNHANDLED_EXCEPTION_KEY) is ex:
+                            # an inner decorator found no error handler for it already
+                            raise
+
                         # let Flask decide to wrap or reraise the Exception
                         response = current_app.handle_user_exception(ex)
+
                 except Exception as ex:
-                    # if it was re-raised, treat it as an InternalServerError
-                    exception = ex
-                    response = make_response('Exception: %s' % ex, 500)
+                    # if it was re-raised, treat it as an InternalServerError,
+                    # then let it propagate to the Flask error handling as it is
+                    request.environ[_UNHANDLED_EXCEPTION_KEY] = ex
 
-                total_time = max(default_timer() - start_time, 0)
+                    total_time = (_now_ns() - start_time) / 1e9
+
+                    if not metric:
+                        metric, label_values = get_metric(
+                            make_response('Exception: %s' % ex, 500) if label_names else None
+                        )
+
+                    metric_call(metric, time=total_time)
+
+                    if emit:
+                        emit(metric, total_time, label_values)
+
+                    raise
+
+                total_time = (_now_ns() - start_time) / 1e9
 
                 if not metric:
                     if not isinstance(response, Response) and request.endpoint:
@@ -521,19 +1458,14 @@ class PrometheusMetrics(object):
                             # we are in a request handler method
                             response = make_response(response)
 
-                    metric = get_metric(response)
+                    metric, label_values = get_metric(response)
 
                 metric_call(metric, time=total_time)
 
-                if exception:
-                    try:
-                        # re-raise for the Flask error handler
-                        raise exception
-                    except Exception as ex:
-                        return current_app.handle_user_exception(ex)
+                if emit:
+                    emit(metric, total_time, label_values)
 
-                else:
-                    return response
+                return response
 
             return func
 
@@ -553,6 +1485,9 @@ class PrometheusMetrics(object):
                 request.prom_do_not_track = True
                 return f(*args, **kwargs)
 
+            # skipped by `warm_up` too
+            func.prom_do_not_track = True
+
             return func
 
         return decorator
@@ -600,6 +1535,8 @@ class PrometheusMetrics(object):
             for idx, label_name in enumerate(labelnames):
                 labels[label_name] = labelvalues[idx]
 
+        from prometheus_client import Gauge
+
         gauge = Gauge(
             name, description, labelnames or tuple(),
             registry=self.registry
@@ -613,4 +1550,277 @@ class PrometheusMetrics(object):
         return gauge
 
 
+def _compile_path_matcher(patterns, literal_prefixes=True):
+    """
+    Compile path prefixes, glob patterns (containing any of `*?[`)
+    and regular expressions (compiled with `re.compile`) into a single
+    regular expression. The literal prefixes are merged into a trie,
+    so the match only walks the common parts of them once.
+    The regular expressions compiled with flags, like `re.IGNORECASE`
+    or `(?i)`, are matched on their own, so their flags are kept.
+
+    :param patterns: the collection of patterns
+    :param literal_prefixes: match the strings without any of `*?[`
+        as prefixes, rather than as whole names like the glob patterns
+    :return: a callable returning a truthy value for matching paths,
+        or `None` if there are no patterns
+    """
+
+    if not patterns:
+        return None
+
+    prefixes, expressions, flagged = [], [], []
+    default_flags = re.compile('').flags
+
+    for pattern in patterns:
+        if hasattr(pattern, 'pattern'):
+            if pattern.flags != default_flags:
+                flagged.append(pattern.match)
+            else:
+                expressions.append('(?:%s)' % pattern.pattern)
+        elif not literal_prefixes or any(char in pattern for char in '*?['):
+            expressions.append(fnmatch.translate(pattern))
+        else:
+            prefixes.append(pattern)
+
+    if prefixes:
+        trie = {}
+
+        for prefix in prefixes:
+            node = trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[''] = None
+
+        expressions.insert(0, _trie_to_regex(trie))
+
+    if expressions:
+        flagged.insert(0, re.compile('|'.join(expressions)).match)
+
+    if len(flagged) == 1:
+        return flagged[0]
+
+    def matches(path):
+        return any(match(path) for match in flagged)
+
+    return matches
+
+
+def _trie_to_regex(node):
+    if '' in node:
+        # a complete prefix matches regardless of what follows
+        return ''
+
+    branches = [
+        re.escape(char) + _trie_to_regex(child)
+        for char, child in sorted(node.items())
+    ]
+
+    if len(branches) == 1:
+        return branches[0]
+
+    return '(?:%s)' % '|'.join(branches)
+
+
+def _queue_time(value, now):
+    """
+    Parse the time the request was received by the load balancer or proxy,
+    like `t=1609459200.123`, `1609459200123` or `t=1609459200123456`,
+    and return the seconds since then.
+    The unit is detected from the magnitude of the timestamp,
+    and negative times, due to clock skew between the servers, are clamped to 0.
+
+    :param value: the value of the header
+    :param now: the current time in seconds since the epoch
+    :return: the seconds the request waited for, or `None` if not parsable
+    """
+
+    value = value.strip()
+    if value.startswith('t='):
+        value = value[2:]
+
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+
+    if not 0 < started < float('inf'):
+        return None  # also for NaN
+
+    # milliseconds, microseconds or nanoseconds to seconds
+    while started > 1e11:
+        started /= 1000.0
+
+    return max(now - started, 0.0)
+
+
+def _status_getter(status_classes, exact_statuses):
+    # the labels of all the valid status codes are computed upfront
+    exact_statuses = frozenset(exact_statuses or ())
+    labels = {}
+
+    for code in range(100, 600):
+        if status_classes and code not in exact_statuses:
+            labels[code] = '%dxx' % (code // 100)
+        else:
+            labels[code] = str(code)
+
+    if status_classes:
+        return lambda status: labels.get(status, 'other')
+    else:
+        return lambda status: labels.get(status) or str(status)
+
+
+def _method_getter(normalize_methods):
+    if not normalize_methods:
+        return lambda method: method
+
+    labels = dict((method, method) for method in STANDARD_METHODS)
+    return lambda method: labels.get(method, 'other')
+
+
+_WARM_UP_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# the names of the metrics of an `InstrumentationPolicy`, with its prefix
+_POLICY_METRIC_NAMES = {
+    'histogram': '%s_duration_seconds',
+    'summary': '%s_duration_summary_seconds',
+    'sketch': '%s_duration_quantiles_seconds',
+    'counter': '%s_invocations',
+    'gauge': '%s_in_progress'
+}
+
+_TIMING_TYPES = ('histogram', 'summary', 'sketch')
+
+
+def _label_value(f):
+    """
+    Create the function returning a label value from the response,
+    for the `{labelname: callable_or_value}` labels of the metrics.
+
+    :param f: a constant value, or a callable with or without the response argument
+    :return: the function with the single `response` argument
+    """
+
+    if not callable(f):
+        return lambda x: f
+
+    if hasattr(inspect, 'getfullargspec'):
+        argspec = inspect.getfullargspec(f)
+    else:
+        argspec = inspect.getargspec(f)
+
+    if argspec.args:
+        return lambda x: f(x)
+    else:
+        return lambda x: f()
+
+
+def _rule_group(rule, group_by, path_normalizer=None):
+    """
+    Find the group of the requests matching a URL rule, for warming up
+    the default metrics.
+
+    :param rule: the URL rule
+    :param group_by: the request property to group by
+    :param path_normalizer: a callable to rewrite the paths with (optional)
+    :return: the group, or `None` if it depends on the requests themselves
+    """
+
+    if group_by == 'endpoint':
+        return rule.endpoint
+    elif group_by == 'url_rule':
+        return rule
+    elif group_by == 'path' and not rule.arguments:
+        return path_normalizer(rule.rule) if path_normalizer else rule.rule
+    else:
+        return None
+
+
+def _group_label(group_by):
+    if callable(group_by):
+        return group_by.__name__
+    else:
+        return group_by
+
+
+def _group_getter(group_by, path_normalizer=None):
+    """
+    Create the function returning the group of the current request.
+
+    :param group_by: the request property, or a function of the request
+    :param path_normalizer: a callable to rewrite the paths with,
+        when grouped by `path` (optional)
+    :return: the function without arguments, returning the group
+    """
+
+    if callable(group_by):
+        return lambda: group_by(request)
+    elif group_by == 'path' and path_normalizer:
+        return lambda: path_normalizer(request.path)
+    else:
+        return lambda: getattr(request, group_by)
+
+
+class _OperationTimer(object):
+    """
+    Adds up the durations of an operation for the current request,
+    see `PrometheusMetrics.timer`.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self._local = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = []
+
+        starts.append(_now_ns())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = _now_ns() - self._local.starts.pop()
+
+        if has_request_context():
+            durations = request.environ.get(_OPERATIONS_KEY)
+            if durations is None:
+                durations = request.environ[_OPERATIONS_KEY] = {}
+
+            durations[self.operation] = durations.get(self.operation, 0) + duration
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def func(*args, **kwargs):
+            with self:
+                return f(*args, **kwargs)
+
+        return func
+
+
+class _Deferred(object):
+    """
+    Creates a value with the given factory on first use, only once,
+    even when used from multiple threads.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+
+                value = self._value
+
+        return value
+
+
 __version__ = '0.8.1'
@@ -0,0 +1,324 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+from .files import write_json
+from .sketch import DDSketch
+
+DEFAULT_GROUP = '*'
+"""
+The key of the recommendation for all the requests together
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class BucketCalibration(object):
+    """
+    Records the request latencies of each group (path, endpoint, etc.)
+    into log-scale quantile sketches for a time window,
+    then recommends histogram bucket boundaries for each of them,
+    and saves the recommendations into a JSON file.
+
+    With `apply=True`, the recommendation for all requests together is used
+    as the default latency histogram buckets on the next start,
+    unless the buckets are given explicitly.
+
+    The recommendations are saved by a background timer when the window ends,
+    never within a request. Each process records its own latencies only,
+    so with multiple worker processes, the file holds the recommendations
+    of the process that finished last.
+
+    Sample usage:
+
+        calibration = BucketCalibration('/var/lib/app/buckets.json', window=3600)
+        metrics = PrometheusMetrics(app, bucket_calibration=calibration)
+    """
+
+    def __init__(self, filename, window=3600, bucket_count=12,
+                 relative_accuracy=0.02, apply=False):
+        """
+        Create a new bucket calibration.
+
+        :param filename: the JSON file to save the recommendations into
+        :param window: the number of seconds to record the latencies for
+        :param bucket_count: the number of buckets to recommend,
+            not counting the `+Inf` bucket
+        :param relative_accuracy: the relative accuracy of the sketches
+        :param apply: use the saved recommendation as the default
+            latency buckets, if the file exists already
+        """
+
+        self.filename = filename
+        self.window = window
+        self.bucket_count = bucket_count
+        self.relative_accuracy = relative_accuracy
+        self.apply = apply
+
+        self._sketches = {}
+        self._lock = threading.Lock()
+        self._ends_at = time.time() + window
+        self._finished = False
+        self._finishing = False
+        self._timer_pid = None
+        self._timer = None
+
+    @property
+    def recording(self):
+        """
+        `True` while the calibration window is open.
+        """
+
+        return not self._finished
+
+    def saved_buckets(self, group=DEFAULT_GROUP):
+        """
+        Load the buckets recommended in a previous calibration.
+
+        :param group: the group to load the buckets for
+            (defaults to the one for all the requests)
+        :return: the list of buckets or `None` if not available
+        """
+
+        data = load_recommendations(self.filename)
+        if data and group in data['groups']:
+            return data['groups'][group]['buckets']
+
+    def observe(self, group, value):
+        """
+        Record a request latency while the calibration window is open.
+
+        :param group: the group of the request, like its path or endpoint
+        :param value: the latency in seconds
+        """
+
+        if self._finished:
+            return
+
+        if self._timer_pid != os.getpid():
+            # the timers are not inherited by forked processes
+            self._start_timer()
+
+        if time.time() >= self._ends_at:
+            return
+
+        group = str(group)
+
+        with self._lock:
+            sketch = self._sketches.get(group)
+            if sketch is None:
+                sketch = self._sketches[group] = DDSketch(self.relative_accuracy)
+
+            sketch.add(value)
+
+    def _start_timer(self):
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+
+            self._timer_pid = os.getpid()
+
+        self._timer = threading.Timer(max(self._ends_at - time.time(), 0), self.finish)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def finish(self):
+        """
+        Close the calibration window and save the recommendations.
+        This is called automatically by a timer when the window ends.
+        When the file can not be written, the window stays open,
+        and the recommendations are still served on the endpoint.
+
+        :return: `True` if the recommendations were saved
+        """
+
+        with self._lock:
+            if self._finished or self._finishing:
+                return False
+
+            self._finishing = True
+
+        try:
+            data = self.recommendations()
+            data['finished'] = True
+
+            try:
+                write_json(self.filename, data, indent=2, sort_keys=True)
+
+            except (IOError, OSError) as ex:
+                logger.warning('Failed to save the recommended buckets to %s: %s',
+                               self.filename, ex)
+                return False
+
+            self._finished = True
+            return True
+
+        finally:
+            self._finishing = False
+
+    def recommendations(self, current_buckets=None):
+        """
+        Compute the recommended buckets from the latencies recorded so far.
+
+        :param current_buckets: the buckets in use, to compare
+            the quantile estimation errors with
+        :return: a dictionary with the recommendations for each group,
+            and for all the requests together under the `*` key
+        """
+
+        with self._lock:
+            sketches = dict(
+                (group, _copy(sketch)) for group, sketch in self._sketches.items()
+            )
+
+        combined = DDSketch(self.relative_accuracy)
+        for sketch in sketches.values():
+            combined.merge(sketch)
+
+        sketches[DEFAULT_GROUP] = combined
+
+        groups = {}
+
+        for group, sketch in sketches.items():
+            if not sketch.count:
+                continue
+
+            buckets = recommend_buckets(sketch, self.bucket_count)
+            details = {
+                'count': sketch.count,
+                'buckets': buckets,
+                'errors': quantile_errors(sketch, buckets)
+            }
+
+            if current_buckets:
+                details['current_errors'] = quantile_errors(sketch, current_buckets)
+
+            groups[group] = details
+
+        return {
+            'window': self.window, 'bucket_count': self.bucket_count,
+            'created': time.time(), 'finished': self._finished,
+            'groups': groups
+        }
+
+
+def load_recommendations(filename):
+    """
+    Load the recommendations saved by a `BucketCalibration`.
+
+    :param filename: the JSON file the recommendations were saved to
+    :return: the recommendations, or `None` if the file doesn't exist
+    """
+
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename) as source:
+        return json.load(source)
+
+
+def recommend_buckets(sketch, count):
+    """
+    Recommend bucket boundaries for the values in the sketch.
+
+    The boundaries are placed at evenly spaced quantiles, so each bucket
+    holds the same share of the observations. With linear interpolation
+    inside the buckets, like `histogram_quantile` in Prometheus does,
+    this bounds the rank error of any quantile estimate by `1 / count`,
+    which is the lowest bound achievable with `count` buckets.
+
+    :param sketch: the `DDSketch` with the observed values
+    :param count: the number of buckets, not counting `+Inf`
+    :return: the sorted list of bucket boundaries,
+        rounded to two significant digits
+    """
+
+    values = sketch.quantiles([idx / float(count) for idx in range(1, count + 1)])
+
+    buckets = sorted(set(
+        float('%.2g' % value) for value in values if value > 0
+    ))
+
+    # the rounding must not leave the highest values out of the finite buckets
+    if buckets and buckets[-1] < values[-1]:
+        buckets[-1] = _round_up(values[-1])
+
+    return buckets
+
+
+def _round_up(value):
+    factor = 10 ** (math.floor(math.log10(value)) - 1)
+    return float('%.2g' % (math.ceil(value / factor) * factor))
+
+
+def quantile_errors(sketch, buckets, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Estimate the relative errors of `histogram_quantile` with the given
+    buckets, compared to the quantiles estimated by the sketch.
+
+    :param sketch: the `DDSketch` with the observed values
+    :param buckets: the bucket boundaries
+    :param quantiles: the quantiles to check
+    :return: a dictionary of `{quantile: relative_error}`
+    """
+
+    bounds = sorted(float(bound) for bound in buckets if bound != float('inf'))
+    cumulative = _cumulative_counts(sketch, bounds)
+    expected = sketch.quantiles(quantiles)
+
+    errors = {}
+
+    for q, value in zip(quantiles, expected):
+        estimate = _histogram_quantile(q, bounds, cumulative, sketch.count)
+        if value:
+            errors[str(q)] = abs(estimate - value) / value
+        else:
+            errors[str(q)] = 0.0 if estimate == value else float('inf')
+
+    return errors
+
+
+def _cumulative_counts(sketch, bounds):
+    counts = []
+    seen = sketch.zero_count
+    keys = sorted(sketch.bins)
+    position = 0
+
+    for bound in bounds:
+        while position < len(keys) and sketch.bin_value(keys[position]) <= bound:
+            seen += sketch.bins[keys[position]]
+            position += 1
+
+        counts.append(seen)
+
+    return counts
+
+
+def _histogram_quantile(q, bounds, cumulative, total):
+    """
+    The linear interpolation of Prometheus' `histogram_quantile`.
+    """
+
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0
+
+    for bound, count in zip(bounds, cumulative):
+        if count >= rank:
+            if count == lower_count:
+                return bound
+
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+
+        lower_bound, lower_count = bound, count
+
+    # in the `+Inf` bucket, Prometheus returns the highest finite bound
+    return bounds[-1] if bounds else float('nan')
+
+
+def _copy(sketch):
+    copy = DDSketch(sketch.relative_accuracy, sketch.max_bins)
+    copy.merge(sketch)
+    return copy
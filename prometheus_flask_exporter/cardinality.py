@@ -0,0 +1,265 @@
+import heapq
+import threading
+
+_STRUCTURAL_LABELS = frozenset(('le', 'quantile'))
+
+
+class CardinalityExplorer(object):
+    """
+    Reports the number of series of each metric family in a registry,
+    the most frequent values of each of their labels, and the growth
+    of the series counts since the previous report, to find out
+    which label of which metric made the metrics endpoint grow.
+    The growth is reported for the families seen on the previous calls,
+    and the total growth is added up from them only.
+
+    The registry is collected once, like for a scrape, but without
+    rendering the exposition format, and the most frequent label values
+    and the number of different values are estimated with a `HeavyHitters`
+    sketch for each label, in a single pass over the series without sorting them.
+    The `le` and `quantile` labels of histograms and summaries are not listed,
+    their series are counted with the rest of the family.
+    """
+
+    def __init__(self, top_k=10):
+        """
+        Create a new cardinality explorer.
+
+        :param top_k: the number of the most frequent values
+            to list for each label
+        """
+
+        self.top_k = top_k
+
+        self._previous = {}
+        self._lock = threading.Lock()
+
+    def explore(self, registry, top_k=None):
+        """
+        Collect the metrics of the registry and report their cardinality.
+
+        :param registry: the Prometheus Registry to collect
+        :param top_k: the number of the most frequent values to list
+            for each label (defaults to the one given in the constructor)
+        :return: the report as a dictionary, with the families ordered
+            by their number of series
+        """
+
+        top_k = top_k or self.top_k
+        families = []
+
+        for metric in registry.collect():
+            labels = {}
+
+            for sample in metric.samples:
+                for name, value in sample.labels.items():
+                    if name in _STRUCTURAL_LABELS:
+                        continue
+
+                    sketch = labels.get(name)
+                    if sketch is None:
+                        sketch = labels[name] = HeavyHitters(10 * top_k)
+
+                    sketch.add(value)
+
+            families.append({
+                'name': metric.name, 'type': metric.type,
+                'series': len(metric.samples),
+                'labels': dict(
+                    (name, {'distinct': sketch.distinct(), 'top': sketch.top(top_k)})
+                    for name, sketch in labels.items()
+                )
+            })
+
+        # the families left out by a filtered registry keep their previous counts
+        with self._lock:
+            previous = dict(self._previous)
+            self._previous.update(
+                (family['name'], family['series']) for family in families
+            )
+
+        growth = None
+
+        for family in families:
+            if family['name'] in previous:
+                family['growth'] = family['series'] - previous[family['name']]
+                growth = (growth or 0) + family['growth']
+            else:
+                family['growth'] = None  # not seen on the previous calls
+
+        families.sort(key=lambda family: family['series'], reverse=True)
+
+        return {
+            'series': sum(family['series'] for family in families),
+            'growth': growth,
+            'families': families
+        }
+
+
+class HeavyHitters(object):
+    """
+    Estimates the most frequent values of a stream in bounded memory,
+    with the Misra-Gries algorithm: at most `capacity` values are counted,
+    and when a new value doesn't fit, all the counts are decremented,
+    which costs amortized constant time for each value.
+
+    The counts are lower bounds of the real frequencies, and they
+    are exact as long as there are at most `capacity` different values.
+    Any value more frequent than `1 / (capacity + 1)` of the stream is kept.
+    The number of different values is estimated with a `DistinctCounter`.
+    """
+
+    def __init__(self, capacity, distinct_capacity=1024):
+        """
+        Create a new heavy hitters sketch.
+
+        :param capacity: the maximum number of values to count
+        :param distinct_capacity: the number of hashes to keep
+            for estimating the number of different values
+        """
+
+        self.capacity = capacity
+        self.total = 0
+
+        self._counts = {}
+        self._distinct = DistinctCounter(distinct_capacity)
+
+    def add(self, value):
+        """
+        Count a value of the stream.
+
+        :param value: the value to count
+        """
+
+        self.total += 1
+        self._distinct.add(value)
+
+        counts = self._counts
+
+        if value in counts:
+            counts[value] += 1
+
+        elif len(counts) < self.capacity:
+            counts[value] = 1
+
+        else:
+            for key, count in list(counts.items()):
+                if count > 1:
+                    counts[key] = count - 1
+                else:
+                    del counts[key]
+
+    def distinct(self):
+        """
+        :return: the estimated number of different values seen
+        """
+
+        return self._distinct.estimate()
+
+    def top(self, k):
+        """
+        :param k: the number of values to return
+        :return: the list of the `[value, count]` pairs of the most frequent
+            values, in the order of their estimated counts
+        """
+
+        # `capacity` is a small multiple of `k`, this is not sorting the stream
+        return [
+            [value, count]
+            for value, count in sorted(self._counts.items(), key=lambda item: -item[1])[:k]
+        ]
+
+
+class DistinctCounter(object):
+    """
+    Estimates the number of different values of a stream in bounded memory,
+    by keeping the `capacity` smallest hashes of the values (K minimum values):
+    the more different values there are, the closer the largest of them
+    gets to the smallest possible hash.
+
+    The estimate is exact as long as there are at most `capacity`
+    different values, and its relative error is about `1 / sqrt(capacity)`
+    above that, like 3% with the default 1024 hashes.
+    """
+
+    _HASH_RANGE = 1 << 64
+
+    def __init__(self, capacity=1024):
+        """
+        Create a new distinct values counter.
+
+        :param capacity: the number of the smallest hashes to keep
+        """
+
+        self.capacity = capacity
+
+        # a max-heap of the smallest hashes, with the negated hashes
+        self._heap = []
+        self._hashes = set()
+        self._overflowed = False
+        # the largest hash kept, once all the hashes are taken
+        self._largest = self._HASH_RANGE
+
+    def add(self, value):
+        """
+        Count a value of the stream.
+
+        :param value: the hashable value to count
+        """
+
+        if type(value) is str:
+            hashed = hash(value) & _HASH_MASK
+        else:
+            hashed = _mix(hash(value))
+
+        if hashed > self._largest:
+            # a value not kept, most of them are rejected here
+            self._overflowed = True
+            return
+
+        hashes = self._hashes
+
+        if hashed in hashes:
+            return
+
+        heap = self._heap
+
+        if len(hashes) < self.capacity:
+            heapq.heappush(heap, -hashed)
+            hashes.add(hashed)
+
+            if len(hashes) == self.capacity:
+                self._largest = -heap[0]
+
+            return
+
+        # more different values than hashes kept, from now on estimated
+        self._overflowed = True
+
+        hashes.discard(-heapq.heapreplace(heap, -hashed))
+        hashes.add(hashed)
+        self._largest = -heap[0]
+
+    def estimate(self):
+        """
+        :return: the estimated number of different values seen
+        """
+
+        if not self._overflowed:
+            return len(self._hashes)
+
+        largest = float(self._largest + 1) / self._HASH_RANGE
+        return int(round((self.capacity - 1) / largest))
+
+
+_HASH_MASK = (1 << 64) - 1
+
+
+def _mix(hashed):
+    # the 64-bit finalizer of SplitMix64, as the hashes of numbers are
+    # the numbers themselves, far from spread over the whole range
+    # (the hashes of the strings are spread already)
+    hashed &= _HASH_MASK
+    hashed = ((hashed ^ (hashed >> 30)) * 0xBF58476D1CE4E5B9) & _HASH_MASK
+    hashed = ((hashed ^ (hashed >> 27)) * 0x94D049BB133111EB) & _HASH_MASK
+    return hashed ^ (hashed >> 31)
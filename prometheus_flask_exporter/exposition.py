@@ -0,0 +1,158 @@
+import re
+
+_INVALID_METRIC_NAME = re.compile(r'[^a-zA-Z0-9_:]')
+_INVALID_LABEL_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+# the samples of OpenMetrics families exported as separate gauges
+_OPENMETRICS_SUFFIXES = ('_created', '_gsum', '_gcount')
+
+
+class StreamingRenderer(object):
+    """
+    Renders the metrics of a registry in the Prometheus text format,
+    the same way as `generate_latest` does, but as a generator of chunks
+    of at most `chunk_size` lines, so the whole output is never in memory
+    at once, and it can be sent in a streamed response.
+
+    The names and the formatted labels of the samples, the part of the lines
+    before the values, are cached for each metric family, and reused
+    on the next scrapes as long as the family has the same label sets.
+    When most of the cached label sets of a family are not seen anymore,
+    its cache is started over.
+
+    Sample usage:
+
+        renderer = StreamingRenderer()
+        return Response(renderer.render(registry), mimetype=CONTENT_TYPE_LATEST)
+    """
+
+    def __init__(self, chunk_size=1000, label_cache=True):
+        """
+        Create a new streaming renderer.
+
+        :param chunk_size: the maximum number of lines in each chunk
+        :param label_cache: cache the formatted labels between scrapes
+        """
+
+        self.chunk_size = chunk_size
+        self.label_cache = label_cache
+
+        self._caches = {}
+
+    def render(self, registry):
+        """
+        Render the metrics of the registry.
+
+        :param registry: the Prometheus Registry to collect the metrics from
+        :return: the generator of the UTF-8 encoded chunks of the output
+        """
+
+        from prometheus_client.utils import floatToGoString
+
+        chunk_size = self.chunk_size
+        lines = []
+
+        for metric in registry.collect():
+            name, metric_type = _exposed_type(metric)
+
+            documentation = metric.documentation.replace('\\', r'\\').replace('\n', r'\n')
+            lines.append('# HELP %s %s\n' % (name, documentation))
+            lines.append('# TYPE %s %s\n' % (name, metric_type))
+
+            if self.label_cache:
+                cache = self._caches.get(metric.name)
+                if cache is None or len(cache) > 2 * len(metric.samples):
+                    cache = self._caches[metric.name] = {}
+            else:
+                cache = None
+
+            openmetrics_samples = {}
+            label_names = {}
+            openmetrics_names = dict(
+                (metric.name + suffix, suffix) for suffix in _OPENMETRICS_SUFFIXES
+            )
+
+            for sample in metric.samples:
+                if cache is None:
+                    prefix = _line_prefix(sample.name, sample.labels)
+
+                else:
+                    labels = sample.labels
+                    # the tuple of the label names is shared by the keys with the same names
+                    names = tuple(labels)
+                    names = label_names.setdefault(names, names)
+
+                    key = (sample.name, names) + tuple(labels.values())
+
+                    prefix = cache.get(key)
+                    if prefix is None:
+                        prefix = cache[key] = _line_prefix(sample.name, sample.labels)
+
+                if sample.timestamp is not None:
+                    # in milliseconds
+                    line = '%s%s %d\n' % (
+                        prefix, floatToGoString(sample.value), int(float(sample.timestamp) * 1000)
+                    )
+                else:
+                    line = '%s%s\n' % (prefix, floatToGoString(sample.value))
+
+                suffix = openmetrics_names.get(sample.name)
+
+                if suffix:
+                    openmetrics_samples.setdefault(suffix, []).append(line)
+                    continue
+
+                lines.append(line)
+
+                if len(lines) >= chunk_size:
+                    yield ''.join(lines).encode('utf-8')
+                    lines = []
+
+            for suffix, suffix_lines in sorted(openmetrics_samples.items()):
+                suffix_name = _INVALID_METRIC_NAME.sub('_', metric.name + suffix)
+
+                lines.append('# HELP %s %s\n' % (suffix_name, documentation))
+                lines.append('# TYPE %s gauge\n' % suffix_name)
+
+                for line in suffix_lines:
+                    lines.append(line)
+
+                    if len(lines) >= chunk_size:
+                        yield ''.join(lines).encode('utf-8')
+                        lines = []
+
+        if lines:
+            yield ''.join(lines).encode('utf-8')
+
+
+def _exposed_type(metric):
+    name, metric_type = metric.name, metric.type
+
+    # from the OpenMetrics types to the Prometheus format
+    if metric_type == 'counter':
+        name = name + '_total'
+    elif metric_type == 'info':
+        name, metric_type = name + '_info', 'gauge'
+    elif metric_type == 'stateset':
+        metric_type = 'gauge'
+    elif metric_type == 'gaugehistogram':
+        metric_type = 'histogram'
+    elif metric_type == 'unknown':
+        metric_type = 'untyped'
+
+    return _INVALID_METRIC_NAME.sub('_', name), metric_type
+
+
+def _line_prefix(name, labels):
+    name = _INVALID_METRIC_NAME.sub('_', name)
+
+    if not labels:
+        return name + ' '
+
+    return '%s{%s} ' % (name, ','.join(
+        '%s="%s"' % (
+            _INVALID_LABEL_NAME.sub('_', key),
+            value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+        )
+        for key, value in sorted(labels.items())
+    ))
@@ -0,0 +1,71 @@
+import os
+import json
+import threading
+
+
+def multiprocess_directory():
+    """
+    The directory the processes share their metrics in,
+    as set in the `prometheus_multiproc_dir` environment variable.
+
+    :return: the path of the directory, or `None` if it is not set
+        or it does not exist
+    """
+
+    directory = os.environ.get('prometheus_multiproc_dir')
+    if directory and os.path.isdir(directory):
+        return directory
+
+
+def write_atomically(filename, data):
+    """
+    Replace the contents of a file, so that the readers see
+    either the previous or the new contents, never a partial file.
+
+    The temporary file is unique to the process and the thread,
+    so concurrent writers never write into each other's files.
+
+    :param filename: the path of the file
+    :param data: the new contents as bytes
+    """
+
+    temporary = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.current_thread().ident)
+
+    try:
+        with open(temporary, 'wb') as output:
+            output.write(data)
+
+        os.rename(temporary, filename)
+
+    except (IOError, OSError):
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+        raise
+
+
+def write_json(filename, data, **kwargs):
+    """
+    Replace the contents of a file with JSON data atomically.
+
+    :param filename: the path of the file
+    :param data: the data to serialize
+    :param kwargs: the arguments for `json.dumps`, like `indent`
+    """
+
+    write_atomically(filename, json.dumps(data, **kwargs).encode('utf-8'))
+
+
+def read_json(filename):
+    """
+    Load the JSON data of a file written by another process.
+
+    :param filename: the path of the file
+    :return: the data, or `None` if the file is removed or being replaced
+    """
+
+    try:
+        with open(filename) as source:
+            return json.load(source)
+    except (IOError, OSError, ValueError):
+        return None
@@ -0,0 +1,192 @@
+import random
+import threading
+
+from . import _now_ns
+
+FULL = 0
+"""
+All the default metrics are recorded for each request
+"""
+
+SAMPLED = 1
+"""
+The requests are counted, and the latencies of a sample of them are observed
+"""
+
+COUNTERS_ONLY = 2
+"""
+The requests are only counted
+(the requests in progress are tracked at every level)
+"""
+
+
+class OverloadGovernor(object):
+    """
+    Lowers the work done for the default metrics while the application
+    is overloaded, and restores it when the load drops.
+
+    The time spent in the request hooks of the default metrics and
+    the number of requests are added up for windows of `window` seconds.
+    When the share of the wall clock time spent in the hooks exceeds
+    `max_overhead`, or the request rate exceeds `max_request_rate`,
+    the level steps down by one at the end of the window:
+    from `FULL` to `SAMPLED`, where the latencies are only observed
+    for `sample_rate` of the requests, then to `COUNTERS_ONLY`.
+
+    The level steps back up after `recovery_windows` windows in a row
+    where the load would have stayed below `recovery` times the thresholds
+    at the level above, estimated from the cost per request last measured
+    at that level, so that it does not flap between two levels.
+
+    The counters are updated without locking, so a few requests
+    may be missed from a window when the threads race for them.
+
+    Sample usage:
+
+        governor = OverloadGovernor(max_overhead=0.05, max_request_rate=2000)
+        metrics = PrometheusMetrics(app, governor=governor)
+    """
+
+    def __init__(self, max_overhead=0.05, max_request_rate=None, sample_rate=0.1,
+                 window=1.0, recovery=0.5, recovery_windows=5):
+        """
+        Create a new overload governor.
+
+        :param max_overhead: the share of the wall clock time the request hooks
+            may take in a process before stepping down, like `0.05` for 5%
+            (not limited when `None`)
+        :param max_request_rate: the number of requests per second per process
+            to step down above (not limited when `None`)
+        :param sample_rate: the share of the requests to observe the latencies of
+            at the `SAMPLED` level
+        :param window: the number of seconds to measure the load over
+        :param recovery: the share of the thresholds the load has to stay
+            below to step back up
+        :param recovery_windows: the number of windows in a row the load has to
+            stay low for to step back up
+        """
+
+        if max_overhead is None and max_request_rate is None:
+            raise ValueError('Either the maximum overhead or request rate has to be set')
+
+        if not 0 < sample_rate <= 1:
+            raise ValueError('The sample rate has to be between 0 and 1: %s' % sample_rate)
+
+        self.max_overhead = max_overhead
+        self.max_request_rate = max_request_rate
+        self.sample_rate = sample_rate
+        self.window = window
+        self.recovery = recovery
+        self.recovery_windows = recovery_windows
+
+        self.level = FULL
+
+        # the last measured overhead per request in nanoseconds, for each level
+        self._costs = [None, None, None]
+        self._calm_windows = 0
+        self._gauge = None
+
+        self._lock = threading.Lock()
+        self._window_ns = int(window * 1e9)
+        self._window_start = _now_ns()
+        self._requests = 0
+        self._overhead = 0
+
+    def attach(self, gauge):
+        """
+        Export the current level with a Gauge.
+
+        :param gauge: the Gauge to set to the level when it changes
+        """
+
+        self._gauge = gauge
+        gauge.set(self.level)
+
+    def sample(self):
+        """
+        Decide whether to observe the latencies of the current request.
+
+        :return: `True` if the latencies should be observed at the current level
+        """
+
+        level = self.level
+
+        if level == FULL:
+            return True
+        elif level == SAMPLED:
+            return random.random() < self.sample_rate
+        else:
+            return False
+
+    def record(self, overhead_ns, now_ns):
+        """
+        Add a request to the current window, and change the level
+        when the window is over.
+
+        :param overhead_ns: the time spent in the request hooks in nanoseconds
+        :param now_ns: the current time from `perf_counter_ns`
+        """
+
+        self._requests += 1
+        self._overhead += overhead_ns
+
+        if now_ns - self._window_start >= self._window_ns:
+            # only one of the threads evaluates the window
+            if self._lock.acquire(False):
+                try:
+                    if now_ns - self._window_start >= self._window_ns:
+                        self._evaluate(now_ns)
+                finally:
+                    self._lock.release()
+
+    def _evaluate(self, now_ns):
+        elapsed = now_ns - self._window_start
+        requests, overhead = self._requests, self._overhead
+
+        self._window_start, self._requests, self._overhead = now_ns, 0, 0
+
+        level = self.level
+
+        if requests:
+            self._costs[level] = float(overhead) / requests
+
+        if self._overloaded(requests, overhead, elapsed, 1.0):
+            self._calm_windows = 0
+
+            if level < COUNTERS_ONLY:
+                self._change(level + 1)
+
+            return
+
+        if level == FULL:
+            return
+
+        # the load of the same requests with the cost of the level above
+        cost = self._costs[level - 1]
+        if cost is not None:
+            overhead = cost * requests
+
+        if self._overloaded(requests, overhead, elapsed, self.recovery):
+            self._calm_windows = 0
+            return
+
+        self._calm_windows += 1
+
+        if self._calm_windows >= self.recovery_windows:
+            self._calm_windows = 0
+            self._change(level - 1)
+
+    def _overloaded(self, requests, overhead, elapsed, share):
+        if self.max_overhead is not None and overhead > self.max_overhead * share * elapsed:
+            return True
+
+        if self.max_request_rate is not None:
+            return requests * 1e9 > self.max_request_rate * share * elapsed
+
+        return False
+
+    def _change(self, level):
+        self.level = level
+
+        if self._gauge is not None:
+            self._gauge.set(level)
@@ -0,0 +1,95 @@
+import time
+import threading
+from array import array
+from bisect import bisect_left
+
+from prometheus_client import Histogram
+from prometheus_client import values
+
+
+class FastHistogram(Histogram):
+    """
+    A `prometheus_client` Histogram that finds the bucket of an observation
+    with a binary search over the upper bounds, and keeps the counts of
+    each child in a single `array('d')`, rather than in one value object
+    (each with its own lock) per bucket.
+
+    The exposition output is the same as the one of the original Histogram,
+    though exemplars are not supported.
+    In multiprocess mode, it falls back to the original implementation
+    backed by the memory-mapped files.
+    """
+
+    _counts = None
+
+    def _metric_init(self):
+        if getattr(values.ValueClass, '_multiprocess', False):
+            return super(FastHistogram, self)._metric_init()
+
+        bounds = len(self._upper_bounds)
+
+        # the counts of each bucket, followed by the sum of the observations
+        self._counts = array('d', [0.0]) * (bounds + 1)
+        self._counts_lock = threading.Lock()
+        self._buckets = _ArraySlots(self._counts)
+        self._sum = _ArraySlot(self._counts, bounds)
+
+        # read by the `_child_samples` of `Histogram`
+        self._created = time.time()
+
+    def observe(self, amount, exemplar=None):
+        """
+        Observe the given amount.
+        Exemplars are ignored, unless in multiprocess mode.
+        """
+
+        counts = self._counts
+
+        if counts is None:
+            # multiprocess mode, or not a child metric
+            if exemplar is not None:
+                return super(FastHistogram, self).observe(amount, exemplar)
+            else:
+                return super(FastHistogram, self).observe(amount)
+
+        if amount != amount:
+            # NaN is not less than or equal to any of the upper bounds
+            with self._counts_lock:
+                counts[-1] += amount
+            return
+
+        index = bisect_left(self._upper_bounds, amount)
+
+        with self._counts_lock:
+            counts[index] += 1
+            counts[-1] += amount
+
+
+class _ArraySlot(object):
+    __slots__ = ('_counts', '_index')
+
+    def __init__(self, counts, index):
+        self._counts = counts
+        self._index = index
+
+    def get(self):
+        return self._counts[self._index]
+
+    def set(self, value):
+        self._counts[self._index] = value
+
+    def get_exemplar(self):
+        return None
+
+
+class _ArraySlots(object):
+    __slots__ = ('_counts',)
+
+    def __init__(self, counts):
+        self._counts = counts
+
+    def __getitem__(self, index):
+        return _ArraySlot(self._counts, index)
+
+    def __len__(self):
+        return len(self._counts) - 1
@@ -0,0 +1,113 @@
+from . import _compile_path_matcher
+
+METRIC_TYPES = ('histogram', 'summary', 'sketch', 'counter', 'gauge')
+"""
+The types of the metrics an `InstrumentationPolicy` can choose for the views
+"""
+
+
+class InstrumentationPolicy(object):
+    """
+    Chooses the metrics to track the views of an application or blueprint with,
+    for `PrometheusMetrics.instrument`, instead of decorating each view.
+
+    Each type of metric is a single metric family for all the views
+    instrumented with the policy, labelled with the `endpoint`
+    and the optional `labels`, rather than one family for each view.
+    The metrics are named after the `prefix`:
+
+        - `histogram`: `<prefix>_duration_seconds`
+        - `summary`: `<prefix>_duration_summary_seconds`
+        - `sketch`: `<prefix>_duration_quantiles_seconds`
+        - `counter`: `<prefix>_invocations_total`
+        - `gauge`: `<prefix>_in_progress`
+
+    The views are matched by their endpoint name, or by any of their URL rules,
+    with glob patterns or compiled regular expressions (matched from the start,
+    with their flags, like `re.IGNORECASE`).
+
+    Sample usage:
+
+        policy = InstrumentationPolicy(
+            metrics=('histogram', 'counter'),
+            labels={'status': lambda r: r.status_code},
+            exclude=['health', '/internal/*'],
+            overrides=[('admin.*', ('counter',))]
+        )
+
+        metrics.instrument(app, policy)
+    """
+
+    def __init__(self, metrics=('histogram',), prefix='flask_view', labels=None,
+                 exclude=None, overrides=None, buckets=None):
+        """
+        Create a new instrumentation policy.
+
+        :param metrics: the types of the metrics to track the views with,
+            any of `histogram`, `summary`, `sketch`, `counter` and `gauge`
+        :param prefix: the prefix of the names of the metrics
+        :param labels: a dictionary of `{labelname: callable_or_value}`
+            for additional labels, like for the decorators
+        :param exclude: the endpoint names or URL rules of the views
+            not to instrument, as glob patterns or compiled regular expressions
+        :param overrides: the ordered list of `(pattern, metrics)` pairs
+            to track the matching views with other types of metrics,
+            the first matching pattern wins
+        :param buckets: the buckets of the Histogram (optional)
+        """
+
+        if labels is not None and not isinstance(labels, dict):
+            raise TypeError('labels needs to be a dictionary of {labelname: callable}')
+
+        overrides = [
+            (_compile_path_matcher([pattern], literal_prefixes=False), tuple(types))
+            for pattern, types in overrides or ()
+        ]
+
+        for types in [tuple(metrics)] + [types for _, types in overrides]:
+            for metric_type in types:
+                if metric_type not in METRIC_TYPES:
+                    raise ValueError('Unknown metric type: %s' % metric_type)
+
+        self.metrics = tuple(metrics)
+        self.prefix = prefix
+        self.labels = labels or {}
+        self.buckets = buckets
+
+        self._exclude = _compile_path_matcher(exclude, literal_prefixes=False)
+        self._overrides = overrides
+
+    def metrics_for(self, endpoint, rules=()):
+        """
+        Choose the types of the metrics to track a view with.
+
+        :param endpoint: the endpoint name of the view
+        :param rules: the URL rules of the view
+        :return: the tuple of the metric types, empty if the view is excluded
+        """
+
+        names = (endpoint,) + tuple(rules)
+
+        if self._exclude and any(self._exclude(name) for name in names):
+            return ()
+
+        for matcher, types in self._overrides:
+            if any(matcher(name) for name in names):
+                return types
+
+        return self.metrics
+
+    def used_metrics(self):
+        """
+        :return: the types of the metrics any of the views may be tracked with
+        """
+
+        used = list(self.metrics)
+
+        for _, types in self._overrides:
+            for metric_type in types:
+                if metric_type not in used:
+                    used.append(metric_type)
+
+        return tuple(used)
+
@@ -1,12 +1,23 @@
 import os
+import json
+import time
+import logging
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 
+from flask import request, current_app
 from prometheus_client import CollectorRegistry
 from prometheus_client import start_http_server as pc_start_http_server
+from prometheus_client.core import Metric
 from prometheus_client.multiprocess import MultiProcessCollector
 from prometheus_client.multiprocess import mark_process_dead as pc_mark_process_dead
 
 from . import PrometheusMetrics
+from .files import write_atomically
+from .sketch import SketchMultiProcessCollector
+
+logger = logging.getLogger(__name__)
 
 
 def _check_multiproc_env_var():
@@ -65,6 +76,7 @@ class MultiprocessPrometheusMetrics(PrometheusMetrics):
 
         registry = registry or CollectorRegistry()
         MultiProcessCollector(registry)
+        SketchMultiProcessCollector(registry)
 
         super(MultiprocessPrometheusMetrics, self).__init__(
             app=app, path=None, export_defaults=export_defaults,
@@ -105,12 +117,333 @@ class UWsgiPrometheusMetrics(MultiprocessPrometheusMetrics):
     A multiprocess `PrometheusMetrics` extension targeting uWSGI deployments.
     This will only start the HTTP server for metrics on the main process,
     indicated by `uwsgi.masterpid()`.
+
+    With `aggregate=True` the workers don't need the `prometheus_multiproc_dir`
+    directory, they keep their metrics in memory instead, and periodically
+    push the batched changes to a uWSGI mule, that keeps the aggregated values
+    and serves them on its own HTTP server. The mule should run:
+
+        from prometheus_flask_exporter.multiprocess import UWsgiPrometheusMetrics
+
+        UWsgiPrometheusMetrics.run_aggregator(metrics_port)
+
+    This mode needs threads enabled in uWSGI (`--enable-threads`)
+    and a mule configured (for example `--mule=metrics_mule.py`).
     """
 
+    def __init__(self, app=None, export_defaults=True,
+                 defaults_prefix='flask', group_by='path',
+                 buckets=None, registry=None,
+                 aggregate=False, flush_interval=1.0, mule=1):
+        """
+        Create a new uWSGI-aware Prometheus metrics export configuration.
+
+        :param aggregate: push the metrics to a uWSGI mule for aggregation
+            rather than using the `prometheus_multiproc_dir` files
+        :param flush_interval: the number of seconds between pushing
+            the metric changes to the mule (only with `aggregate=True`)
+        :param mule: the ID of the mule running the aggregator
+            (only with `aggregate=True`)
+
+        See `MultiprocessPrometheusMetrics` for the rest of the parameters.
+        """
+
+        self.aggregate = aggregate
+
+        if aggregate:
+            registry = registry or CollectorRegistry()
+            self._pusher = _UWsgiDeltaPusher(registry, flush_interval, mule)
+
+            # skip the multiprocess directory setup of the parent class
+            super(MultiprocessPrometheusMetrics, self).__init__(
+                app=app, path=None, export_defaults=export_defaults,
+                defaults_prefix=defaults_prefix, group_by=group_by,
+                buckets=buckets, registry=registry
+            )
+
+        else:
+            super(UWsgiPrometheusMetrics, self).__init__(
+                app=app, export_defaults=export_defaults,
+                defaults_prefix=defaults_prefix, group_by=group_by,
+                buckets=buckets, registry=registry
+            )
+
+        self._register_uwsgi_atexit()
+
+    def init_app(self, app):
+        super(UWsgiPrometheusMetrics, self).init_app(app)
+
+        if self.aggregate:
+            # start pushing from the worker processes on their first request
+            app.before_request(self._pusher.start)
+
     def should_start_http_server(self):
+        if self.aggregate:
+            # the mule serves the metrics with `run_aggregator`
+            return False
+
         import uwsgi
         return os.getpid() == uwsgi.masterpid()
 
+    def flush(self):
+        """
+        Push the metric changes since the last flush to the aggregator mule.
+        This happens periodically in the background with `aggregate=True`.
+        """
+
+        if self.aggregate:
+            self._pusher.flush()
+
+    def _register_uwsgi_atexit(self):
+        try:
+            import uwsgi
+        except ImportError:
+            return  # not running in uWSGI
+
+        previous = getattr(uwsgi, 'atexit', None)
+
+        def on_exit():
+            if self.aggregate:
+                self._pusher.stop()
+            else:
+                pc_mark_process_dead(os.getpid())
+
+            if previous:
+                previous()
+
+        uwsgi.atexit = on_exit
+
+    @classmethod
+    def run_aggregator(cls, port, host='0.0.0.0', registry=None):
+        """
+        Start the HTTP server for the aggregated metrics, then keep receiving
+        the metric changes from the workers. This is expected to be called
+        from the uWSGI mule, and it does not return.
+
+        :param port: the HTTP port to expose the metrics endpoint on
+        :param host: the HTTP host to listen on (default: `0.0.0.0`)
+        :param registry: the Prometheus Registry to register
+            the aggregated metrics with (defaults to a new one)
+        """
+
+        import uwsgi
+
+        registry = registry or CollectorRegistry()
+        aggregator = UWsgiMetricsAggregator()
+        registry.register(aggregator)
+
+        pc_start_http_server(port, host, registry=registry)
+
+        while True:
+            aggregator.receive(uwsgi.mule_get_msg())
+
+
+class UWsgiMetricsAggregator(object):
+    """
+    A Prometheus collector that sums up the metric changes
+    pushed by `UWsgiPrometheusMetrics` workers with `aggregate=True`.
+
+    Counters, histograms and summaries are added up across the workers,
+    everything else (like gauges) is kept for each worker process
+    with an additional `pid` label, until that process exits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = OrderedDict()
+
+    def receive(self, message):
+        """
+        Process a message from a worker.
+
+        :param message: the encoded message as sent by the worker
+        """
+
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+
+        data = json.loads(message)
+        pid = str(data['pid'])
+
+        with self._lock:
+            for name, metric_type, documentation, samples in data.get('families', []):
+                family = self._families.get(name)
+                if family is None:
+                    family = self._families[name] = (metric_type, documentation, OrderedDict())
+
+                values = family[2]
+                cumulative = metric_type in _CUMULATIVE_TYPES
+
+                for sample_name, labels, value in samples:
+                    if not cumulative:
+                        labels = labels + [['pid', pid]]
+
+                    key = (sample_name, tuple(tuple(label) for label in labels))
+
+                    if cumulative:
+                        values[key] = values.get(key, 0.0) + value
+                    else:
+                        values[key] = value
+
+            # after the last changes of the process, that may include its gauges
+            if data.get('exit'):
+                self._remove_process(pid)
+
+    def _remove_process(self, pid):
+        for metric_type, _, values in self._families.values():
+            if metric_type in _CUMULATIVE_TYPES:
+                continue
+
+            for key in [key for key in values if ('pid', pid) in key[1]]:
+                del values[key]
+
+    def collect(self):
+        with self._lock:
+            families = [
+                (name, metric_type, documentation, list(values.items()))
+                for name, (metric_type, documentation, values) in self._families.items()
+            ]
+
+        for name, metric_type, documentation, samples in families:
+            metric = Metric(name, documentation, metric_type)
+            for (sample_name, labels), value in samples:
+                metric.add_sample(sample_name, dict(labels), value)
+
+            yield metric
+
+
+_CUMULATIVE_TYPES = ('counter', 'histogram', 'summary')
+
+
+class _UWsgiDeltaPusher(object):
+    """
+    Collects the local registry of a uWSGI worker periodically,
+    and sends the changes since the previous collection to the mule
+    in messages of limited size, below the default `--mule-msg-size`.
+    The values are only taken as sent once their message is, so the changes
+    that failed to send are sent again with the next collection.
+    """
+
+    max_message_size = 32 * 1024
+
+    def __init__(self, registry, interval, mule):
+        self.registry = registry
+        self.interval = interval
+        self.mule = mule
+
+        self._pid = None
+        self._previous = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # values inherited from the parent process are not ours to push
+            self._pid = os.getpid()
+            self._previous = {}
+            self._stopped = threading.Event()
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush(exiting=True)
+
+    def _run(self):
+        stopped = self._stopped
+
+        while not stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                # try again on the next round, rather than stopping the thread
+                logger.exception('Failed to send the metrics to the mule %s', self.mule)
+
+    def flush(self, exiting=False):
+        import uwsgi
+
+        with self._lock:
+            current = {}
+
+            for message, values in self._messages(current, exiting):
+                uwsgi.mule_msg(message, self.mule)
+                self._previous.update(values)
+
+            # also forgets the samples removed from the registry
+            self._previous = current
+
+    def _messages(self, current, exiting):
+        pid = os.getpid()
+        families = []
+
+        for metric in self.registry.collect():
+            cumulative = metric.type in _CUMULATIVE_TYPES
+            changes = []
+
+            for sample in metric.samples:
+                sample_name, labels, value = sample[0], sample[1], sample[2]
+                if sample_name.endswith('_created'):
+                    continue
+
+                labels = sorted(labels.items())
+                key = (sample_name, tuple(labels))
+                current[key] = value
+
+                previous = self._previous.get(key)
+
+                if cumulative:
+                    if value != (previous or 0.0):
+                        changes.append((key, (sample_name, labels, value - (previous or 0.0))))
+
+                elif value != previous:
+                    changes.append((key, (sample_name, labels, value)))
+
+            if changes:
+                families.append((metric.name, metric.type, metric.documentation, changes))
+
+        # the values of the samples in the batch, taken as sent with it
+        batch, values, size = [], {}, 0
+
+        for name, metric_type, documentation, changes in families:
+            header_size = len(json.dumps((name, metric_type, documentation, [])))
+            part = None
+
+            # the samples of large families are split across the messages
+            for key, change in changes:
+                change_size = len(json.dumps(change)) + 1
+
+                if part is None or size + change_size > self.max_message_size:
+                    if batch and size + header_size + change_size > self.max_message_size:
+                        yield self._encode(pid, batch), values
+                        batch, values, size = [], {}, 0
+
+                    part = []
+                    batch.append((name, metric_type, documentation, part))
+                    size += header_size
+
+                part.append(change)
+                values[key] = current[key]
+                size += change_size
+
+        if batch or exiting:
+            yield self._encode(pid, batch, exiting), values
+
+    @staticmethod
+    def _encode(pid, families, exiting=False):
+        data = {'pid': pid, 'families': families}
+        if exiting:
+            data['exit'] = True
+
+        return json.dumps(data).encode('utf-8')
+
 
 class GunicornPrometheusMetrics(MultiprocessPrometheusMetrics):
     """
@@ -186,11 +519,31 @@ class GunicornInternalPrometheusMetrics(GunicornPrometheusMetrics):
             GunicornInternalPrometheusMetrics.mark_process_dead_on_child_exit(worker.pid)
 
     Alternatively, you can use the instance functions as well.
+
+    With `snapshot_interval` set, the metrics endpoint serves a snapshot
+    of the metrics of all the processes, that one of the workers renders
+    periodically in a background thread, so scrapes don't have to wait
+    for merging the files of every process while holding a worker.
     """
 
     def __init__(self, app=None, path='/metrics', export_defaults=True,
                  defaults_prefix='flask', group_by='path',
-                 buckets=None, registry=None):
+                 buckets=None, registry=None,
+                 snapshot_interval=None, max_concurrent_renders=1):
+        """
+        Create a new Gunicorn-aware Prometheus metrics export configuration,
+        serving the metrics endpoint on the application.
+
+        :param path: the metrics path (defaults to `/metrics`)
+        :param snapshot_interval: the number of seconds between rendering
+            the snapshot served on the metrics endpoint (disabled when `None`)
+        :param max_concurrent_renders: the number of scrapes a worker renders
+            the metrics for at the same time, when the snapshot is not available
+            or when only some of the metrics are requested (only with
+            `snapshot_interval`), other scrapes get a `503` response
+
+        See `MultiprocessPrometheusMetrics` for the rest of the parameters.
+        """
 
         super(GunicornInternalPrometheusMetrics, self).__init__(
             app=app, export_defaults=export_defaults,
@@ -198,8 +551,58 @@ class GunicornInternalPrometheusMetrics(GunicornPrometheusMetrics):
             buckets=buckets, registry=registry
         )
 
+        if snapshot_interval:
+            self._snapshot = _ScrapeSnapshot(
+                os.environ['prometheus_multiproc_dir'],
+                snapshot_interval, max_concurrent_renders
+            )
+        else:
+            self._snapshot = None
+
         self.register_endpoint(path)
 
+    def register_endpoint(self, path, app=None):
+        """
+        Register the metrics endpoint on the Flask application,
+        serving the snapshot of the metrics with `snapshot_interval` set.
+
+        :param path: the path of the endpoint
+        :param app: the Flask application to register the endpoint on
+            (by default it is the application registered with this class)
+        """
+
+        if self._snapshot is None:
+            return super(GunicornInternalPrometheusMetrics, self).register_endpoint(path, app)
+
+        from prometheus_client import CONTENT_TYPE_LATEST
+        from werkzeug.serving import is_running_from_reloader
+
+        if is_running_from_reloader() and not os.environ.get('DEBUG_METRICS'):
+            return
+
+        if app is None:
+            app = self.app or current_app
+
+        snapshot = self._snapshot
+
+        # start the background thread in the worker processes on their first request
+        app.before_request(snapshot.start)
+
+        @app.route(path)
+        @self.do_not_track()
+        def prometheus_metrics():
+            self.create_deferred_metrics()
+
+            if 'name[]' in request.args:
+                data = snapshot.render(request.args.getlist('name[]'))
+            else:
+                data = snapshot.serve()
+
+            if data is None:
+                return 'Too many concurrent scrapes', 503, {'Retry-After': '1'}
+
+            return data, 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
     def should_start_http_server(self):
         return False
 
@@ -212,3 +615,148 @@ class GunicornInternalPrometheusMetrics(GunicornPrometheusMetrics):
             'Maybe you are looking for the `GunicornPrometheusMetrics` class?',
             UserWarning
         )
+
+
+class _ScrapeSnapshot(object):
+    """
+    Keeps the rendered metrics of all the processes in a file of the
+    multiprocess directory, refreshed periodically by a background thread
+    in one of the workers, elected with an exclusive lock on another file.
+    The snapshot is served even when it is stale, while it is refreshed,
+    until it is older than `max_age_intervals` intervals, when the refreshing
+    process is probably stuck, then the metrics are rendered on demand.
+    """
+
+    max_age_intervals = 3
+
+    def __init__(self, directory, interval, max_concurrent_renders):
+        self.filename = os.path.join(directory, 'scrape_snapshot.prom')
+        self.lock_filename = os.path.join(directory, 'scrape_snapshot.lock')
+        self.interval = interval
+
+        self._renders = threading.BoundedSemaphore(max_concurrent_renders)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._stale = threading.Event()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # the election lock is not inherited from the parent process
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._stale = threading.Event()
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        stale = self._stale
+
+        while True:
+            self._try_refresh()
+
+            stale.wait(self.interval)
+            stale.clear()
+
+    def _try_refresh(self):
+        try:
+            if self.elect():
+                self.refresh()
+        except Exception:
+            # try again on the next round, rather than stopping the thread
+            logger.exception('Failed to refresh the metrics snapshot in %s', self.filename)
+
+    def elect(self):
+        """
+        Try to become the process refreshing the snapshot.
+        The lock is kept until the process exits, then another one takes over.
+
+        :return: `True` if this process refreshes the snapshot
+        """
+
+        import fcntl
+
+        if self._lock_file is not None:
+            return True
+
+        lock_file = open(self.lock_filename, 'a')
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        return True
+
+    def refresh(self):
+        """
+        Render the metrics of all the processes into the snapshot file.
+        """
+
+        write_atomically(self.filename, _render_multiprocess())
+
+    def serve(self):
+        """
+        Load the snapshot, or render the metrics if there is no snapshot yet,
+        or if it has not been refreshed for `max_age_intervals` intervals.
+
+        :return: the metrics in the text format, or `None` when
+            the maximum number of concurrent renders is reached
+        """
+
+        try:
+            with open(self.filename, 'rb') as source:
+                age = time.time() - os.fstat(source.fileno()).st_mtime
+
+                if age > self.interval:
+                    # serve it as it is, but refresh it now if this is the elected process
+                    self._stale.set()
+
+                if age <= self.interval * self.max_age_intervals:
+                    return source.read()
+
+        except (IOError, OSError):
+            pass  # there is no snapshot yet
+
+        return self.render()
+
+    def render(self, names=None):
+        """
+        Render the metrics of all the processes, while limiting
+        the number of renders in progress at the same time.
+
+        :param names: the names of the metrics to render (optional)
+        :return: the metrics in the text format, or `None` when
+            the maximum number of concurrent renders is reached
+        """
+
+        if not self._renders.acquire(False):
+            return None
+
+        try:
+            return _render_multiprocess(names)
+        finally:
+            self._renders.release()
+
+
+def _render_multiprocess(names=None):
+    from prometheus_client import generate_latest
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    SketchMultiProcessCollector(registry)
+
+    if names:
+        registry = registry.restricted_registry(names)
+
+    return generate_latest(registry)
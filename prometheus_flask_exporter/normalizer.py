@@ -0,0 +1,139 @@
+import re
+
+UUID_SEGMENTS = (
+    r'(?<=/)[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)',
+    '<uuid>'
+)
+"""
+Rewrites path segments that are UUIDs to `<uuid>`
+"""
+
+NUMERIC_SEGMENTS = (r'(?<=/)[0-9]+(?=/|$)', '<int>')
+"""
+Rewrites path segments that are numbers to `<int>`
+"""
+
+HEX_SEGMENTS = (r'(?<=/)[0-9a-fA-F]{16,}(?=/|$)', '<hex>')
+"""
+Rewrites path segments of at least 16 hexadecimal digits, like hashes, to `<hex>`
+"""
+
+_SEGMENT_START = '(?<=/)'
+_SEGMENT_END = '(?=/|$)'
+
+DEFAULT_RULES = (UUID_SEGMENTS, NUMERIC_SEGMENTS, HEX_SEGMENTS)
+"""
+The rules of a `PathNormalizer` by default
+"""
+
+
+class PathNormalizer(object):
+    """
+    Rewrites the parts of request paths matching the given rules,
+    so the paths with the same structure are grouped together,
+    even for requests that don't match any URL rule, like 404 responses.
+
+    The rules are compiled into a single regular expression,
+    so each path is scanned only once, and where more rules match
+    at the same position, the one given first wins.
+    When all the rules match within a single path segment, starting with
+    `(?<=/)` and ending with `(?=/|$)` like the predefined ones, the rules
+    are only tried after the slashes, which makes the scan about twice as fast.
+    The normalized paths are kept in a bounded cache.
+
+    Sample usage:
+
+        normalizer = PathNormalizer(DEFAULT_RULES + ((r'(?<=/users/)[^/]+', '<user>'),))
+        metrics = PrometheusMetrics(app, path_normalizer=normalizer)
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, cache_size=10000):
+        """
+        Create a new path normalizer.
+
+        :param rules: the ordered list of `(pattern, replacement)` rules,
+            the patterns are regular expressions, as strings or compiled
+            with `re.compile` (without flags or backreferences),
+            and the replacements are plain strings
+        :param cache_size: the maximum number of paths to remember
+            the normalized form of (disabled when `0`)
+        """
+
+        patterns = [
+            pattern.pattern if hasattr(pattern, 'pattern') else pattern
+            for pattern, _ in rules
+        ]
+
+        segments = all(
+            pattern.startswith(_SEGMENT_START) and pattern.endswith(_SEGMENT_END)
+            for pattern in patterns
+        )
+
+        if segments:
+            # match the slash before the segment, rather than looking behind
+            # for it at every position, and check the end of the segment once
+            patterns = [
+                pattern[len(_SEGMENT_START):-len(_SEGMENT_END)] for pattern in patterns
+            ]
+
+        expressions, replacements = [], {}
+        group_count = 0
+
+        for pattern, (_, replacement) in zip(patterns, rules):
+            # the group wrapping the rule is followed by the groups of the pattern itself
+            replacements[group_count + 1] = '/' + replacement if segments else replacement
+            group_count += 1 + re.compile(pattern).groups
+
+            expressions.append('(%s)' % pattern)
+
+        if not expressions:
+            self._regex = None
+        elif segments:
+            self._regex = re.compile('/(?:%s)%s' % ('|'.join(expressions), _SEGMENT_END))
+        else:
+            self._regex = re.compile('|'.join(expressions))
+
+        self._replacements = replacements
+
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __call__(self, path):
+        """
+        Normalize a request path.
+
+        :param path: the path of the request
+        :return: the path with the matching parts rewritten
+        """
+
+        normalized = self._cache.get(path)
+
+        if normalized is None:
+            normalized = self.normalize(path)
+
+            if self.cache_size:
+                cache = self._cache
+                if len(cache) >= self.cache_size:
+                    # start over, rather than tracking the usage of each path
+                    cache.clear()
+
+                cache[path] = normalized
+
+        return normalized
+
+    def normalize(self, path):
+        """
+        Normalize a request path, without using the cache.
+
+        :param path: the path of the request
+        :return: the path with the matching parts rewritten
+        """
+
+        if self._regex is None:
+            return path
+
+        return self._regex.sub(self._replace, path)
+
+    def _replace(self, match):
+        # the group wrapping the matching rule is the last one to close
+        return self._replacements[match.lastindex]
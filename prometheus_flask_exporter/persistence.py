@@ -0,0 +1,252 @@
+import os
+import sys
+import atexit
+import struct
+import threading
+from array import array
+
+from .files import multiprocess_directory, write_atomically
+
+_MAGIC = b'PFEX'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBIII')
+
+
+class PersistentState(object):
+    """
+    Saves the values of the default request Counter and latency Histogram
+    into a file periodically and when the process exits, and restores them
+    into the same series on the next start, so that restarts of
+    single-process deployments don't reset them.
+
+    The file has a compact binary format: the label values are stored once
+    in a string table, and the values of all the series are stored in a single
+    array of doubles, so loading it takes a few reads and no parsing per series.
+
+    If the bucket boundaries of the Histogram change between the restarts,
+    only the Counter is restored.
+    This is not supported in multiprocess mode, where attaching it
+    raises a `ValueError`.
+
+    Sample usage:
+
+        state = PersistentState('/var/lib/app/metrics.state', interval=60)
+        metrics = PrometheusMetrics(app, persistent_state=state)
+    """
+
+    def __init__(self, filename, interval=60):
+        """
+        Create a new persistent state for the default metrics.
+
+        :param filename: the file to save the values into
+        :param interval: the number of seconds between saving the values
+            (saved only when the process exits if `None`)
+        """
+
+        self.filename = filename
+        self.interval = interval
+
+        self._series_table = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def attach(self, series_table):
+        """
+        Restore the saved values into the series of the default metrics,
+        then start saving them periodically and when the process exits.
+
+        :param series_table: the `SeriesTable` of the default metrics
+        :return: the number of series restored
+        """
+
+        if multiprocess_directory():
+            # each process would restore and overwrite the same values
+            raise ValueError('The persistent state is not supported in multiprocess mode')
+
+        restored = self.restore(series_table)
+
+        self._series_table = series_table
+        atexit.register(self.save)
+
+        if self.interval:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+        return restored
+
+    def stop(self):
+        """
+        Stop saving the values, periodically and when the process exits.
+        """
+
+        self._stopped.set()
+
+        if hasattr(atexit, 'unregister'):
+            atexit.unregister(self.save)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """
+        Save the current values of the default metrics atomically.
+        """
+
+        if self._series_table is None:
+            return
+
+        data = dump(self._series_table)
+
+        with self._lock:
+            write_atomically(self.filename, data)
+
+    def restore(self, series_table):
+        """
+        Load the saved values into the series of the default metrics.
+
+        :param series_table: the `SeriesTable` of the default metrics
+        :return: the number of series restored
+        """
+
+        if not os.path.isfile(self.filename):
+            return 0
+
+        with open(self.filename, 'rb') as source:
+            return load(source.read(), series_table)
+
+
+def dump(series_table):
+    """
+    Encode the values of the default metrics in the compact binary format.
+
+    :param series_table: the `SeriesTable` of the default metrics
+    :return: the encoded values
+    """
+
+    bounds = array('d', series_table.histogram._upper_bounds)
+
+    strings, string_indexes = [], {}
+    keys, values = array('I'), array('d')
+
+    for (method, group, status), series in series_table.items():
+        status = str(status)
+
+        if '\0' in method or '\0' in group:
+            continue  # the separator of the string table
+
+        for value in (method, group, status):
+            if value not in string_indexes:
+                string_indexes[value] = len(strings)
+                strings.append(value)
+
+        keys.extend((string_indexes[method], string_indexes[group], string_indexes[status]))
+
+        values.append(series.counter._value.get())
+        values.append(series.histogram._sum.get())
+        values.extend(bucket.get() for bucket in _buckets(series.histogram))
+
+    blob = '\0'.join(strings).encode('utf-8')
+
+    if sys.byteorder == 'big':
+        for data in (bounds, keys, values):
+            data.byteswap()
+
+    return b''.join((
+        _HEADER.pack(_MAGIC, _VERSION, len(bounds), len(keys) // 3, len(blob)),
+        _to_bytes(bounds), blob, _to_bytes(keys), _to_bytes(values)
+    ))
+
+
+def load(data, series_table):
+    """
+    Decode the values of the default metrics from the compact binary format
+    and set them on the series of the default metrics.
+
+    :param data: the encoded values
+    :param series_table: the `SeriesTable` of the default metrics
+    :return: the number of series restored
+    """
+
+    bounds, strings, keys, values = decode(data)
+    series_count = len(keys) // 3
+    width = 2 + len(bounds)
+
+    same_buckets = list(bounds) == list(series_table.histogram._upper_bounds)
+
+    for idx in range(series_count):
+        series = series_table.get(
+            strings[keys[3 * idx]], strings[keys[3 * idx + 1]], strings[keys[3 * idx + 2]]
+        )
+
+        offset = width * idx
+        series.counter._value.set(values[offset])
+
+        if same_buckets:
+            series.histogram._sum.set(values[offset + 1])
+
+            for bucket, value in zip(_buckets(series.histogram), values[offset + 2:offset + width]):
+                bucket.set(value)
+
+            series_table.restore(series, values[offset + 1], sum(values[offset + 2:offset + width]))
+
+    return series_count
+
+
+def decode(data):
+    """
+    Decode the compact binary format.
+
+    :param data: the encoded values
+    :return: the tuple of the bucket boundaries, the string table,
+        the array of the `(method, group, status)` keys of the series
+        as indexes into the string table, and the array of their values
+    """
+
+    magic, version, bound_count, series_count, blob_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Unknown format of the metrics state file')
+
+    position = _HEADER.size
+
+    bounds = array('d')
+    _from_bytes(bounds, data[position:position + 8 * bound_count])
+    position += 8 * bound_count
+
+    strings = data[position:position + blob_size].decode('utf-8').split('\0')
+    position += blob_size
+
+    keys = array('I')
+    _from_bytes(keys, data[position:position + keys.itemsize * 3 * series_count])
+    position += keys.itemsize * 3 * series_count
+
+    values = array('d')
+    _from_bytes(values, data[position:position + 8 * (2 + bound_count) * series_count])
+
+    if sys.byteorder == 'big':
+        for loaded in (bounds, keys, values):
+            loaded.byteswap()
+
+    return bounds, strings, keys, values
+
+
+def _buckets(histogram):
+    buckets = histogram._buckets
+    return [buckets[idx] for idx in range(len(buckets))]
+
+
+def _to_bytes(data):
+    # `tobytes` is called `tostring` on Python 2
+    if hasattr(data, 'tobytes'):
+        return data.tobytes()
+
+    return data.tostring()
+
+
+def _from_bytes(data, raw):
+    # `frombytes` is called `fromstring` on Python 2
+    if hasattr(data, 'frombytes'):
+        data.frombytes(raw)
+    else:
+        data.fromstring(raw)
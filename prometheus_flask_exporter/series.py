@@ -0,0 +1,150 @@
+import os
+import threading
+
+try:
+    _string_types = basestring  # noqa: F821
+except NameError:  # Python 3
+    _string_types = str
+
+
+class SeriesTable(object):
+    """
+    Maps the label values of a request to the children of all the default
+    metrics at once, so each request needs a single dictionary lookup,
+    rather than one `.labels(..)` call on each metric.
+
+    The running sum and count of the request latencies are kept
+    for each series, to update the average Gauge with.
+
+    The table trades memory for the lookups: its dictionary entry
+    and `Series` object add about 200 bytes to each series,
+    on top of the children of the metrics themselves.
+    """
+
+    def __init__(self, histogram, counter, gauge, quantiles, hostname):
+        """
+        Create a new series table for the default metrics.
+
+        :param histogram: the Histogram of the request latencies
+        :param counter: the Counter of the requests
+        :param gauge: the Gauge of the average request latencies
+        :param quantiles: the `Sketch` of the request latencies (optional)
+        :param hostname: the value of the `hostname` label
+        """
+
+        self.histogram = histogram
+        self.counter = counter
+        self.gauge = gauge
+        self.quantiles = quantiles
+        self.hostname = hostname
+
+        self._lock = threading.Lock()
+        self._series = {}
+        self._pid = None
+        self._pid_label = None
+
+    def __len__(self):
+        return len(self._series)
+
+    def get(self, method, group, status):
+        """
+        Find or create the series of a request.
+
+        :param method: the HTTP method of the request
+        :param group: the group of the request, like its path or endpoint
+        :param status: the status code of the response
+        :return: the `Series` of the children of the default metrics
+        """
+
+        if not isinstance(group, _string_types):
+            # not necessarily hashable, like a `url_rule`
+            group = str(group)
+
+        if self._pid != os.getpid():
+            self._reset()
+
+        key = (method, group, status)
+        series = self._series.get(key)
+
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+
+                if series is None:
+                    series = self._series[key] = self._create(method, group, status)
+
+        return series
+
+    def observe(self, series, amount):
+        """
+        Add a request latency to the running sum and count of the series.
+
+        :param series: the `Series` of the request
+        :param amount: the latency in seconds
+        :return: the average latency of the series
+        """
+
+        with self._lock:
+            series.sum += amount
+            series.count += 1
+            return series.sum / series.count
+
+    def items(self):
+        """
+        :return: the list of the `((method, group, status), series)` pairs
+        """
+
+        with self._lock:
+            return list(self._series.items())
+
+    def restore(self, series, total, count):
+        """
+        Set the running sum and count of the request latencies of the series,
+        and the average Gauge, when restoring them from a previous run.
+
+        :param series: the `Series` to restore
+        :param total: the sum of the request latencies
+        :param count: the number of requests
+        """
+
+        with self._lock:
+            series.sum = total
+            series.count = count
+
+        if count:
+            series.gauge.set(total / count)
+
+    def _reset(self):
+        with self._lock:
+            # the series created before forking belong to the parent process
+            self._pid = os.getpid()
+            self._pid_label = str(self._pid)
+            self._series = {}
+
+    def _create(self, method, group, status):
+        # the label values are converted to text by the metrics,
+        # keeping the unicode values as they are on Python 2
+        hostname = self.hostname
+
+        return Series(
+            self.histogram.labels(method, group, self._pid_label, hostname, status),
+            self.counter.labels(method, group, hostname, status),
+            self.gauge.labels(method, group, hostname, status),
+            self.quantiles.labels(method, group, hostname, status) if self.quantiles else None
+        )
+
+
+class Series(object):
+    """
+    The children of the default metrics for one set of label values.
+    """
+
+    __slots__ = ('histogram', 'counter', 'gauge', 'quantiles', 'sum', 'count')
+
+    def __init__(self, histogram, counter, gauge, quantiles):
+        self.histogram = histogram
+        self.counter = counter
+        self.gauge = gauge
+        self.quantiles = quantiles
+        self.sum = 0.0
+        self.count = 0
@@ -0,0 +1,443 @@
+import os
+import math
+import time
+import uuid
+import threading
+
+from .files import multiprocess_directory, write_json, read_json
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class DDSketch(object):
+    """
+    A quantile sketch with relative error guarantees, based on DDSketch
+    (see: https://arxiv.org/abs/1908.10693).
+
+    Values are counted in logarithmically sized bins, so any quantile
+    is estimated within the configured relative accuracy, as long as
+    the number of bins stays under `max_bins`. When it would grow over
+    that, the lowest bins are collapsed, trading the accuracy of the
+    low quantiles for bounded memory.
+
+    Sketches with the same relative accuracy can be merged.
+    Values that are not positive are counted as zeros.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        """
+        Create a new, empty sketch.
+
+        :param relative_accuracy: the relative error of the quantile estimates
+        :param max_bins: the maximum number of bins to keep
+        """
+
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._multiplier = 1 / math.log(self._gamma)
+
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value, count=1):
+        """
+        Add a value to the sketch.
+
+        :param value: the value to add
+        :param count: the number of times to add it
+        """
+
+        if value > 0:
+            key = int(math.ceil(math.log(value) * self._multiplier))
+            bins = self.bins
+            bins[key] = bins.get(key, 0) + count
+
+            if len(bins) > self.max_bins:
+                self._collapse()
+
+            self.sum += value * count
+
+        else:
+            self.zero_count += count
+
+        self.count += count
+
+    def merge(self, other):
+        """
+        Add all the values of another sketch to this one.
+
+        :param other: a sketch with the same relative accuracy
+        """
+
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracies')
+
+        bins = self.bins
+        for key, count in other.bins.items():
+            bins[key] = bins.get(key, 0) + count
+
+        if len(bins) > self.max_bins:
+            self._collapse()
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """
+        Estimate a quantile of the values added so far.
+
+        :param q: the quantile, between `0` and `1`
+        :return: the estimated value, or `NaN` for an empty sketch
+        """
+
+        return self.quantiles((q,))[0]
+
+    def quantiles(self, qs):
+        """
+        Estimate several quantiles with a single pass over the bins.
+
+        :param qs: the quantiles, between `0` and `1`, in increasing order
+        :return: the list of estimated values
+        """
+
+        if not self.count:
+            return [float('nan')] * len(qs)
+
+        results = []
+        ranks = iter([(q, q * (self.count - 1)) for q in qs])
+        q, rank = next(ranks)
+
+        seen = self.zero_count
+        while seen > rank:
+            results.append(0.0)
+            q, rank = next(ranks, (None, None))
+            if q is None:
+                return results
+
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+
+            while seen > rank:
+                results.append(self.bin_value(key))
+                q, rank = next(ranks, (None, None))
+                if q is None:
+                    return results
+
+        # only reached with rounding issues on the highest quantiles
+        highest = self.bin_value(max(self.bins)) if self.bins else 0.0
+        return results + [highest] * (len(qs) - len(results))
+
+    def bin_value(self, key):
+        """
+        The value representing the bin with the given key.
+        """
+
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def to_dict(self):
+        return {
+            'bins': [[key, count] for key, count in self.bins.items()],
+            'zero': self.zero_count, 'count': self.count, 'sum': self.sum
+        }
+
+    def update_from_dict(self, data):
+        for key, count in data['bins']:
+            self.bins[key] = self.bins.get(key, 0) + count
+
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+        self.zero_count += data['zero']
+        self.count += data['count']
+        self.sum += data['sum']
+
+
+class Sketch(object):
+    """
+    A metric tracking the distribution of observed values with `DDSketch`,
+    exposed as a Prometheus summary with the configured quantiles,
+    plus the `_count` and `_sum` of the values.
+
+    The interface follows the `prometheus_client` metrics:
+
+        sketch = Sketch('request_latency_seconds', 'Request latency', ('path',))
+        sketch.labels('/test').observe(0.123)
+
+    In multiprocess mode (`prometheus_multiproc_dir` is set) the sketches
+    of each process are written to that directory, and the
+    `SketchMultiProcessCollector` merges them at scrape time.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 quantiles=DEFAULT_QUANTILES, relative_accuracy=0.01, max_bins=2048):
+        """
+        Create a new sketch metric.
+
+        :param name: the name of the metric
+        :param documentation: the description of the metric
+        :param labelnames: the names of the labels
+        :param registry: the Prometheus Registry to register with (optional)
+        :param quantiles: the quantiles to export
+        :param relative_accuracy: the relative error of the quantile estimates
+        :param max_bins: the maximum number of bins for each set of labels
+        """
+
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.quantiles = tuple(sorted(quantiles))
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+
+        self._children = {}
+        self._lock = threading.Lock()
+
+        if not self.labelnames:
+            self._children[()] = _SketchChild(self)
+
+        if registry is not None:
+            registry.register(self)
+
+        if multiprocess_directory():
+            _WRITER.add(self)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        """
+        Return the child sketch for the given label values.
+        """
+
+        if labelkwargs:
+            labelvalues = tuple(labelkwargs[name] for name in self.labelnames)
+
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError('Incorrect label count')
+
+        labelvalues = tuple(str(value) for value in labelvalues)
+
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, _SketchChild(self))
+
+        return child
+
+    def observe(self, value):
+        """
+        Observe a value, for sketches without labels.
+        """
+
+        if self.labelnames:
+            raise ValueError('No label values given for a sketch with labels')
+
+        self._children[()].observe(value)
+
+    def describe(self):
+        from prometheus_client.core import Metric
+        return [Metric(self.name, self.documentation, 'summary')]
+
+    def collect(self):
+        if multiprocess_directory():
+            # exported through the `SketchMultiProcessCollector`
+            return []
+
+        with self._lock:
+            children = list(self._children.items())
+
+        series = []
+        for labelvalues, child in children:
+            series.append((labelvalues, child.snapshot()))
+
+        return [_to_metric(
+            self.name, self.documentation, self.labelnames, self.quantiles, series
+        )]
+
+    def to_dict(self):
+        with self._lock:
+            children = list(self._children.items())
+
+        return {
+            'documentation': self.documentation, 'labelnames': self.labelnames,
+            'quantiles': self.quantiles, 'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'series': [
+                [labelvalues, child.snapshot().to_dict()]
+                for labelvalues, child in children
+            ]
+        }
+
+
+class _SketchChild(object):
+    def __init__(self, parent):
+        self._sketch = DDSketch(parent.relative_accuracy, parent.max_bins)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._sketch.add(value)
+
+        if _WRITER.sketches:
+            _WRITER.changed()
+
+    def snapshot(self):
+        copy = DDSketch(self._sketch.relative_accuracy, self._sketch.max_bins)
+
+        with self._lock:
+            copy.merge(self._sketch)
+
+        return copy
+
+
+class SketchMultiProcessCollector(object):
+    """
+    Collects the sketches written by all processes in the
+    `prometheus_multiproc_dir` directory, and merges them.
+    """
+
+    def __init__(self, registry, path=None):
+        self.path = path
+
+        if registry is not None:
+            registry.register(self)
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        path = self.path or multiprocess_directory()
+        if not path:
+            return []
+
+        # make sure the sketches of this process are up to date
+        _WRITER.write()
+
+        metrics = {}
+
+        for filename in sorted(os.listdir(path)):
+            if not (filename.startswith('sketch_') and filename.endswith('.json')):
+                continue
+
+            data = read_json(os.path.join(path, filename))
+            if data is None:
+                continue
+
+            for name, details in data.items():
+                if name not in metrics:
+                    metrics[name] = (details, {})
+
+                series = metrics[name][1]
+
+                for labelvalues, sketch_data in details['series']:
+                    labelvalues = tuple(labelvalues)
+
+                    sketch = series.get(labelvalues)
+                    if sketch is None:
+                        sketch = series[labelvalues] = DDSketch(
+                            details['relative_accuracy'], details['max_bins']
+                        )
+
+                    sketch.update_from_dict(sketch_data)
+
+        return [
+            _to_metric(
+                name, details['documentation'], details['labelnames'],
+                details['quantiles'], sorted(series.items())
+            )
+            for name, (details, series) in sorted(metrics.items())
+        ]
+
+
+def _to_metric(name, documentation, labelnames, quantiles, series):
+    from prometheus_client.core import Metric
+
+    metric = Metric(name, documentation, 'summary')
+
+    for labelvalues, sketch in series:
+        labels = dict(zip(labelnames, labelvalues))
+
+        for quantile, value in zip(quantiles, sketch.quantiles(quantiles)):
+            quantile_labels = dict(labels)
+            quantile_labels['quantile'] = str(quantile)
+            metric.add_sample(name, quantile_labels, value)
+
+        metric.add_sample(name + '_count', labels, sketch.count)
+        metric.add_sample(name + '_sum', labels, sketch.sum)
+
+    return metric
+
+
+class _SketchWriter(object):
+    """
+    Writes the sketches of the current process to the multiprocess directory,
+    at most once every `interval` seconds, using a timer for the changes
+    that happen within the interval.
+
+    The file names have a random token of the process besides its pid,
+    so a process reusing the pid of an exited one doesn't overwrite its counts.
+    """
+
+    interval = 1.0
+
+    def __init__(self):
+        self.sketches = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._timer_pid = None
+        self._last_write = 0
+        self._token = None
+        self._token_pid = None
+
+    def add(self, sketch):
+        with self._lock:
+            self.sketches.append(sketch)
+
+    def changed(self):
+        if self._timer_pid == os.getpid():
+            return  # a write is already scheduled in this process
+
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+
+            delay = max(self._last_write + self.interval - time.time(), 0)
+
+            self._timer = threading.Timer(delay, self.write)
+            self._timer.daemon = True
+            self._timer.start()
+            self._timer_pid = os.getpid()
+
+    def write(self):
+        directory = multiprocess_directory()
+
+        with self._lock:
+            self._timer = self._timer_pid = None
+            self._last_write = time.time()
+
+            if not directory or not self.sketches:
+                return
+
+            data = dict((sketch.name, sketch.to_dict()) for sketch in self.sketches)
+
+            if self._token_pid != os.getpid():
+                # a new process, either started or forked
+                self._token = uuid.uuid4().hex[:8]
+                self._token_pid = os.getpid()
+
+            filename = 'sketch_%d_%s.json' % (self._token_pid, self._token)
+
+        write_json(os.path.join(directory, filename), data)
+
+
+_WRITER = _SketchWriter()
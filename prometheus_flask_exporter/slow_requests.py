@@ -0,0 +1,162 @@
+import os
+import time
+import errno
+import heapq
+import threading
+import itertools
+
+from .files import multiprocess_directory, write_json, read_json
+
+
+class SlowRequestsTracker(object):
+    """
+    Keeps track of the slowest requests of the current process,
+    in a fixed-size min-heap, so only requests slower than the fastest
+    one on the heap cost more than a single comparison.
+
+    When the `prometheus_multiproc_dir` environment variable is set,
+    the requests of each process are also written to that directory
+    (at most once every `write_interval` seconds, using a timer for the
+    requests recorded within the interval), and the results are merged
+    from all the processes that are still running.
+    """
+
+    def __init__(self, size, write_interval=1.0):
+        """
+        Create a new tracker.
+
+        :param size: the number of the slowest requests to keep
+        :param write_interval: the minimum number of seconds between writing
+            the requests of this process to the multiprocess directory
+        """
+
+        self.size = size
+        self.write_interval = write_interval
+
+        self._heap = []
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._last_write = 0
+        self._dirty = False
+        self._timer_pid = None
+
+    def record(self, duration, path, endpoint, method, status):
+        """
+        Record a finished request if it is among the slowest ones.
+
+        :param duration: the duration of the request in seconds
+        :param path: the request path
+        :param endpoint: the Flask endpoint that handled the request
+        :param method: the HTTP method of the request
+        :param status: the HTTP status code of the response
+        """
+
+        heap = self._heap
+
+        # cheap check without the lock for the common case
+        if len(heap) >= self.size and duration <= heap[0][0]:
+            return
+
+        entry = (duration, next(self._sequence), {
+            'path': path, 'endpoint': endpoint, 'method': method,
+            'status': status, 'duration': duration, 'timestamp': time.time()
+        })
+
+        with self._lock:
+            if len(heap) < self.size:
+                heapq.heappush(heap, entry)
+            elif duration > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                return
+
+            self._dirty = True
+
+        self._schedule_write()
+
+    def requests(self):
+        """
+        Returns the slowest requests, the slowest first,
+        merged from all processes in multiprocess mode.
+
+        :return: a list of dictionaries describing the requests
+        """
+
+        with self._lock:
+            requests = [entry[2] for entry in self._heap]
+
+        directory = multiprocess_directory()
+        if directory:
+            self._write(directory)
+            requests = self._read_all(directory)
+
+        return heapq.nlargest(self.size, requests, key=lambda item: item['duration'])
+
+    def _schedule_write(self):
+        if self._timer_pid == os.getpid():
+            return  # a write is already scheduled in this process
+
+        if not multiprocess_directory():
+            return
+
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+
+            delay = max(self._last_write + self.write_interval - time.time(), 0)
+
+            timer = threading.Timer(delay, self._scheduled_write)
+            timer.daemon = True
+            timer.start()
+            self._timer_pid = os.getpid()
+
+    def _scheduled_write(self):
+        with self._lock:
+            self._timer_pid = None
+
+        directory = multiprocess_directory()
+        if directory:
+            self._write(directory)
+
+    def _write(self, directory):
+        with self._lock:
+            if not self._dirty:
+                return
+
+            requests = [entry[2] for entry in self._heap]
+            self._dirty = False
+            self._last_write = time.time()
+
+        write_json(os.path.join(directory, 'slow_requests_%d.json' % os.getpid()), requests)
+
+    @staticmethod
+    def _read_all(directory):
+        requests = []
+
+        for filename in os.listdir(directory):
+            if not (filename.startswith('slow_requests_') and filename.endswith('.json')):
+                continue
+
+            pid = filename[len('slow_requests_'):-len('.json')]
+
+            if pid.isdigit() and not _is_running(int(pid)):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass  # removed by another process already
+
+                continue
+
+            requests.extend(read_json(os.path.join(directory, filename)) or [])
+
+        return requests
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        # the process exists, but it belongs to another user
+        return ex.errno == errno.EPERM
+
+    return True
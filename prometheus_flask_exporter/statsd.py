@@ -0,0 +1,257 @@
+import os
+import re
+import random
+import socket
+import threading
+
+_INVALID_CHARACTERS = re.compile(r'[:|@#,\s]')
+
+
+class StatsdExporter(object):
+    """
+    Sends the default metrics and the metrics of the decorators
+    to a StatsD compatible aggregator over UDP too, next to the metrics endpoint.
+
+    The values are coalesced in memory: counters are added up and gauges
+    keep their last value until the next flush. The timings are sent one by one,
+    but at most `max_timings` of each series in a flush: past that, a uniform
+    sample of them is kept, and sent with its sample rate, like `|@0.1`,
+    so the aggregator scales their counts back up.
+    A background thread flushes them periodically, packing
+    as many lines into each datagram as fit into `max_packet_size`,
+    so the requests never wait for sending the metrics.
+
+    The labels are sent as DogStatsD style tags, like `|#method:GET`,
+    or appended to the name of the metric with `tags=False`.
+
+    Sample usage:
+
+        statsd = StatsdExporter('statsd.local', 8125, prefix='myapp')
+        metrics = PrometheusMetrics(app, statsd=statsd)
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix=None,
+                 flush_interval=1.0, max_packet_size=1432, tags=True, max_timings=100):
+        """
+        Create a new StatsD exporter.
+
+        :param host: the host of the StatsD aggregator
+        :param port: the UDP port of the StatsD aggregator
+        :param prefix: the prefix to start the metric names with (optional)
+        :param flush_interval: the number of seconds between sending the
+            coalesced metrics
+        :param max_packet_size: the maximum size of the datagrams in bytes
+            (the default fits into an Ethernet frame, use `512` over the internet)
+        :param tags: send the labels as DogStatsD tags, rather than
+            appending their values to the names of the metrics
+        :param max_timings: the maximum number of timings to keep
+            for each series between the flushes
+        """
+
+        self.address = (host, port)
+        self.prefix = '%s.' % prefix if prefix else ''
+        self.flush_interval = flush_interval
+        self.max_packet_size = max_packet_size
+        self.tags = tags
+        self.max_timings = max_timings
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._line_parts = {}
+
+        self._pid = None
+        self._socket = None
+        self._stopped = threading.Event()
+
+    def increment(self, name, labels=(), value=1):
+        """
+        Add to a counter.
+
+        :param name: the name of the metric
+        :param labels: the tuple of the `(name, value)` pairs of the labels
+        :param value: the amount to add
+        """
+
+        if self._pid != os.getpid():
+            self.start()
+
+        key = (name, labels)
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, labels=()):
+        """
+        Set a gauge, only its last value before the flush is sent.
+
+        :param name: the name of the metric
+        :param value: the value of the gauge
+        :param labels: the tuple of the `(name, value)` pairs of the labels
+        """
+
+        if self._pid != os.getpid():
+            self.start()
+
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def timing(self, name, seconds, labels=()):
+        """
+        Record a timing.
+
+        :param name: the name of the metric
+        :param seconds: the duration in seconds, sent in milliseconds
+        :param labels: the tuple of the `(name, value)` pairs of the labels
+        """
+
+        if self._pid != os.getpid():
+            self.start()
+
+        key = (name, labels)
+
+        with self._lock:
+            sample = self._timings.get(key)
+            if sample is None:
+                sample = self._timings[key] = [0, []]
+
+            sample[0] += 1
+            values = sample[1]
+
+            if len(values) < self.max_timings:
+                values.append(seconds)
+            else:
+                # reservoir sampling, so each timing is kept with the same probability
+                position = random.randrange(sample[0])
+                if position < self.max_timings:
+                    values[position] = seconds
+
+    def start(self):
+        """
+        Start the background thread flushing the metrics,
+        called on the first metric recorded in each process.
+        """
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # the values recorded before forking belong to the parent process
+            self._pid = os.getpid()
+            self._counters, self._gauges, self._timings = {}, {}, {}
+
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._stopped.clear()
+
+            if self.flush_interval:
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, after flushing the remaining metrics.
+        """
+
+        self._stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Send the metrics coalesced since the last flush.
+
+        :return: the number of datagrams sent
+        """
+
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            timings, self._timings = self._timings, {}
+
+        if self._socket is None:
+            return 0
+
+        lines = [
+            self._line(name, labels, 'c', value)
+            for (name, labels), value in counters.items()
+        ]
+
+        lines.extend(
+            self._line(name, labels, 'g', value)
+            for (name, labels), value in gauges.items()
+        )
+
+        for (name, labels), (count, values) in timings.items():
+            sample_rate = float(len(values)) / count
+
+            lines.extend(
+                self._line(name, labels, 'ms', round(seconds * 1e3, 3), sample_rate)
+                for seconds in values
+            )
+
+        sent = 0
+
+        for packet in _packets(lines, self.max_packet_size):
+            try:
+                self._socket.sendto(packet, self.address)
+                sent += 1
+            except (IOError, OSError):
+                pass  # the aggregator is unavailable, drop the metrics like StatsD does
+
+        return sent
+
+    def _line(self, name, labels, metric_type, value, sample_rate=1.0):
+        key = (name, labels, metric_type)
+        parts = self._line_parts.get(key)
+
+        if parts is None:
+            if len(self._line_parts) >= 10000:
+                # start over, rather than tracking the usage of each series
+                self._line_parts.clear()
+
+            name = _clean(self.prefix + name)
+
+            if labels and self.tags:
+                tags = ','.join('%s:%s' % (_clean(label), _clean(label_value))
+                                for label, label_value in labels)
+                parts = self._line_parts[key] = ('%s:' % name, '|' + metric_type, '|#' + tags)
+
+            else:
+                name = '.'.join([name] + [_clean(label_value) for _, label_value in labels])
+                parts = self._line_parts[key] = ('%s:' % name, '|' + metric_type, '')
+
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+
+        if sample_rate < 1:
+            # the sample rate goes before the tags
+            return '%s%s%s|@%.6g%s' % (parts[0], value, parts[1], sample_rate, parts[2])
+
+        return '%s%s%s%s' % (parts[0], value, parts[1], parts[2])
+
+
+def _clean(value):
+    return _INVALID_CHARACTERS.sub('_', str(value))
+
+
+def _packets(lines, max_packet_size):
+    packet, size = [], 0
+
+    for line in lines:
+        line = line.encode('utf-8')
+
+        if packet and size + 1 + len(line) > max_packet_size:
+            yield b'\n'.join(packet)
+            packet, size = [], 0
+
+        # a line longer than the limit is still sent, on its own
+        size += len(line) + (1 if packet else 0)
+        packet.append(line)
+
+    if packet:
+        yield b'\n'.join(packet)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import random
+import shutil
+import tempfile
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.sketch import DDSketch
+from prometheus_flask_exporter.calibration import (
+    BucketCalibration, recommend_buckets, quantile_errors
+)
+
+
+class RecommendationTest(unittest.TestCase):
+    def test_recommend_buckets(self):
+        random.seed(1)
+
+        sketch = DDSketch()
+        for _ in range(10000):
+            sketch.add(random.uniform(0.002, 0.020))
+
+        buckets = recommend_buckets(sketch, 10)
+
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertLessEqual(len(buckets), 10)
+        self.assertGreaterEqual(buckets[-1], sketch.quantile(1.0))
+        self.assertLess(buckets[0], 0.005)
+
+        # much better than the defaults for 2-20ms latencies
+        default_buckets = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+        recommended_errors = quantile_errors(sketch, buckets)
+        default_errors = quantile_errors(sketch, default_buckets)
+
+        for quantile in ('0.5', '0.9', '0.99'):
+            self.assertLess(recommended_errors[quantile], 0.1)
+            self.assertLess(recommended_errors[quantile], default_errors[quantile])
+
+
+class CalibrationTest(BaseTestCase):
+    def setUp(self):
+        super(CalibrationTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'buckets.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_calibration(self):
+        calibration = BucketCalibration(self.filename, bucket_count=5)
+        self.metrics(group_by='endpoint', bucket_calibration=calibration)
+
+        @self.app.route('/a')
+        def endpoint_a():
+            return 'OK'
+
+        @self.app.route('/b')
+        def endpoint_b():
+            return 'OK'
+
+        for _ in range(10):
+            self.client.get('/a')
+            self.client.get('/b')
+
+        response = self.client.get('/metrics/buckets')
+        self.assertEqual(response.status_code, 200)
+
+        recommendations = json.loads(response.data.decode('utf-8'))
+
+        self.assertFalse(recommendations['finished'])
+        self.assertEqual(set(recommendations['groups']), {'*', 'endpoint_a', 'endpoint_b'})
+        self.assertEqual(recommendations['groups']['*']['count'], 20)
+        self.assertIn('current_errors', recommendations['groups']['*'])
+
+        calibration.finish()
+        self.assertFalse(calibration.recording)
+
+        self.client.get('/a')
+
+        with open(self.filename) as saved:
+            saved = json.load(saved)
+
+        self.assertTrue(saved['finished'])
+        self.assertEqual(saved['groups']['endpoint_a']['count'], 10)
+
+        result = self.app.test_cli_runner().invoke(args=['metrics-buckets'])
+        self.assertIn('endpoint_a (10 requests): ', result.output)
+
+    def test_apply_on_next_start(self):
+        with open(self.filename, 'w') as saved:
+            json.dump({'groups': {'*': {'count': 1, 'buckets': [0.002, 0.0035, 0.02]}}}, saved)
+
+        registry = CollectorRegistry(auto_describe=True)
+        calibration = BucketCalibration(self.filename, apply=True)
+        self.metrics(registry=registry, bucket_calibration=calibration)
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+
+        response = self.client.get('/metrics')
+        self.assertIn(b'le="0.0035"', response.data)
+        self.assertNotIn(b'le="0.005"', response.data)
+
+    def test_finished_by_timer(self):
+        calibration = BucketCalibration(self.filename, window=0.2)
+        self.metrics(bucket_calibration=calibration)
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+        self.assertFalse(os.path.exists(self.filename))
+
+        for _ in range(50):
+            if not calibration.recording:
+                break
+            time.sleep(0.1)
+
+        self.assertFalse(calibration.recording)
+
+        with open(self.filename) as saved:
+            self.assertEqual(json.load(saved)['groups']['/test']['count'], 1)
+
+        self.assertEqual(os.listdir(self.directory), ['buckets.json'])
+
+    def test_failed_write(self):
+        filename = os.path.join(self.directory, 'missing', 'buckets.json')
+        calibration = BucketCalibration(filename, window=0)
+        self.metrics(bucket_calibration=calibration)
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        # the requests after the window are not affected
+        self.assertEqual(self.client.get('/test').status_code, 200)
+        self.assertEqual(self.client.get('/test').status_code, 200)
+
+        # the timer failed to save them too
+        calibration._timer.join()
+
+        self.assertFalse(calibration.finish())
+        self.assertTrue(calibration.recording)
+        self.assertEqual(self.client.get('/metrics/buckets').status_code, 200)
+
+        # saved once the directory exists
+        os.mkdir(os.path.dirname(filename))
+        self.assertTrue(calibration.finish())
+        self.assertFalse(calibration.recording)
@@ -0,0 +1,160 @@
+import unittest
+
+from flask import request
+
+from prometheus_client import CollectorRegistry, Counter, Histogram
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.cardinality import (
+    CardinalityExplorer, HeavyHitters, DistinctCounter
+)
+
+
+class HeavyHittersTest(unittest.TestCase):
+    def test_exact_counts(self):
+        sketch = HeavyHitters(10)
+
+        for value in 'abacabad':
+            sketch.add(value)
+
+        self.assertEqual(sketch.top(2), [['a', 4], ['b', 2]])
+        self.assertEqual(sketch.distinct(), 4)
+
+    def test_frequent_values_kept(self):
+        sketch = HeavyHitters(20)
+
+        for idx in range(10000):
+            # every third value is the same, the rest are all different
+            sketch.add('hot' if idx % 3 == 0 else 'cold-%d' % idx)
+
+        top = sketch.top(1)
+
+        self.assertEqual(top[0][0], 'hot')
+        # a lower bound within `total / (capacity + 1)` of the real count
+        self.assertLessEqual(top[0][1], 3334)
+        self.assertGreaterEqual(top[0][1], 3334 - 10000 // 21)
+        self.assertLessEqual(len(sketch._counts), 20)
+
+
+class DistinctCounterTest(unittest.TestCase):
+    def test_exact_below_capacity(self):
+        counter = DistinctCounter(100)
+
+        for idx in range(1000):
+            counter.add(idx % 100)
+
+        self.assertEqual(counter.estimate(), 100)
+
+    def test_estimate(self):
+        counter = DistinctCounter(1024)
+
+        for value in range(100000):
+            counter.add('/item/%d' % value)
+            counter.add(value)
+
+        # within 3 standard errors, with 1024 hashes kept
+        self.assertAlmostEqual(counter.estimate(), 200000, delta=20000)
+        self.assertEqual(len(counter._hashes), 1024)
+        self.assertEqual(len(counter._heap), 1024)
+
+
+class CardinalityExplorerTest(unittest.TestCase):
+    def test_growth(self):
+        registry = CollectorRegistry()
+        counter = Counter('requests', 'Requests', ('path',), registry=registry)
+        explorer = CardinalityExplorer(top_k=3)
+
+        counter.labels('/a').inc()
+
+        report = explorer.explore(registry)
+        self.assertIsNone(report['growth'])
+        self.assertIsNone(report['families'][0]['growth'])
+
+        for idx in range(5):
+            counter.labels('/b/%d' % idx).inc()
+
+        report = explorer.explore(registry)
+        family = report['families'][0]
+
+        self.assertEqual(family['name'], 'requests')
+        self.assertEqual(family['growth'], 10)  # the `_total` and `_created` samples
+        self.assertEqual(family['series'], 12)
+        self.assertEqual(family['labels']['path']['distinct'], 6)
+        self.assertEqual(len(family['labels']['path']['top']), 3)
+
+    def test_growth_with_filtered_registry(self):
+        registry = CollectorRegistry()
+        requests = Counter('requests', 'Requests', ('path',), registry=registry)
+        errors = Counter('errors', 'Errors', ('path',), registry=registry)
+        explorer = CardinalityExplorer()
+
+        for idx in range(10):
+            requests.labels('/%d' % idx).inc()
+            errors.labels('/%d' % idx).inc()
+
+        explorer.explore(registry)
+        explorer.explore(registry.restricted_registry(['errors_total', 'errors_created']))
+
+        requests.labels('/new').inc()
+
+        report = explorer.explore(registry)
+        families = dict((family['name'], family) for family in report['families'])
+
+        self.assertEqual(families['requests']['growth'], 2)
+        self.assertEqual(families['errors']['growth'], 0)
+        self.assertEqual(report['growth'], 2)
+
+        # only the families seen before are added up
+        Counter('other', 'Other', registry=registry).inc()
+
+        report = explorer.explore(registry)
+        self.assertEqual(report['growth'], 0)
+        self.assertEqual(report['series'], 44)
+
+    def test_structural_labels(self):
+        registry = CollectorRegistry()
+        histogram = Histogram('latency', 'Latency', ('path',), registry=registry, buckets=(1, 2))
+        histogram.labels('/a').observe(1)
+
+        family = CardinalityExplorer().explore(registry)['families'][0]
+
+        self.assertEqual(list(family['labels']), ['path'])
+        self.assertEqual(family['labels']['path']['top'], [['/a', family['series']]])
+
+
+class CardinalityEndpointTest(BaseTestCase):
+    def test_endpoint(self):
+        self.metrics(registry=CollectorRegistry(), cardinality_path='/metrics/cardinality')
+
+        @self.app.route('/item/<idx>')
+        def item(idx):
+            return 'OK', int(request.args.get('status', 200))
+
+        for idx in range(20):
+            self.client.get('/item/%d' % idx)
+
+        # another series for the same path
+        self.client.get('/item/1?status=201')
+
+        response = self.client.get('/metrics/cardinality?k=2')
+        self.assertEqual(response.status_code, 200)
+
+        report = response.get_json()
+        families = dict((family['name'], family) for family in report['families'])
+
+        total = families['flask_http_request']
+        self.assertEqual(total['labels']['path']['distinct'], 20)
+        self.assertEqual(total['labels']['path']['top'][0], ['/item/1', 4])
+        self.assertEqual(len(total['labels']['path']['top']), 2)
+
+        self.assertEqual(
+            report['families'][0]['name'], 'flask_http_request_duration_seconds'
+        )
+
+        for idx in range(20, 25):
+            self.client.get('/item/%d' % idx)
+
+        report = self.client.get('/metrics/cardinality').get_json()
+        families = dict((family['name'], family) for family in report['families'])
+
+        self.assertEqual(families['flask_http_request']['growth'], 10)
@@ -1,7 +1,13 @@
+import os
+import re
+import threading
+import time
+
 from unittest_helper import BaseTestCase
 
-from prometheus_flask_exporter import NO_PREFIX
+from prometheus_flask_exporter import NO_PREFIX, _compile_path_matcher
 from flask import make_response
+from prometheus_client import CollectorRegistry
 
 
 class DefaultsTest(BaseTestCase):
@@ -359,3 +365,295 @@ class DefaultsTest(BaseTestCase):
         metrics.info('no_labels', 'Without labels')
 
         self.assertMetric('no_labels', '1.0')
+
+    def test_lazy_defaults(self):
+        registry = CollectorRegistry(auto_describe=True)
+        metrics = self.metrics(registry=registry, lazy_defaults=True)
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.assertIsNone(registry.get_sample_value(
+            'flask_exporter_info', {'version': metrics.version}
+        ))
+
+        self.client.get('/test')
+
+        self.assertEqual(registry.get_sample_value(
+            'flask_exporter_info', {'version': metrics.version}
+        ), 1.0)
+
+    def test_lazy_defaults_created_on_scrape(self):
+        metrics = self.metrics(lazy_defaults=True)
+
+        self.assertMetric(
+            'flask_exporter_info', '1.0',
+            ('version', metrics.version)
+        )
+
+    def test_excluded_paths(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, excluded_paths=[
+            '/health', '/assets/*.css', re.compile(r'/internal/\d+$')
+        ])
+
+        @self.app.route('/<path:path>')
+        def test(path):
+            return 'OK'
+
+        for path in ('/health', '/healthz', '/assets/x.css', '/internal/42',
+                     '/test', '/assets/x.js', '/internal/42/x'):
+            self.client.get(path)
+
+        def requests_for(path):
+            return registry.get_sample_value('flask_http_request_total', {
+                'method': 'GET', 'path': path, 'status': '200',
+                'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+            })
+
+        for path in ('/health', '/healthz', '/assets/x.css', '/internal/42'):
+            self.assertIsNone(requests_for(path))
+
+        for path in ('/test', '/assets/x.js', '/internal/42/x'):
+            self.assertEqual(requests_for(path), 1.0)
+
+    def test_excluded_paths_with_flags(self):
+        matches = _compile_path_matcher([
+            '/assets/', re.compile('/HEALTH', re.IGNORECASE), re.compile('(?i)/status$'),
+            re.compile(r'/internal/\d+$')
+        ])
+
+        for path in ('/assets/x.css', '/health', '/Health/x', '/STATUS', '/internal/42'):
+            self.assertTrue(matches(path), path)
+
+        for path in ('/test', '/status/x', '/INTERNAL/42'):
+            self.assertFalse(matches(path), path)
+
+        # a single flagged expression is matched as it is
+        matches = _compile_path_matcher([re.compile('/health', re.I)])
+        self.assertTrue(matches('/HEALTH'))
+
+    def test_track_in_progress(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, group_by='endpoint', track_in_progress=True)
+
+        started = threading.Semaphore(0)
+        release = threading.Event()
+
+        @self.app.route('/slow')
+        def slow():
+            started.release()
+            release.wait(10)
+            return 'OK'
+
+        @self.app.route('/error')
+        def error():
+            raise ValueError('failed')
+
+        def in_progress(endpoint):
+            return registry.get_sample_value(
+                'flask_http_requests_in_progress',
+                {'method': 'GET', 'endpoint': endpoint}
+            )
+
+        threads = [
+            threading.Thread(target=self.app.test_client().get, args=('/slow',))
+            for _ in range(64)
+        ]
+
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            started.acquire()
+
+        self.assertEqual(in_progress('slow'), 64.0)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(in_progress('slow'), 0.0)
+
+        self.assertRaises(ValueError, self.client.get, '/error')
+        self.assertEqual(in_progress('error'), 0.0)
+
+        # the scrapes of the metrics endpoint are not counted
+        response = self.client.get('/metrics')
+        self.assertNotIn(b'endpoint="prometheus_metrics"', response.data)
+
+    def test_shared_series(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, group_by='endpoint')
+
+        @self.app.route('/test/<int:status>')
+        def test(status):
+            return 'OK', status
+
+        for status in (200, 200, 200, 404):
+            self.client.get('/test/%d' % status)
+
+        hostname = os.getenv('HOSTNAME', 'bayesian-api')
+        labels = {'method': 'GET', 'endpoint': 'test', 'hostname': hostname, 'status': '200'}
+
+        self.assertEqual(registry.get_sample_value('flask_http_request_total', labels), 3.0)
+
+        histogram_labels = dict(labels, pid=str(os.getpid()))
+        total = registry.get_sample_value('flask_http_request_duration_seconds_sum', histogram_labels)
+        count = registry.get_sample_value('flask_http_request_duration_seconds_count', histogram_labels)
+        self.assertEqual(count, 3.0)
+
+        # the average of the series with the same labels
+        self.assertAlmostEqual(
+            registry.get_sample_value('flask_http_request_average', labels), total / count
+        )
+
+        labels['status'] = '404'
+        self.assertEqual(registry.get_sample_value('flask_http_request_total', labels), 1.0)
+
+        # the label values are shared by the children of the different metrics
+        counter_labels = [key for key in self._children('flask_http_request_total', registry)]
+        gauge_labels = [key for key in self._children('flask_http_request_average', registry)]
+        for counter_key, gauge_key in zip(sorted(counter_labels), sorted(gauge_labels)):
+            for counter_value, gauge_value in zip(counter_key, gauge_key):
+                self.assertIs(counter_value, gauge_value)
+
+    @staticmethod
+    def _children(name, registry):
+        for collector in registry._collector_to_names:
+            if getattr(collector, '_name', None) == name.replace('_total', ''):
+                return collector._metrics.keys()
+
+    def test_queue_time(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, group_by='endpoint',
+                     queue_time_header=['X-Request-Start', 'X-Queue-Start'])
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        def queue_time(suffix):
+            return registry.get_sample_value(
+                'flask_http_request_queue_seconds_%s' % suffix,
+                {'method': 'GET', 'endpoint': 'test'}
+            )
+
+        now = time.time()
+
+        # milliseconds, microseconds and seconds with fractions
+        self.client.get('/test', headers={'X-Request-Start': '%d' % ((now - 0.5) * 1e3)})
+        self.client.get('/test', headers={'X-Request-Start': 't=%d' % ((now - 0.5) * 1e6)})
+        self.client.get('/test', headers={'X-Queue-Start': 't=%.3f' % (now - 0.5)})
+
+        self.assertEqual(queue_time('count'), 3.0)
+        self.assertGreaterEqual(queue_time('sum'), 1.49)
+        self.assertLess(queue_time('sum'), 3.0)
+
+        # clamped for clock skew
+        self.client.get('/test', headers={'X-Request-Start': 't=%d' % ((now + 60) * 1e3)})
+        self.assertEqual(queue_time('count'), 4.0)
+        self.assertLess(queue_time('sum'), 3.0)
+
+        # not observed without a valid header
+        self.client.get('/test')
+        self.client.get('/test', headers={'X-Request-Start': 'invalid'})
+        self.client.get('/test', headers={'X-Request-Start': 'inf'})
+        self.assertEqual(queue_time('count'), 4.0)
+
+    def test_status_classes_and_methods(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, group_by='endpoint',
+                     status_classes=True, exact_statuses=(404,), normalize_methods=True)
+
+        @self.app.route('/test/<int:status>', methods=['GET', 'PROPFIND'])
+        def test(status):
+            return 'OK', status
+
+        for status in (200, 201, 204, 404, 500, 503):
+            self.client.get('/test/%d' % status)
+
+        self.client.open('/test/200', method='PROPFIND')
+
+        def total(method, status):
+            return registry.get_sample_value('flask_http_request_total', {
+                'method': method, 'endpoint': 'test', 'status': status,
+                'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+            })
+
+        self.assertEqual(total('GET', '2xx'), 3.0)
+        self.assertEqual(total('GET', '404'), 1.0)
+        self.assertEqual(total('GET', '5xx'), 2.0)
+        self.assertEqual(total('other', '2xx'), 1.0)
+        self.assertIsNone(total('GET', '200'))
+        self.assertIsNone(total('PROPFIND', '2xx'))
+
+    def test_warm_up(self):
+        from flask import Flask, Blueprint
+
+        registry = CollectorRegistry(auto_describe=True)
+
+        @self.app.route('/early')
+        def early():
+            return 'OK'
+
+        metrics = self.metrics(registry=registry, group_by='endpoint', warm_up_statuses=(200, 500))
+
+        @self.app.route('/late', methods=['GET', 'POST'])
+        def late():
+            return 'OK'
+
+        blueprint = Blueprint('bp', __name__)
+
+        @blueprint.route('/blueprint')
+        def view():
+            return 'OK'
+
+        self.app.register_blueprint(blueprint)
+
+        def total(endpoint, method='GET', status='200'):
+            return registry.get_sample_value('flask_http_request_total', {
+                'method': method, 'endpoint': endpoint, 'status': status,
+                'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+            })
+
+        self.assertEqual(total('early'), 0.0)
+        self.assertEqual(total('early', status='500'), 0.0)
+        self.assertIsNone(total('late'))
+
+        # on the scrape of the metrics endpoint
+        self.client.get('/metrics')
+
+        self.assertEqual(total('late'), 0.0)
+        self.assertEqual(total('late', method='POST'), 0.0)
+        self.assertEqual(total('bp.view'), 0.0)
+        self.assertIsNone(total('early', method='POST'))
+        self.assertIsNone(total('prometheus_metrics'))
+
+        self.client.get('/late')
+
+        self.assertEqual(total('late'), 1.0)
+        self.assertEqual(registry.get_sample_value('flask_http_request_duration_seconds_count', {
+            'method': 'GET', 'endpoint': 'bp.view', 'status': '200', 'pid': str(os.getpid()),
+            'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+        }), 0.0)
+
+        # grouped by path, only the rules without variables are known upfront
+        registry = CollectorRegistry(auto_describe=True)
+        self.app = Flask(__name__)
+
+        @self.app.route('/static-path')
+        @self.app.route('/item/<idx>')
+        def by_path(idx=None):
+            return 'OK'
+
+        self.metrics(registry=registry, warm_up_statuses=(200,))
+
+        def by_path_total(path):
+            return registry.get_sample_value('flask_http_request_total', {
+                'method': 'GET', 'path': path, 'status': '200',
+                'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+            })
+
+        self.assertEqual(by_path_total('/static-path'), 0.0)
+        self.assertIsNone(by_path_total('/item/<idx>'))
@@ -152,6 +152,35 @@ class EndpointTest(BaseTestCase):
             ('method', 'GET'), ('status', 400)
         )
 
+    def test_exception_with_stacked_decorators(self):
+        metrics = self.metrics()
+
+        handled = []
+        original_handler = self.app.handle_user_exception
+
+        def handle_user_exception(e):
+            handled.append(e)
+            return original_handler(e)
+
+        self.app.handle_user_exception = handle_user_exception
+
+        @self.app.route('/exception')
+        @metrics.counter('outer_with_exception', 'Outer decorator',
+                         labels={'status': lambda r: r.status_code})
+        @metrics.summary('inner_with_exception', 'Inner decorator',
+                         labels={'status': lambda r: r.status_code})
+        def raise_exception():
+            raise NotImplementedError('On purpose')
+
+        with self.assertRaises(NotImplementedError):
+            self.client.get('/exception')
+
+        # once by the inner decorator, then once by Flask itself
+        self.assertEqual(len(handled), 2)
+
+        self.assertMetric('outer_with_exception_total', 1.0, ('status', 500))
+        self.assertMetric('inner_with_exception_count', 1.0, ('status', 500))
+
     def test_error_handler(self):
         metrics = self.metrics()
 
@@ -0,0 +1,91 @@
+import unittest
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, Summary, Info
+from prometheus_client import generate_latest
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.exposition import StreamingRenderer
+
+
+class StreamingRendererTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = CollectorRegistry()
+
+        self.counter = Counter(
+            'requests', 'Requests\nwith "escaping" \\', ('path',), registry=self.registry
+        )
+        self.histogram = Histogram(
+            'latency', 'Latency', ('path', 'method'), registry=self.registry, buckets=(0.1, 1)
+        )
+        Summary('summary', 'Summary', registry=self.registry).observe(2)
+        Gauge('temperature', 'Temperature', registry=self.registry).set(-1.5)
+        Info('build', 'Build', registry=self.registry).info({'version': '1.0'})
+
+        for path in ('/a', '/b\\c', '/"quoted"', '/new\nline'):
+            self.counter.labels(path).inc()
+            self.histogram.labels(path, 'GET').observe(0.5)
+
+    def render(self, renderer):
+        return b''.join(renderer.render(self.registry))
+
+    def test_same_output(self):
+        renderer = StreamingRenderer(chunk_size=7)
+
+        self.assertEqual(self.render(renderer), generate_latest(self.registry))
+
+        # with the cached labels, and with changed values and label sets
+        self.counter.labels('/a').inc(5)
+        self.histogram.labels('/c', 'POST').observe(0.05)
+
+        self.assertEqual(self.render(renderer), generate_latest(self.registry))
+        self.assertEqual(
+            self.render(StreamingRenderer(label_cache=False)), generate_latest(self.registry)
+        )
+
+    def test_chunks(self):
+        chunks = list(StreamingRenderer(chunk_size=10).render(self.registry))
+
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(chunk.count(b'\n') <= 10 for chunk in chunks))
+
+    def test_bounded_cache(self):
+        renderer = StreamingRenderer()
+        registry = CollectorRegistry()
+        gauge = Gauge('items', 'Items', ('item',), registry=registry)
+
+        for idx in range(100):
+            gauge.labels(str(idx)).set(idx)
+
+        b''.join(renderer.render(registry))
+        self.assertEqual(len(renderer._caches['items']), 100)
+
+        for idx in range(90):
+            gauge.remove(str(idx))
+
+        b''.join(renderer.render(registry))
+        self.assertEqual(len(renderer._caches['items']), 10)
+
+
+class StreamingEndpointTest(BaseTestCase):
+    def test_streamed_response(self):
+        registry = CollectorRegistry(auto_describe=True)
+        metrics = self.metrics(registry=registry, stream_metrics=True)
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn('text/plain', response.headers['Content-Type'])
+        self.assertIn(b'flask_http_request_total{', response.data)
+
+        # the restricted registry of the requested names
+        response = self.client.get('/metrics?name[]=flask_exporter_info')
+        self.assertEqual(response.data, generate_latest(
+            metrics.registry.restricted_registry(['flask_exporter_info'])
+        ))
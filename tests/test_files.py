@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prometheus_flask_exporter.files import write_json, read_json, multiprocess_directory
+
+
+class FilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        filename = os.path.join(self.directory, 'data.json')
+
+        write_json(filename, {'a': 1})
+        write_json(filename, {'b': 2})
+
+        self.assertEqual(read_json(filename), {'b': 2})
+        self.assertEqual(os.listdir(self.directory), ['data.json'])
+
+        # missing or partially written
+        self.assertIsNone(read_json(os.path.join(self.directory, 'missing.json')))
+
+        with open(filename, 'w') as output:
+            output.write('{"b"')
+
+        self.assertIsNone(read_json(filename))
+
+    def test_failed_write(self):
+        # the target is a directory, so the temporary file can not replace it
+        target = os.path.join(self.directory, 'target')
+        os.mkdir(target)
+        os.mkdir(os.path.join(target, 'child'))
+
+        self.assertRaises(OSError, write_json, target, {'a': 1})
+        self.assertEqual(os.listdir(self.directory), ['target'])
+
+    def test_multiprocess_directory(self):
+        os.environ['prometheus_multiproc_dir'] = self.directory
+
+        try:
+            self.assertEqual(multiprocess_directory(), self.directory)
+
+            os.environ['prometheus_multiproc_dir'] = os.path.join(self.directory, 'missing')
+            self.assertIsNone(multiprocess_directory())
+
+        finally:
+            del os.environ['prometheus_multiproc_dir']
+
+        self.assertIsNone(multiprocess_directory())
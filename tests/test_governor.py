@@ -0,0 +1,143 @@
+import os
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.governor import (
+    OverloadGovernor, FULL, SAMPLED, COUNTERS_ONLY
+)
+
+MS = 1000000
+SECOND = 1000 * MS
+
+
+class OverloadGovernorTest(unittest.TestCase):
+    def test_overhead(self):
+        governor = OverloadGovernor(max_overhead=0.1, recovery_windows=2)
+        start = governor._window_start
+
+        # 20% of the time spent in the hooks
+        governor.record(200 * MS, start + SECOND)
+        self.assertEqual(governor.level, SAMPLED)
+
+        governor.record(150 * MS, start + 2 * SECOND)
+        self.assertEqual(governor.level, COUNTERS_ONLY)
+
+        # cheap at this level, but it would be 15% at the level above
+        governor.record(10 * MS, start + 3 * SECOND)
+        governor.record(10 * MS, start + 4 * SECOND)
+        self.assertEqual(governor.level, COUNTERS_ONLY)
+
+        # the load drops below the half of the threshold
+        governor.record(10 * MS, start + 14 * SECOND)
+        self.assertEqual(governor.level, COUNTERS_ONLY)
+        governor.record(10 * MS, start + 24 * SECOND)
+        self.assertEqual(governor.level, SAMPLED)
+
+        # it would be 20% at the level above
+        for idx in range(2):
+            governor.record(10 * MS, start + (25 + idx) * SECOND)
+        self.assertEqual(governor.level, SAMPLED)
+
+        for idx in range(2):
+            governor.record(10 * MS, start + (36 + 10 * idx) * SECOND)
+        self.assertEqual(governor.level, FULL)
+
+    def test_request_rate(self):
+        governor = OverloadGovernor(max_overhead=None, max_request_rate=100, recovery_windows=1)
+        start = governor._window_start
+
+        for idx in range(200):
+            governor.record(0, start + idx * MS)
+        self.assertEqual(governor.level, FULL)
+
+        governor.record(0, start + SECOND)
+        self.assertEqual(governor.level, SAMPLED)
+
+        # above the half of the maximum rate
+        for idx in range(60):
+            governor.record(0, start + SECOND + idx * MS)
+        governor.record(0, start + 2 * SECOND)
+        self.assertEqual(governor.level, SAMPLED)
+
+        governor.record(0, start + 3 * SECOND)
+        self.assertEqual(governor.level, FULL)
+
+    def test_sample(self):
+        governor = OverloadGovernor(sample_rate=0.5)
+
+        self.assertTrue(all(governor.sample() for _ in range(100)))
+
+        governor.level = SAMPLED
+        sampled = sum(1 for _ in range(1000) if governor.sample())
+        self.assertTrue(300 < sampled < 700, sampled)
+
+        governor.level = COUNTERS_ONLY
+        self.assertFalse(any(governor.sample() for _ in range(100)))
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, OverloadGovernor, max_overhead=None)
+        self.assertRaises(ValueError, OverloadGovernor, sample_rate=0)
+
+
+class GovernedDefaultsTest(BaseTestCase):
+    def test_levels(self):
+        governor = OverloadGovernor(window=3600)
+        self.metrics(
+            registry=CollectorRegistry(auto_describe=True), group_by='endpoint',
+            track_in_progress=True, governor=governor
+        )
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        @self.app.route('/in-progress')
+        def in_progress():
+            response = self.client.get('/metrics')
+            self.assertIn(
+                b'flask_http_requests_in_progress{endpoint="in_progress",method="GET"} 1.0',
+                response.data
+            )
+            return 'OK'
+
+        labels = (
+            ('endpoint', 'test'), ('hostname', 'bayesian-api'), ('method', 'GET'),
+            ('status', 200)
+        )
+        pid = os.getpid()
+
+        self.client.get('/test')
+        self.assertMetric('flask_exporter_governor_level', '0.0')
+
+        governor._change(COUNTERS_ONLY)
+
+        for _ in range(3):
+            self.client.get('/test')
+
+        self.assertMetric('flask_exporter_governor_level', '2.0')
+        self.assertMetric('flask_http_request_total', '4.0', *labels)
+        self.assertMetric(
+            'flask_http_request_duration_seconds_count', '1.0', *labels + (('pid', pid),)
+        )
+        self.assertMetric(
+            'flask_http_requests_in_progress', '0.0', ('method', 'GET'), ('endpoint', 'test')
+        )
+
+        # still tracked while overloaded
+        self.assertEqual(self.client.get('/in-progress').status_code, 200)
+        self.assertMetric(
+            'flask_http_requests_in_progress', '0.0',
+            ('method', 'GET'), ('endpoint', 'in_progress')
+        )
+
+        governor._change(FULL)
+        self.client.get('/test')
+
+        self.assertMetric(
+            'flask_http_request_duration_seconds_count', '2.0', *labels + (('pid', pid),)
+        )
+        # the scrapes of the metrics endpoint are not tracked
+        self.assertEqual(governor._requests, 6)
+        self.assertGreater(governor._overhead, 0)
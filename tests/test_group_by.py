@@ -53,6 +53,22 @@ class GroupByTest(BaseTestCase):
                 endpoint='/metrics'
             )
 
+    def test_group_by_path_unicode(self):
+        self.metrics(group_by='path')
+
+        @self.app.route('/<url>')
+        def a_test_endpoint(url):
+            return url + ' is OK'
+
+        self.client.get(u'/caf\u00e9')
+        self.client.get(u'/caf\u00e9')
+
+        response = self.client.get('/metrics')
+        self.assertIn(
+            u'method="GET",path="/caf\u00e9",status="200"} 2.0',
+            response.data.decode('utf-8')
+        )
+
     def test_group_by_rule(self):
         self.metrics(group_by='url_rule')
 
@@ -0,0 +1,127 @@
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
+
+
+class GunicornSnapshotTest(BaseTestCase):
+    def setUp(self):
+        super(GunicornSnapshotTest, self).setUp()
+
+        self.directory = tempfile.mkdtemp()
+        os.environ['prometheus_multiproc_dir'] = self.directory
+
+        # another worker holds the lock, so this one doesn't refresh the snapshot
+        self.other_worker = open(os.path.join(self.directory, 'scrape_snapshot.lock'), 'a')
+        fcntl.flock(self.other_worker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def tearDown(self):
+        self.other_worker.close()
+        del os.environ['prometheus_multiproc_dir']
+        os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        shutil.rmtree(self.directory)
+
+    def test_serve_snapshot(self):
+        metrics = GunicornInternalPrometheusMetrics(self.app, snapshot_interval=60)
+
+        # there is no snapshot yet, rendered on demand
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+
+        with open(os.path.join(self.directory, 'scrape_snapshot.prom'), 'w') as snapshot:
+            snapshot.write('snapshot_metric 1.0\n')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'snapshot_metric 1.0\n')
+        self.assertIn('text/plain', response.headers['Content-Type'])
+
+        # the snapshot can't be filtered, so it is rendered on demand
+        response = self.client.get('/metrics?name[]=snapshot_metric')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'snapshot_metric', response.data)
+
+        self.assertFalse(metrics._snapshot.elect())
+
+    def test_stale_snapshot(self):
+        metrics = GunicornInternalPrometheusMetrics(self.app, snapshot_interval=60)
+
+        with open(metrics._snapshot.filename, 'w') as snapshot:
+            snapshot.write('snapshot_metric 1.0\n')
+
+        # still served two intervals later
+        two_intervals_ago = time.time() - 120
+        os.utime(metrics._snapshot.filename, (two_intervals_ago, two_intervals_ago))
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.data, b'snapshot_metric 1.0\n')
+
+        # the refreshing process is stuck, rendered on demand
+        long_ago = time.time() - 600
+        os.utime(metrics._snapshot.filename, (long_ago, long_ago))
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'snapshot_metric', response.data)
+
+        metrics._snapshot._renders.acquire()
+
+        try:
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 503)
+
+        finally:
+            metrics._snapshot._renders.release()
+
+    def test_failed_refresh(self):
+        metrics = GunicornInternalPrometheusMetrics(self.app, snapshot_interval=60)
+        snapshot = metrics._snapshot
+
+        self.other_worker.close()
+
+        def refresh():
+            raise ValueError('failed')
+
+        snapshot.refresh = refresh
+
+        # logged, and retried on the next round
+        snapshot._try_refresh()
+        self.assertTrue(snapshot.elect())
+
+    def test_concurrent_renders(self):
+        metrics = GunicornInternalPrometheusMetrics(
+            self.app, snapshot_interval=60, max_concurrent_renders=1
+        )
+
+        # a render in progress
+        metrics._snapshot._renders.acquire()
+
+        try:
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+
+        finally:
+            metrics._snapshot._renders.release()
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+
+    def test_election(self):
+        metrics = GunicornInternalPrometheusMetrics(self.app, snapshot_interval=60)
+        snapshot = metrics._snapshot
+
+        self.assertFalse(snapshot.elect())
+
+        # the other worker exits
+        self.other_worker.close()
+
+        self.assertTrue(snapshot.elect())
+        self.assertTrue(snapshot.elect())
+
+        snapshot.refresh()
+        self.assertTrue(os.path.isfile(snapshot.filename))
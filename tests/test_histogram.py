@@ -0,0 +1,71 @@
+import re
+import random
+import unittest
+
+from prometheus_client import CollectorRegistry, Histogram, generate_latest
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.histogram import FastHistogram
+
+
+class FastHistogramTest(unittest.TestCase):
+    def exposition(self, registry):
+        # the creation timestamps are expected to differ
+        return re.sub(r'(?m)^.*_created.*$', '', generate_latest(registry).decode('utf-8'))
+
+    def test_same_output(self):
+        buckets = tuple(0.001 * 1.3 ** idx for idx in range(40))
+        original_registry, fast_registry = CollectorRegistry(), CollectorRegistry()
+
+        original = Histogram('latency', 'Latency', ('path',), buckets=buckets,
+                             registry=original_registry)
+        fast = FastHistogram('latency', 'Latency', ('path',), buckets=buckets,
+                             registry=fast_registry)
+
+        values = [random.expovariate(10) for _ in range(1000)]
+        values.extend(buckets)  # exactly on the bounds
+        values.extend((-1.0, 0.0, 1e9, float('inf'), float('nan')))
+
+        for idx, value in enumerate(values):
+            original.labels('/%d' % (idx % 3)).observe(value)
+            fast.labels('/%d' % (idx % 3)).observe(value)
+
+        self.assertEqual(self.exposition(original_registry), self.exposition(fast_registry))
+
+    def test_without_labels(self):
+        registry = CollectorRegistry()
+        histogram = FastHistogram('plain', 'Plain', buckets=(1, 2), registry=registry)
+
+        histogram.observe(1.5)
+        histogram.observe(0.5)
+
+        self.assertEqual(registry.get_sample_value('plain_bucket', {'le': '1.0'}), 1.0)
+        self.assertEqual(registry.get_sample_value('plain_bucket', {'le': '2.0'}), 2.0)
+        self.assertEqual(registry.get_sample_value('plain_bucket', {'le': '+Inf'}), 2.0)
+        self.assertEqual(registry.get_sample_value('plain_sum'), 2.0)
+
+
+class FastHistogramMetricsTest(BaseTestCase):
+    def test_fast_histograms(self):
+        metrics = self.metrics(fast_histograms=True)
+
+        @self.app.route('/test')
+        @metrics.histogram('hist_fast', 'Fast histogram', buckets=(0.5, 1.0))
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+        self.client.get('/test')
+
+        self.assertMetric('hist_fast_count', '2.0')
+        self.assertMetric('hist_fast_bucket', '2.0', ('le', '0.5'))
+        self.assertMetric('hist_fast_bucket', '2.0', ('le', '+Inf'))
+
+        response = self.client.get('/metrics')
+        self.assertIn(
+            b'flask_http_request_duration_seconds_bucket{hostname=', response.data
+        )
+        self.assertRegex(
+            response.data.decode('utf-8'),
+            r'flask_http_request_duration_seconds_count\{[^}]*path="/test"[^}]*\} 2.0'
+        )
@@ -0,0 +1,121 @@
+import re
+import unittest
+
+from flask import Blueprint, abort
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.instrument import InstrumentationPolicy
+
+
+class InstrumentationPolicyTest(unittest.TestCase):
+    def test_metrics_for(self):
+        policy = InstrumentationPolicy(
+            metrics=('histogram', 'counter'),
+            exclude=['health', re.compile(r'/internal/')],
+            overrides=[('admin.*', ('counter',)), ('/slow/*', ('sketch', 'gauge'))]
+        )
+
+        self.assertEqual(policy.metrics_for('index', ['/']), ('histogram', 'counter'))
+        self.assertEqual(policy.metrics_for('health', ['/health']), ())
+        self.assertEqual(policy.metrics_for('debug', ['/internal/debug']), ())
+        self.assertEqual(policy.metrics_for('admin.users', ['/admin/users']), ('counter',))
+        self.assertEqual(policy.metrics_for('report', ['/slow/<name>']), ('sketch', 'gauge'))
+        self.assertEqual(policy.used_metrics(), ('histogram', 'counter', 'sketch', 'gauge'))
+
+    def test_patterns_with_flags(self):
+        policy = InstrumentationPolicy(
+            metrics=('counter',),
+            exclude=['debug', re.compile('health', re.I)],
+            overrides=[(re.compile('(?i)admin'), ('gauge',))]
+        )
+
+        self.assertEqual(policy.metrics_for('HEALTH', ['/ping']), ())
+        self.assertEqual(policy.metrics_for('debug', ['/debug']), ())
+        self.assertEqual(policy.metrics_for('Admin.users', ['/users']), ('gauge',))
+        self.assertEqual(policy.metrics_for('index', ['/']), ('counter',))
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, InstrumentationPolicy, metrics=('timer',))
+        self.assertRaises(TypeError, InstrumentationPolicy, labels=['status'])
+
+
+class InstrumentTest(BaseTestCase):
+    def test_instrument_app(self):
+        registry = CollectorRegistry(auto_describe=True)
+        metrics = self.metrics(registry=registry)
+
+        @self.app.route('/one')
+        def one():
+            return 'OK'
+
+        @self.app.route('/two/<int:status>')
+        def two(status):
+            abort(status)
+
+        @self.app.route('/health')
+        def health():
+            return 'OK'
+
+        metrics.instrument(self.app, InstrumentationPolicy(
+            metrics=('histogram', 'counter'), exclude=['health'],
+            labels={'status': lambda r: r.status_code}
+        ))
+
+        self.client.get('/one')
+        self.client.get('/one')
+        self.client.get('/two/404')
+        self.client.get('/health')
+
+        self.assertMetric('flask_view_invocations_total', '2.0', ('endpoint', 'one'), ('status', 200))
+        self.assertMetric('flask_view_invocations_total', '1.0', ('endpoint', 'two'), ('status', 404))
+        self.assertMetric(
+            'flask_view_duration_seconds_count', '2.0', ('endpoint', 'one'), ('status', 200)
+        )
+
+        self.assertAbsent('flask_view_invocations_total', ('endpoint', 'health'), ('status', 200))
+        self.assertAbsent(
+            'flask_view_invocations_total', ('endpoint', 'prometheus_metrics'), ('status', 200)
+        )
+
+    def test_instrument_blueprint(self):
+        registry = CollectorRegistry(auto_describe=True)
+        metrics = self.metrics(registry=registry)
+
+        blueprint = Blueprint('api', __name__)
+
+        @blueprint.route('/items')
+        def items():
+            return 'OK'
+
+        @blueprint.route('/items/<int:idx>')
+        def item(idx):
+            raise ValueError('Failed')
+
+        @self.app.route('/other')
+        def other():
+            return 'OK'
+
+        policy = InstrumentationPolicy(metrics=('counter', 'gauge'), prefix='api')
+        metrics.instrument(blueprint, policy)
+        self.app.register_blueprint(blueprint, url_prefix='/api')
+
+        for _ in range(3):
+            self.client.get('/api/items')
+
+        # propagated in testing mode
+        self.assertRaises(ValueError, self.client.get, '/api/items/1')
+        self.client.get('/other')
+
+        self.assertMetric('api_invocations_total', '3.0', ('endpoint', 'api.items'))
+        self.assertMetric('api_invocations_total', '1.0', ('endpoint', 'api.item'))
+        self.assertMetric('api_in_progress', '0.0', ('endpoint', 'api.items'))
+        self.assertAbsent('api_invocations_total', ('endpoint', 'other'))
+
+        # not wrapped again
+        metrics.instrument(self.app, policy)
+        self.client.get('/api/items')
+        self.client.get('/other')
+
+        self.assertMetric('api_invocations_total', '4.0', ('endpoint', 'api.items'))
+        self.assertMetric('api_invocations_total', '1.0', ('endpoint', 'other'))
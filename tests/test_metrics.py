@@ -146,3 +146,80 @@ class MetricsTest(BaseTestCase):
             'cnt_2_total', '1.0',
             ('uri', '/test/2'), ('code', 200)
         )
+
+    def test_lazy_metrics(self):
+        metrics = self.metrics(lazy_metrics=True)
+
+        @self.app.route('/used')
+        @metrics.counter('cnt_used', 'Used counter')
+        def used():
+            return 'OK'
+
+        @self.app.route('/unused')
+        @metrics.histogram('hist_unused', 'Unused histogram', labels={
+            'code': lambda r: r.status_code
+        })
+        def unused():
+            return 'OK'
+
+        response = self.client.get('/metrics')
+        self.assertNotIn(b'cnt_used', response.data)
+        self.assertNotIn(b'hist_unused', response.data)
+
+        self.client.get('/used')
+
+        self.assertMetric('cnt_used_total', '1.0')
+        self.assertAbsent('hist_unused_count')
+
+        metrics.declare_metrics()
+
+        response = self.client.get('/metrics')
+        self.assertIn(b'# TYPE hist_unused histogram', response.data)
+
+        self.client.get('/unused')
+
+        self.assertMetric('hist_unused_count', '1.0', ('code', 200))
+        self.assertMetric('cnt_used_total', '1.0')
+
+    def test_timer(self):
+        metrics = self.metrics(group_by='endpoint')
+
+        db_timer = metrics.timer('db')
+
+        @db_timer
+        def query():
+            return 'row'
+
+        @self.app.route('/test')
+        def test():
+            query()
+            query()
+
+            with metrics.timer('downstream'):
+                pass
+
+            return 'OK'
+
+        @self.app.route('/untimed')
+        def untimed():
+            return 'OK'
+
+        # not recorded outside of requests
+        query()
+
+        self.client.get('/test')
+        self.client.get('/test')
+        self.client.get('/untimed')
+
+        self.assertMetric(
+            'flask_http_request_operation_duration_seconds_count', '2.0',
+            ('operation', 'db'), ('endpoint', 'test')
+        )
+        self.assertMetric(
+            'flask_http_request_operation_duration_seconds_count', '2.0',
+            ('operation', 'downstream'), ('endpoint', 'test')
+        )
+        self.assertAbsent(
+            'flask_http_request_operation_duration_seconds_count',
+            ('endpoint', 'untimed')
+        )
@@ -0,0 +1,81 @@
+import os
+import re
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.normalizer import PathNormalizer, DEFAULT_RULES, NUMERIC_SEGMENTS
+
+
+class PathNormalizerTest(unittest.TestCase):
+    def test_default_rules(self):
+        normalizer = PathNormalizer()
+
+        self.assertEqual(normalizer('/items/123'), '/items/<int>')
+        self.assertEqual(normalizer('/items/123/parts/4/'), '/items/<int>/parts/<int>/')
+        self.assertEqual(
+            normalizer('/users/550e8400-e29b-41d4-a716-446655440000/orders'),
+            '/users/<uuid>/orders'
+        )
+        self.assertEqual(normalizer('/blobs/0123456789abcdef0123'), '/blobs/<hex>')
+        self.assertEqual(normalizer('/v2/items'), '/v2/items')
+        self.assertEqual(normalizer('/cafe'), '/cafe')
+
+    def test_rule_order(self):
+        # the first rule matching at the same position wins
+        normalizer = PathNormalizer([
+            (re.compile(r'(?<=/users/)(\w+)'), '<user>'),
+            NUMERIC_SEGMENTS
+        ])
+
+        self.assertEqual(normalizer('/users/42/posts/7'), '/users/<user>/posts/<int>')
+
+        normalizer = PathNormalizer(DEFAULT_RULES + ((r'[^/]+\.(png|jpe?g)$', '<image>'),))
+
+        self.assertEqual(normalizer('/static/123/logo.png'), '/static/<int>/<image>')
+        self.assertEqual(normalizer('/static/logo.css'), '/static/logo.css')
+
+    def test_segment_rules(self):
+        segments = PathNormalizer(cache_size=0)
+        # a rule that never matches turns off the matching of segments only
+        generic = PathNormalizer(DEFAULT_RULES + (('(?!)', 'never'),), cache_size=0)
+
+        for path in ('/1/2', '//3//', '/a1/1a/11', '/4.5/6-7',
+                     '/0123456789abcdef0123/550e8400-e29b-41d4-a716-446655440000'):
+            self.assertEqual(segments(path), generic(path))
+
+    def test_bounded_cache(self):
+        normalizer = PathNormalizer(cache_size=10)
+
+        for idx in range(25):
+            self.assertEqual(normalizer('/items/%d' % idx), '/items/<int>')
+            self.assertLessEqual(len(normalizer._cache), 10)
+
+        normalizer = PathNormalizer(cache_size=0)
+        self.assertEqual(normalizer('/items/1'), '/items/<int>')
+        self.assertEqual(len(normalizer._cache), 0)
+
+
+class PathNormalizerMetricsTest(BaseTestCase):
+    def test_normalized_paths(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, path_normalizer=DEFAULT_RULES)
+
+        @self.app.route('/items/<item>')
+        def item(item):
+            return 'OK'
+
+        self.client.get('/items/1')
+        self.client.get('/items/2')
+        self.client.get('/missing/3')
+
+        labels = {
+            'method': 'GET', 'hostname': os.getenv('HOSTNAME', 'bayesian-api'),
+            'path': '/items/<int>', 'status': '200'
+        }
+
+        self.assertEqual(registry.get_sample_value('flask_http_request_total', labels), 2.0)
+
+        labels.update(path='/missing/<int>', status='404')
+        self.assertEqual(registry.get_sample_value('flask_http_request_total', labels), 1.0)
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+from array import array
+
+from flask import Flask
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter import PrometheusMetrics
+from prometheus_flask_exporter.persistence import PersistentState, _to_bytes, _from_bytes
+
+
+class PersistentStateTest(BaseTestCase):
+    def setUp(self):
+        super(PersistentStateTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'metrics.state')
+        self.states = []
+
+    def tearDown(self):
+        for state in self.states:
+            state.stop()
+
+        shutil.rmtree(self.directory)
+
+    def start(self, **kwargs):
+        app = Flask(__name__)
+        registry = CollectorRegistry(auto_describe=True)
+        state = PersistentState(self.filename, interval=None)
+        self.states.append(state)
+
+        PrometheusMetrics(app, registry=registry, group_by='endpoint',
+                          persistent_state=state, **kwargs)
+
+        @app.route('/test/<int:status>')
+        def test(status):
+            return 'OK', status
+
+        return app.test_client(), registry, state
+
+    def sample(self, registry, name, status, **labels):
+        labels.update({
+            'method': 'GET', 'endpoint': 'test', 'status': str(status),
+            'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+        })
+
+        if 'duration' in name:
+            labels['pid'] = str(os.getpid())
+
+        return registry.get_sample_value(name, labels)
+
+    def test_restore(self):
+        client, registry, state = self.start()
+
+        for status in (200, 200, 200, 404):
+            client.get('/test/%d' % status)
+
+        total = self.sample(registry, 'flask_http_request_duration_seconds_sum', 200)
+
+        state.save()
+
+        # restart
+        client, registry, state = self.start()
+
+        self.assertEqual(self.sample(registry, 'flask_http_request_total', 200), 3.0)
+        self.assertEqual(self.sample(registry, 'flask_http_request_total', 404), 1.0)
+        self.assertEqual(self.sample(registry, 'flask_http_request_duration_seconds_count', 200), 3.0)
+        self.assertEqual(self.sample(registry, 'flask_http_request_duration_seconds_sum', 200), total)
+        self.assertEqual(self.sample(
+            registry, 'flask_http_request_duration_seconds_bucket', 200, le='+Inf'
+        ), 3.0)
+        self.assertAlmostEqual(self.sample(registry, 'flask_http_request_average', 200), total / 3)
+
+        client.get('/test/200')
+
+        self.assertEqual(self.sample(registry, 'flask_http_request_total', 200), 4.0)
+        self.assertEqual(self.sample(registry, 'flask_http_request_duration_seconds_count', 200), 4.0)
+
+    def test_restore_fast_histograms(self):
+        client, registry, state = self.start(fast_histograms=True)
+        client.get('/test/200')
+        state.save()
+
+        client, registry, state = self.start(fast_histograms=True)
+        self.assertEqual(self.sample(registry, 'flask_http_request_duration_seconds_count', 200), 1.0)
+
+    def test_changed_buckets(self):
+        client, registry, state = self.start()
+        client.get('/test/200')
+        state.save()
+
+        client, registry, state = self.start(buckets=(0.1, 1.0))
+
+        self.assertEqual(self.sample(registry, 'flask_http_request_total', 200), 1.0)
+        self.assertEqual(self.sample(registry, 'flask_http_request_duration_seconds_count', 200), 0.0)
+
+    def test_status_classes(self):
+        client, registry, state = self.start(status_classes=True)
+        client.get('/test/201')
+        client.get('/test/204')
+        state.save()
+
+        client, registry, state = self.start(status_classes=True)
+        self.assertEqual(self.sample(registry, 'flask_http_request_total', '2xx'), 2.0)
+
+    def test_multiprocess_mode(self):
+        os.environ['prometheus_multiproc_dir'] = self.directory
+
+        try:
+            self.assertRaises(ValueError, self.start)
+        finally:
+            del os.environ['prometheus_multiproc_dir']
+
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_array_conversion_on_python_2(self):
+        class Python2Array(object):
+            # only has the methods of the `array` on Python 2
+            def __init__(self, data):
+                self.data = data
+
+            def tostring(self):
+                return self.data.tobytes()
+
+            def fromstring(self, raw):
+                self.data.frombytes(raw)
+
+        values = Python2Array(array('d', (1.5, 2.5)))
+        self.assertEqual(_to_bytes(values), array('d', (1.5, 2.5)).tobytes())
+
+        loaded = Python2Array(array('d'))
+        _from_bytes(loaded, _to_bytes(values))
+        self.assertEqual(list(loaded.data), [1.5, 2.5])
@@ -0,0 +1,178 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+from flask import request
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.sketch import (
+    DDSketch, Sketch, SketchMultiProcessCollector, _WRITER
+)
+
+
+class DDSketchTest(unittest.TestCase):
+    def test_relative_accuracy(self):
+        values = [random.uniform(0.001, 10.0) for _ in range(10000)]
+
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        values.sort()
+
+        for q in (0.1, 0.5, 0.9, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / expected, 1.0, delta=0.0101)
+
+        self.assertEqual(sketch.count, 10000)
+        self.assertAlmostEqual(sketch.sum, sum(values), places=6)
+
+    def test_zeros_and_empty(self):
+        sketch = DDSketch()
+        self.assertNotEqual(sketch.quantile(0.5), sketch.quantile(0.5))  # NaN
+
+        for value in (0, 0, 0, 1.0):
+            sketch.add(value)
+
+        self.assertEqual(sketch.quantiles((0.5, 0.99, 1.0)), [0.0, 0.0, sketch.quantile(1.0)])
+        self.assertAlmostEqual(sketch.quantile(1.0), 1.0, delta=0.01)
+
+    def test_merge(self):
+        first, second, combined = DDSketch(), DDSketch(), DDSketch()
+
+        for value in range(1, 1001):
+            (first if value % 2 else second).add(value)
+            combined.add(value)
+
+        first.merge(second)
+
+        self.assertEqual(first.bins, combined.bins)
+        self.assertEqual(first.count, combined.count)
+        self.assertEqual(first.quantile(0.9), combined.quantile(0.9))
+
+        self.assertRaises(ValueError, first.merge, DDSketch(relative_accuracy=0.05))
+
+    def test_bounded_bins(self):
+        sketch = DDSketch(relative_accuracy=0.01, max_bins=64)
+
+        for exponent in range(-60, 60):
+            sketch.add(2.0 ** exponent)
+
+        self.assertLessEqual(len(sketch.bins), 64)
+        self.assertAlmostEqual(sketch.quantile(1.0) / 2.0 ** 59, 1.0, delta=0.01)
+
+
+class SketchMetricTest(BaseTestCase):
+    def test_sketch_decorator(self):
+        metrics = self.metrics()
+
+        @self.app.route('/test/<int:x>')
+        @metrics.sketch('sketch_1', 'Sketch 1', labels={
+            'x_value': lambda: request.view_args['x']
+        }, quantiles=(0.5, 0.95))
+        def test(x):
+            return 'OK'
+
+        self.client.get('/test/1')
+        self.client.get('/test/1')
+
+        self.assertMetric('sketch_1_count', '2.0', ('x_value', '1'))
+        self.assertMetric('sketch_1', '[0-9.e-]+', ('quantile', '0.5'), ('x_value', '1'))
+        self.assertMetric('sketch_1', '[0-9.e-]+', ('quantile', '0.95'), ('x_value', '1'))
+        self.assertAbsent('sketch_1', ('quantile', '0.99'), ('x_value', '1'))
+
+    def test_default_duration_quantiles(self):
+        registry = CollectorRegistry(auto_describe=True)
+        self.metrics(registry=registry, duration_quantiles=(0.5, 0.99))
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+
+        labels = {
+            'method': 'GET', 'path': '/test', 'status': '200',
+            'hostname': os.getenv('HOSTNAME', 'bayesian-api')
+        }
+
+        self.assertEqual(registry.get_sample_value(
+            'flask_http_request_duration_quantiles_seconds_count', labels
+        ), 1.0)
+
+        labels['quantile'] = '0.99'
+        self.assertGreater(registry.get_sample_value(
+            'flask_http_request_duration_quantiles_seconds', labels
+        ), 0)
+
+    def test_multiprocess_merge(self):
+        directory = tempfile.mkdtemp()
+        os.environ['prometheus_multiproc_dir'] = directory
+
+        try:
+            sketch = Sketch('mp_sketch', 'Multiprocess sketch', ('path',), quantiles=(0.5,))
+            for value in range(1, 101):
+                sketch.labels('/a').observe(value)
+
+            other = DDSketch()
+            for value in range(101, 201):
+                other.add(value)
+
+            with open(os.path.join(directory, 'sketch_1.json'), 'w') as other_process:
+                json.dump({'mp_sketch': {
+                    'documentation': 'Multiprocess sketch', 'labelnames': ['path'],
+                    'quantiles': [0.5], 'relative_accuracy': 0.01, 'max_bins': 2048,
+                    'series': [[['/a'], other.to_dict()]]
+                }}, other_process)
+
+            registry = CollectorRegistry()
+            registry.register(sketch)
+            SketchMultiProcessCollector(registry)
+
+            self.assertEqual(registry.get_sample_value('mp_sketch_count', {'path': '/a'}), 200)
+            self.assertAlmostEqual(
+                registry.get_sample_value('mp_sketch', {'path': '/a', 'quantile': '0.5'}),
+                100, delta=1.01
+            )
+
+        finally:
+            _WRITER.sketches.remove(sketch)
+            del os.environ['prometheus_multiproc_dir']
+            shutil.rmtree(directory)
+
+    def test_reused_pid(self):
+        directory = tempfile.mkdtemp()
+        os.environ['prometheus_multiproc_dir'] = directory
+
+        try:
+            sketch = Sketch('pid_sketch', 'Reused pid sketch', quantiles=(0.5,))
+            for value in range(1, 101):
+                sketch.observe(value)
+
+            # written by an exited process that had the same pid
+            previous = DDSketch()
+            for value in range(101, 201):
+                previous.add(value)
+
+            filename = 'sketch_%d.json' % os.getpid()
+            with open(os.path.join(directory, filename), 'w') as previous_process:
+                json.dump({'pid_sketch': {
+                    'documentation': 'Reused pid sketch', 'labelnames': [],
+                    'quantiles': [0.5], 'relative_accuracy': 0.01, 'max_bins': 2048,
+                    'series': [[[], previous.to_dict()]]
+                }}, previous_process)
+
+            registry = CollectorRegistry()
+            SketchMultiProcessCollector(registry)
+
+            self.assertEqual(registry.get_sample_value('pid_sketch_count'), 200)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+        finally:
+            _WRITER.sketches.remove(sketch)
+            del os.environ['prometheus_multiproc_dir']
+            shutil.rmtree(directory)
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.slow_requests import SlowRequestsTracker
+
+
+class SlowRequestsTest(BaseTestCase):
+    def test_slowest_requests(self):
+        self.metrics(slow_requests=3)
+
+        @self.app.route('/sleep/<int:millis>')
+        def sleep(millis):
+            time.sleep(millis / 1000.0)
+            return 'OK'
+
+        for millis in (1, 40, 10, 30, 20, 0):
+            self.client.get('/sleep/%d' % millis)
+
+        response = self.client.get('/metrics/slowest')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+
+        requests = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(
+            [item['path'] for item in requests],
+            ['/sleep/40', '/sleep/30', '/sleep/20']
+        )
+
+        for item in requests:
+            self.assertEqual(item['endpoint'], 'sleep')
+            self.assertEqual(item['method'], 'GET')
+            self.assertEqual(item['status'], 200)
+            self.assertGreater(item['duration'], 0.015)
+            self.assertLessEqual(item['timestamp'], time.time())
+
+    def test_custom_path(self):
+        self.metrics(slow_requests=3, slow_requests_path='/slow')
+
+        self.assertEqual(self.client.get('/slow').status_code, 200)
+        self.assertEqual(self.client.get('/metrics/slowest').status_code, 404)
+
+    def test_not_enabled(self):
+        metrics = self.metrics()
+
+        self.assertRaises(ValueError, metrics.register_slow_requests_endpoint, '/slow')
+
+    def test_multiprocess_merge(self):
+        directory = tempfile.mkdtemp()
+        os.environ['prometheus_multiproc_dir'] = directory
+
+        try:
+            this_process = SlowRequestsTracker(2)
+            this_process.record(0.5, '/a', 'a', 'GET', 200)
+            this_process.record(0.1, '/b', 'b', 'GET', 200)
+
+            with open(os.path.join(directory, 'slow_requests_1.json'), 'w') as other_process:
+                json.dump([
+                    {'path': '/c', 'endpoint': 'c', 'method': 'POST', 'status': 500,
+                     'duration': 0.9, 'timestamp': time.time()},
+                    {'path': '/d', 'endpoint': 'd', 'method': 'GET', 'status': 200,
+                     'duration': 0.2, 'timestamp': time.time()}
+                ], other_process)
+
+            self.assertEqual(
+                [item['path'] for item in this_process.requests()],
+                ['/c', '/a']
+            )
+
+            # the requests of the exited processes are removed
+            exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+            exited.wait()
+
+            exited_file = os.path.join(directory, 'slow_requests_%d.json' % exited.pid)
+            with open(exited_file, 'w') as output:
+                json.dump([
+                    {'path': '/e', 'endpoint': 'e', 'method': 'GET', 'status': 200,
+                     'duration': 1.5, 'timestamp': time.time()}
+                ], output)
+
+            self.assertEqual(
+                [item['path'] for item in this_process.requests()],
+                ['/c', '/a']
+            )
+            self.assertFalse(os.path.exists(exited_file))
+
+        finally:
+            del os.environ['prometheus_multiproc_dir']
+            shutil.rmtree(directory)
+
+    def test_multiprocess_write_on_timer(self):
+        directory = tempfile.mkdtemp()
+        os.environ['prometheus_multiproc_dir'] = directory
+        filename = os.path.join(directory, 'slow_requests_%d.json' % os.getpid())
+
+        try:
+            tracker = SlowRequestsTracker(5, write_interval=0.2)
+            tracker.record(0.5, '/a', 'a', 'GET', 200)
+
+            for _ in range(50):
+                if os.path.exists(filename):
+                    break
+                time.sleep(0.05)
+
+            # recorded within the interval, with no request after it
+            tracker.record(0.7, '/b', 'b', 'GET', 200)
+
+            for _ in range(50):
+                with open(filename) as saved:
+                    if len(json.load(saved)) == 2:
+                        break
+                time.sleep(0.05)
+
+            with open(filename) as saved:
+                self.assertEqual(sorted(item['path'] for item in json.load(saved)), ['/a', '/b'])
+
+        finally:
+            del os.environ['prometheus_multiproc_dir']
+            shutil.rmtree(directory)
@@ -0,0 +1,141 @@
+import socket
+import unittest
+
+from prometheus_client import CollectorRegistry
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.statsd import StatsdExporter
+
+
+class StatsdTestMixin(object):
+    def setUp(self):
+        super(StatsdTestMixin, self).setUp()
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.settimeout(1)
+
+    def tearDown(self):
+        self.listener.close()
+
+        super(StatsdTestMixin, self).tearDown()
+
+    def exporter(self, **kwargs):
+        kwargs.setdefault('flush_interval', None)
+        return StatsdExporter(*self.listener.getsockname(), **kwargs)
+
+    def receive(self, count):
+        return [self.listener.recv(65536).decode('utf-8') for _ in range(count)]
+
+
+class StatsdExporterTest(StatsdTestMixin, unittest.TestCase):
+    def test_coalesced_metrics(self):
+        statsd = self.exporter(prefix='app')
+
+        for _ in range(100):
+            statsd.increment('requests', (('method', 'GET'),))
+        statsd.increment('requests', (('method', 'POST'),), 3)
+        statsd.gauge('in_progress', 1)
+        statsd.gauge('in_progress', 2)
+        statsd.timing('latency', 0.0125, (('path', '/a:b|c'),))
+
+        self.assertEqual(statsd.flush(), 1)
+
+        lines = self.receive(1)[0].split('\n')
+
+        self.assertEqual(sorted(lines), [
+            'app.in_progress:2|g',
+            'app.latency:12.5|ms|#path:/a_b_c',
+            'app.requests:100|c|#method:GET',
+            'app.requests:3|c|#method:POST'
+        ])
+
+        # nothing is left to send
+        self.assertEqual(statsd.flush(), 0)
+
+    def test_label_values_in_names(self):
+        statsd = self.exporter(tags=False)
+
+        statsd.increment('requests', (('method', 'GET'), ('status', 200)))
+        statsd.flush()
+
+        self.assertEqual(self.receive(1), ['requests.GET.200:1|c'])
+
+    def test_packet_size(self):
+        statsd = self.exporter(max_packet_size=512)
+
+        for idx in range(1000):
+            statsd.increment('requests', (('path', '/item/%d' % idx),))
+
+        sent = statsd.flush()
+        packets = self.receive(sent)
+
+        self.assertGreater(sent, 1)
+        self.assertTrue(all(len(packet) <= 512 for packet in packets))
+
+        lines = [line for packet in packets for line in packet.split('\n')]
+        self.assertEqual(len(lines), 1000)
+        self.assertIn('requests:1|c|#path:/item/999', lines)
+
+    def test_sampled_timings(self):
+        statsd = self.exporter(max_timings=10)
+
+        for idx in range(1000):
+            statsd.timing('latency', idx / 1000.0, (('path', '/a'),))
+        statsd.timing('latency', 0.5, (('path', '/b'),))
+
+        self.assertEqual(len(statsd._timings[('latency', (('path', '/a'),))][1]), 10)
+
+        sent = statsd.flush()
+        lines = [line for packet in self.receive(sent) for line in packet.split('\n')]
+
+        sampled = [line for line in lines if line.endswith('|#path:/a')]
+        self.assertEqual(len(sampled), 10)
+        self.assertTrue(all('|ms|@0.01|#' in line for line in sampled))
+        self.assertIn('latency:500|ms|#path:/b', lines)
+
+        # without tags
+        statsd = self.exporter(max_timings=1, tags=False)
+        statsd.timing('latency', 0.25, (('method', 'GET'),))
+        statsd.timing('latency', 0.25, (('method', 'GET'),))
+        statsd.flush()
+
+        self.assertEqual(self.receive(1), ['latency.GET:250|ms|@0.5'])
+
+    def test_background_flush(self):
+        statsd = self.exporter(flush_interval=0.05)
+
+        statsd.increment('requests')
+
+        self.assertEqual(self.receive(1), ['requests:1|c'])
+
+        statsd.stop()
+
+
+class StatsdMetricsTest(StatsdTestMixin, BaseTestCase):
+    def test_default_and_decorator_metrics(self):
+        statsd = self.exporter()
+        metrics = self.metrics(registry=CollectorRegistry(auto_describe=True), statsd=statsd)
+
+        @self.app.route('/test')
+        @metrics.counter('invocations', 'Number of invocations', labels={
+            'status': lambda r: r.status_code
+        })
+        @metrics.histogram('latency_seconds', 'Latency')
+        def test():
+            return 'OK'
+
+        for _ in range(5):
+            self.client.get('/test')
+
+        statsd.flush()
+        lines = self.receive(1)[0].split('\n')
+
+        self.assertIn('flask_http_request_total:5|c|#method:GET,path:/test,status:200', lines)
+        self.assertIn('invocations:5|c|#status:200', lines)
+        self.assertEqual(
+            len([line for line in lines if line.startswith('latency_seconds:')]), 5
+        )
+        self.assertEqual(
+            len([line for line in lines if line.startswith('flask_http_request_duration:')]), 5
+        )
@@ -0,0 +1,204 @@
+import os
+import sys
+import types
+
+from flask import Flask
+from prometheus_client import CollectorRegistry, Counter, Gauge, generate_latest
+
+from unittest_helper import BaseTestCase
+from prometheus_flask_exporter.multiprocess import UWsgiPrometheusMetrics, UWsgiMetricsAggregator
+
+
+class UWsgiStub(types.ModuleType):
+    def __init__(self):
+        super(UWsgiStub, self).__init__('uwsgi')
+        self.messages = []
+        self.fail_after = None
+
+    def masterpid(self):
+        return os.getpid()
+
+    def mule_msg(self, message, mule=None):
+        if self.fail_after is not None and len(self.messages) >= self.fail_after:
+            raise IOError('unable to send the message to the mule')
+
+        self.messages.append(message)
+
+    def mule_get_msg(self):
+        return self.messages.pop(0)
+
+
+class UWsgiAggregationTest(BaseTestCase):
+    def setUp(self):
+        super(UWsgiAggregationTest, self).setUp()
+
+        self.uwsgi = UWsgiStub()
+        sys.modules['uwsgi'] = self.uwsgi
+
+        self.aggregator = UWsgiMetricsAggregator()
+        self.aggregated = CollectorRegistry()
+        self.aggregated.register(self.aggregator)
+
+    def tearDown(self):
+        del sys.modules['uwsgi']
+
+    def deliver(self):
+        while self.uwsgi.messages:
+            self.aggregator.receive(self.uwsgi.mule_get_msg())
+
+    def sample(self, name, **labels):
+        return self.aggregated.get_sample_value(name, labels)
+
+    def test_aggregate_from_workers(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, group_by='endpoint', registry=CollectorRegistry()
+        )
+
+        @self.app.route('/test')
+        def test():
+            return 'OK'
+
+        self.client.get('/test')
+        self.client.get('/test')
+
+        metrics.flush()
+        self.deliver()
+
+        self.assertEqual(self.sample(
+            'flask_http_request_total', method='GET', endpoint='test',
+            hostname=os.getenv('HOSTNAME', 'bayesian-api'), status='200'
+        ), 2.0)
+
+        # nothing changed, nothing to send
+        metrics.flush()
+        self.assertEqual(len(self.uwsgi.messages), 0)
+
+        # a second worker with its own registry
+        other_app = Flask(__name__)
+        other = UWsgiPrometheusMetrics(
+            other_app, aggregate=True, group_by='endpoint', registry=CollectorRegistry()
+        )
+
+        @other_app.route('/test', endpoint='test')
+        def other_test():
+            return 'OK'
+
+        other_app.test_client().get('/test')
+        self.client.get('/test')
+
+        metrics.flush()
+        other.flush()
+        self.deliver()
+
+        self.assertEqual(self.sample(
+            'flask_http_request_total', method='GET', endpoint='test',
+            hostname=os.getenv('HOSTNAME', 'bayesian-api'), status='200'
+        ), 4.0)
+        self.assertEqual(self.sample(
+            'flask_http_request_duration_seconds_count', method='GET', endpoint='test',
+            pid=str(os.getpid()), hostname=os.getenv('HOSTNAME', 'bayesian-api'), status='200'
+        ), 4.0)
+
+    def test_gauges_removed_on_exit(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, export_defaults=False, registry=CollectorRegistry()
+        )
+
+        metrics.info('worker_info', 'Worker info', version='1')
+        metrics.flush()
+        self.deliver()
+
+        self.assertEqual(self.sample('worker_info', version='1', pid=str(os.getpid())), 1.0)
+
+        self.uwsgi.atexit()
+        self.deliver()
+
+        self.assertIsNone(self.sample('worker_info', version='1', pid=str(os.getpid())))
+
+    def test_gauges_changed_before_exit(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, export_defaults=False, registry=CollectorRegistry()
+        )
+
+        info = metrics.info('worker_info', 'Worker info')
+        metrics.flush()
+        self.deliver()
+
+        self.assertEqual(self.sample('worker_info', pid=str(os.getpid())), 1.0)
+
+        # sent with the exit message
+        info.set(2)
+        self.uwsgi.atexit()
+        self.deliver()
+
+        self.assertIsNone(self.sample('worker_info', pid=str(os.getpid())))
+
+    def test_message_size_limit(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, export_defaults=False, registry=CollectorRegistry()
+        )
+        metrics._pusher.max_message_size = 512
+
+        for idx in range(20):
+            metrics.info('info_%d' % idx, 'Info number %d' % idx)
+
+        metrics.flush()
+
+        self.assertGreater(len(self.uwsgi.messages), 1)
+        for message in self.uwsgi.messages:
+            self.assertLess(len(message), 1024)
+
+        self.deliver()
+
+        output = generate_latest(self.aggregated).decode('utf-8')
+        for idx in range(20):
+            self.assertIn('info_%d{pid="%d"} 1.0' % (idx, os.getpid()), output)
+
+    def test_large_family_split(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, export_defaults=False, registry=CollectorRegistry()
+        )
+        metrics._pusher.max_message_size = 512
+
+        gauge = Gauge('items', 'Items', ('item',), registry=metrics.registry)
+        for idx in range(1, 100):
+            gauge.labels(str(idx)).set(idx)
+
+        metrics.flush()
+
+        self.assertGreater(len(self.uwsgi.messages), 5)
+        for message in self.uwsgi.messages:
+            self.assertLessEqual(len(message), 512 + 64)
+
+        self.deliver()
+
+        for idx in range(1, 100):
+            self.assertEqual(self.sample('items', item=str(idx), pid=str(os.getpid())), idx)
+
+    def test_failed_send(self):
+        metrics = UWsgiPrometheusMetrics(
+            self.app, aggregate=True, export_defaults=False, registry=CollectorRegistry()
+        )
+        metrics._pusher.max_message_size = 512
+
+        counter = Counter('items', 'Items', ('item',), registry=metrics.registry)
+        for idx in range(1, 100):
+            counter.labels(str(idx)).inc(idx)
+
+        # only the first two messages reach the mule
+        self.uwsgi.fail_after = 2
+        self.assertRaises(IOError, metrics.flush)
+        self.assertEqual(len(self.uwsgi.messages), 2)
+
+        self.uwsgi.fail_after = None
+        counter.labels('1').inc()
+        metrics.flush()
+        self.deliver()
+
+        self.assertEqual(self.sample('items_total', item='1'), 2.0)
+        for idx in range(2, 100):
+            self.assertEqual(self.sample('items_total', item=str(idx)), idx)
+
+        # nothing left to send
+        metrics.flush()
+        self.assertEqual(len(self.uwsgi.messages), 0)